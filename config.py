@@ -25,6 +25,38 @@ UI_CONFIG: Dict[str, Any] = {
 
     # --- 下載邏輯參數 ---
     "max_concurrent": 3,  # 同時下載的最大任務數 (Queue Manager 使用)
+    "per_host_limit": 16,  # 同一主機 (CDN) 的同時請求上限，所有任務與引擎共用 (async 引擎也受此限)；0 = 不限制
+    # 頻寬上限 (MB/s，0 = 不限速)：全域上限可在主視窗即時調整；單一任務上限套用到新加入的任務
+    "global_rate_limit_mbps": 0,
+    "task_rate_limit_mbps": 0,
+    # 所有任務在記憶體中暫存媒體資料的總上限 (MB，0 = 不限制)；用完時抓取端會等待，大型回應改為分塊寫到磁碟
+    "memory_budget_mb": 512,
+
+    # --- 原生 HLS 引擎 ---
+    # 畫質策略: "max_bandwidth" (最高位元率) / "resolution_cap" (不超過 max_height) / "throughput" (依實測頻寬)
+    "variant_policy": "max_bandwidth",
+    "max_height": 1080,
+    # 邊下載邊把片段餵給 ffmpeg (pipe:0)，最後一片到齊後幾秒內即完成 MP4；失敗時自動退回批次轉檔
+    "pipe_remux": True,
+    # 片段抓取模型: "threads" (執行緒池) / "async" (asyncio，數百個同時請求) / "auto" (片段數 >= 2000 才用 async)
+    "hls_engine": "auto",
+    # 對沖請求：片段超過近期 p95 延遲仍未完成時再送一個請求，取先完成者 (約 5% 額外請求上限)
+    "hedge_requests": True,
+    # 傳輸速率低於此值 (KB/s，每 5 秒檢查一次) 的連線直接中止重抓；0 = 不檢查
+    "stall_min_kbps": 32,
+    # 備援 CDN：{"主機": ["備援主機", ...]}，對沖請求會輪流改打備援主機 (路徑與參數不變)
+    "cdn_mirrors": {},
+
+    # --- 瀏覽器擷取 (Pressplay) ---
+    # 混合模式：取得播放清單與金鑰後，其餘片段帶著頁面 Cookie 以 HTTP 直連平行抓取，失敗的才回頭靠播放擷取
+    "browser_hybrid": True,
+    # 常駐瀏覽器池：Chromium 只啟動一次，任務以新分頁 / context 附掛；借出 N 次或超過記憶體上限 (MB) 時回收重啟，佇列閒置時關閉
+    "browser_pool": True,
+    "browser_pool_max_uses": 20,
+    "browser_pool_memory_mb": 1500,
+
+    # --- 單檔多連線下載 (嗅探到直接 mp4 時使用) ---
+    "range_connections": 8,
     
     # --- 預留格式選項 (未來可擴充下拉選單) ---
     "formats": [
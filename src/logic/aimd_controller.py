@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# src/logic/aimd_controller.py
+# [VibeCoding] Adaptive Concurrency: AIMD 回饋控制 (取代固定 8 線程 / 3 線程檔位)
+
+import time
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+THROTTLE_STATUS = (403, 429)
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """Retry-After 可能是秒數或 HTTP 日期，統一換算成秒"""
+    if not value: return None
+    value = str(value).strip()
+    if value.isdigit(): return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+class AIMDController:
+    """
+    加法增 / 乘法減 (Additive Increase, Multiplicative Decrease) 併發控制器
+    - 每完成「目前併發數」個成功請求 (約一個 RTT)，併發 +increase_step
+    - 遇到 403/429/5xx/逾時，或延遲明顯惡化，併發 *decrease_factor
+    - Retry-After 會讓所有 acquire() 暫停到指定時間
+    """
+    def __init__(self, initial: int = 4, min_limit: int = 1, max_limit: int = 32,
+                 increase_step: int = 1, decrease_factor: float = 0.5,
+                 latency_tolerance: float = 2.5):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+
+        self._cond = threading.Condition()
+        self._limit = float(max(min_limit, min(initial, max_limit)))
+        self._in_flight = 0
+        self._pause_until = 0.0
+        self._successes_since_change = 0
+        self._last_decrease = 0.0
+
+        # 觀測值
+        self._ewma_latency = None
+        self._base_latency = None
+        self._error_streak = 0
+        self._samples = deque(maxlen=200)   # (完成時間, 位元組, 是否成功)
+        self._latencies = deque(maxlen=200) # 近期成功請求的延遲 (對沖請求的 p95 門檻)
+        self.total_requests = 0
+        self.total_errors = 0
+        self.peak_limit = int(self._limit)
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    # --- 併發閘門 ---
+    def acquire(self, should_stop: Optional[Callable[[], bool]] = None) -> bool:
+        with self._cond:
+            while True:
+                if should_stop and should_stop(): return False
+                wait = self._pause_until - time.time()
+                if wait <= 0 and self._in_flight < self.limit:
+                    self._in_flight += 1
+                    return True
+                self._cond.wait(timeout=min(max(wait, 0.05), 0.5))
+
+    def try_acquire(self):
+        """不阻塞的 acquire (給 asyncio 引擎用)：回傳 (是否取得名額, 建議等待秒數)"""
+        with self._cond:
+            wait = self._pause_until - time.time()
+            if wait <= 0 and self._in_flight < self.limit:
+                self._in_flight += 1
+                return True, 0.0
+            return False, min(max(wait, 0.05), 0.5)
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    # --- 回饋 ---
+    def record(self, latency: float, status: Optional[int], nbytes: int = 0, retry_after=None):
+        now = time.time()
+        ok = status is not None and 200 <= status < 300
+        with self._cond:
+            self.total_requests += 1
+            self._samples.append((now, nbytes, ok))
+
+            delay = parse_retry_after(retry_after)
+            if delay:
+                self._pause_until = max(self._pause_until, now + delay)
+
+            if ok:
+                self._error_streak = 0
+                self._latencies.append(latency)
+                self._ewma_latency = latency if self._ewma_latency is None else self._ewma_latency * 0.8 + latency * 0.2
+                if self._base_latency is None or self._ewma_latency < self._base_latency:
+                    self._base_latency = self._ewma_latency
+
+                if (len(self._samples) >= 10 and self._base_latency
+                        and self._ewma_latency > self._base_latency * self.latency_tolerance):
+                    self._decrease(now)
+                else:
+                    self._successes_since_change += 1
+                    if self._successes_since_change >= self.limit:
+                        self._limit = min(self.max_limit, self._limit + self.increase_step)
+                        self.peak_limit = max(self.peak_limit, self.limit)
+                        self._successes_since_change = 0
+            else:
+                self.total_errors += 1
+                self._error_streak += 1
+                if status is None or status in THROTTLE_STATUS or status >= 500:
+                    self._decrease(now)
+            self._cond.notify_all()
+
+    def latency_quantile(self, q: float, min_samples: int = 20) -> Optional[float]:
+        """近期成功請求延遲的分位數；樣本不足時回傳 None"""
+        with self._cond:
+            if len(self._latencies) < min_samples: return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def _decrease(self, now: float):
+        # 同一批在途請求的連續失敗只算一次，避免瞬間砍到底
+        if now - self._last_decrease < max(self._ewma_latency or 0.0, 1.0): return
+        self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+        self._successes_since_change = 0
+        self._last_decrease = now
+
+    def cooldown(self) -> float:
+        """兩輪之間建議休息秒數：優先遵守 Retry-After，其次依連續錯誤次數指數退避"""
+        with self._cond:
+            remaining = self._pause_until - time.time()
+            if remaining > 0: return remaining
+            if self._error_streak == 0: return 0.0
+            return min(2 ** min(self._error_streak, 6), 60)
+
+    def summary(self) -> Dict[str, float]:
+        """回報收斂後的併發數與近期速率 (供不同主機比較)"""
+        with self._cond:
+            samples = list(self._samples)
+            span = (samples[-1][0] - samples[0][0]) if len(samples) > 1 else 0.0
+            ok = [s for s in samples if s[2]]
+            return {
+                "limit": self.limit,
+                "peak_limit": self.peak_limit,
+                "req_per_sec": (len(ok) / span) if span > 0 else 0.0,
+                "bytes_per_sec": (sum(s[1] for s in ok) / span) if span > 0 else 0.0,
+                "latency": self._ewma_latency or 0.0,
+                "error_rate": (self.total_errors / self.total_requests) if self.total_requests else 0.0,
+            }
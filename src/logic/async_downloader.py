@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+# src/logic/async_downloader.py
+# [VibeCoding] Async Engine: 單一 asyncio 事件迴圈 + 非同步 HTTP 用戶端 (超大型播放清單用)
+
+import asyncio
+import functools
+import time
+from typing import Dict, Optional
+from src.logic.native_downloader import NativeHLSDownloader, STALL_READ_TIMEOUT
+from src.logic.byte_ranges import RangeGroup, coalesce_ranges
+from src.logic.decrypt_pool import GLOBAL_DECRYPT_POOL
+from src.logic.bandwidth_limiter import GLOBAL_BANDWIDTH
+from src.logic.host_limiter import GLOBAL_HOST_LIMITER, host_of
+from src.logic.segment_validator import check_response
+from src.logic.memory_budget import GLOBAL_MEMORY_BUDGET, READ_CHUNK_BYTES, RateFloor, content_length
+
+# 非同步用戶端：curl_cffi (瀏覽器指紋，與同步引擎一致) 優先，其次 aiohttp
+try:
+    from curl_cffi.requests import AsyncSession
+    HAS_CURL_CFFI_ASYNC = True
+except ImportError:
+    HAS_CURL_CFFI_ASYNC = False
+
+try:
+    import aiohttp
+    HAS_AIOHTTP = True
+except ImportError:
+    HAS_AIOHTTP = False
+
+
+class _AsyncHttp:
+    """
+    把 curl_cffi.AsyncSession / aiohttp 包成同一個 get() 介面：回傳 (status, body, headers, reserved)
+    收到標頭後依 Content-Length 取得記憶體預算才讀取 body；非成功狀態碼的 body 不讀取
+    timeout 只限制連線建立，讀取階段改由 STALL_READ_TIMEOUT 與速率下限 (min_rate) 判斷是否卡住
+    """
+    def __init__(self, kind: str, headers: Dict, cookies: Dict, max_connections: int):
+        self.kind = kind
+        self.headers = headers
+        self.cookies = cookies
+        self.max_connections = max_connections
+        self._session = None
+
+    async def __aenter__(self):
+        if self.kind == "curl_cffi":
+            self._session = AsyncSession(impersonate="chrome120", headers=self.headers, cookies=self.cookies,
+                                         max_clients=self.max_connections)
+        else:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(headers=self.headers, cookies=self.cookies, connector=connector)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._session.close()
+
+    async def get(self, url: str, headers: Optional[Dict] = None, timeout: float = 30,
+                  ok_statuses=(200,), should_stop=lambda: False, min_rate: float = 0, throttle=None):
+        if self.kind == "curl_cffi":
+            r = await self._session.get(url, headers=headers, timeout=(timeout, STALL_READ_TIMEOUT), stream=True)
+            try:
+                if r.status_code not in ok_statuses: return r.status_code, None, r.headers, 0
+                reserved = content_length(r.headers) or READ_CHUNK_BYTES
+                if not await GLOBAL_MEMORY_BUDGET.acquire_async(reserved, should_stop): return r.status_code, None, r.headers, 0
+                body = await self._read(r.aiter_content(), reserved, min_rate, throttle)
+                return r.status_code, body, r.headers, self._settle(reserved, len(body))
+            finally:
+                await r.aclose()
+        client_timeout = aiohttp.ClientTimeout(sock_connect=timeout, sock_read=STALL_READ_TIMEOUT)
+        async with self._session.get(url, headers=headers, timeout=client_timeout) as r:
+            if r.status not in ok_statuses: return r.status, None, r.headers, 0
+            reserved = r.content_length or READ_CHUNK_BYTES
+            if not await GLOBAL_MEMORY_BUDGET.acquire_async(reserved, should_stop): return r.status, None, r.headers, 0
+            body = await self._read(r.content.iter_chunked(READ_CHUNK_BYTES), reserved, min_rate, throttle)
+            return r.status, body, r.headers, self._settle(reserved, len(body))
+
+    @staticmethod
+    async def _read(chunks, reserved: int, min_rate: float, throttle=None) -> bytes:
+        """逐塊讀取並檢查速率下限；throttle(nbytes) 為每塊的限速等待 (不計入速率下限)；失敗或被取消時歸還已取得的預算"""
+        floor = RateFloor(min_rate)
+        parts = []
+        try:
+            async for chunk in chunks:
+                floor.feed(len(chunk))
+                parts.append(chunk)
+                if throttle is not None:
+                    start = time.monotonic()
+                    await throttle(len(chunk))
+                    floor.skip(time.monotonic() - start)
+        except BaseException:
+            GLOBAL_MEMORY_BUDGET.release(reserved)
+            raise
+        return b"".join(parts)
+
+    @staticmethod
+    def _settle(reserved: int, size: int) -> int:
+        """實際大小與預估不同時補登 / 歸還差額，回傳最終登記的位元組數"""
+        if size > reserved: GLOBAL_MEMORY_BUDGET.charge(size - reserved)
+        else: GLOBAL_MEMORY_BUDGET.release(reserved - size)
+        return size
+
+
+class _AsyncGate:
+    """把 AIMD 控制器的併發名額轉成可 await 的閘門 (不阻塞事件迴圈)"""
+    def __init__(self, controller):
+        self.controller = controller
+        self._cond = asyncio.Condition()
+
+    async def acquire(self, should_stop) -> bool:
+        while True:
+            if should_stop(): return False
+            ok, wait = self.controller.try_acquire()
+            if ok: return True
+            async with self._cond:
+                try:
+                    await asyncio.wait_for(self._cond.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self):
+        self.controller.release()
+        async with self._cond:
+            self._cond.notify_all()
+
+
+class AsyncHLSDownloader(NativeHLSDownloader):
+    """
+    與 NativeHLSDownloader 相同的 download() 介面，只把片段抓取換成 asyncio
+    - 每輪只建立固定數量的 worker 協程從佇列取任務，不再為每個片段建立 future / 執行緒
+    - 併發仍由 AIMD 控制器決定，上限提高到 max_in_flight
+    - 片段數少於 async_threshold，或沒有可用的非同步用戶端時，退回父類別的執行緒池
+    """
+    def __init__(self, logger=None, max_in_flight: int = 256, async_threshold: int = 0, **kwargs):
+        super().__init__(logger, **kwargs)
+        self.max_in_flight = max_in_flight
+        self.async_threshold = async_threshold
+
+    @staticmethod
+    def _client_kind() -> Optional[str]:
+        if HAS_CURL_CFFI_ASYNC: return "curl_cffi"
+        if HAS_AIOHTTP: return "aiohttp"
+        return None
+
+    @staticmethod
+    def _session_cookies(session) -> Dict[str, str]:
+        if isinstance(session.cookies, dict): return dict(session.cookies)
+        try:
+            return {c.name: c.value for c in session.cookies.jar} if hasattr(session.cookies, "jar") \
+                else {c.name: c.value for c in session.cookies}
+        except Exception:
+            return {}
+
+    def _run_rounds(self, session, all_tasks, writer, tracker, controller, label, progress_callback):
+        kind = self._client_kind()
+        if kind is None or len(all_tasks) < self.async_threshold:
+            if kind is None:
+                self.logger.warning("[Async] 未安裝 curl_cffi / aiohttp，改用執行緒引擎")
+            return super()._run_rounds(session, all_tasks, writer, tracker, controller, label, progress_callback)
+
+        # 控制器上限放寬到 max_in_flight，並加快加法增量，讓大量片段能更快爬升到高併發
+        controller.max_limit = self.max_in_flight
+        controller.increase_step = max(controller.increase_step, self.max_in_flight // 32)
+        self.logger.info(f"[Async] ⚙️ {label}使用 asyncio 引擎 ({kind}) | 同時請求上限 {self.max_in_flight}")
+        asyncio.run(self._run_rounds_async(kind, session, all_tasks, writer, tracker, controller, label, progress_callback))
+
+    async def _run_rounds_async(self, kind, session, all_tasks, writer, tracker, controller, label, progress_callback):
+        total_segs = len(all_tasks)
+        headers = dict(session.headers)
+        cookies = self._session_cookies(session)
+        round_idx = 0
+        consecutive_no_progress = 0
+        gate = _AsyncGate(controller)
+        progress = {"last": 0.0, "round": 0}
+
+        async with _AsyncHttp(kind, headers, cookies, self.max_in_flight) as http:
+            while not self.is_cancelled:
+                round_idx += 1
+                pending = [t for t in all_tasks if not writer.is_done(t[1])]
+                if not pending:
+                    self.logger.info(f"[Native] {label}所有片段下載完成！")
+                    break
+
+                if round_idx > 1:
+                    cooldown = controller.cooldown()
+                    self.logger.warning(f"[Native] 🛡️ R{round_idx-1} 有殘留 ({len(pending)}個)，併發降至 {controller.limit}，休息 {cooldown:.1f} 秒...")
+                    await self._async_sleep(cooldown)
+                    if self.is_cancelled: break
+
+                timeout = 15 if round_idx == 1 else 30
+                self.logger.info(f"[Async] 第 {round_idx} 輪 | 併發上限: {controller.limit} | 剩餘: {len(pending)}")
+
+                done_before = writer.done_count
+                groups = coalesce_ranges(
+                    [(t[0], t[5][0], t[5][1], t) for t in pending if t[5]], self.range_group_bytes
+                )
+                queue = asyncio.Queue()
+                for unit in [t for t in pending if not t[5]] + groups:
+                    queue.put_nowait(unit)
+
+                progress["round"] = round_idx
+                workers = [
+                    asyncio.ensure_future(self._worker(http, queue, gate, controller, timeout, writer, tracker,
+                                                       total_segs, progress, progress_callback))
+                    for _ in range(min(self.max_in_flight, queue.qsize()))
+                ]
+                watcher = asyncio.ensure_future(self._cancel_watcher(workers))
+                await asyncio.gather(*workers, return_exceptions=True)
+                watcher.cancel()
+
+                # 等解密池把本輪片段處理完 (不阻塞事件迴圈)
+                while not self.is_cancelled and not tracker.wait(timeout=0):
+                    await asyncio.sleep(0.1)
+
+                if writer.done_count > done_before:
+                    consecutive_no_progress = 0
+                else:
+                    consecutive_no_progress += 1
+                if consecutive_no_progress >= 5:
+                    self.logger.error("[Native] IP 可能已被永久封鎖，停止任務。")
+                    break
+
+    async def _worker(self, http, queue, gate, controller, timeout, writer, tracker, total_segs, progress, progress_callback):
+        while not self.is_cancelled:
+            try:
+                unit = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await self._fetch_unit(http, unit, gate, controller, timeout, writer, tracker)
+
+            now = time.time()
+            if progress_callback and now - progress["last"] >= 0.5:
+                progress["last"] = now
+                done = writer.done_count
+                progress_callback(done / total_segs * 99,
+                                  f"⚡x{controller.limit} {done}/{total_segs} (R{progress['round']}·async)")
+
+    async def _fetch_unit(self, http, unit, gate, controller, timeout, writer, tracker) -> bool:
+        """單一任務或 BYTERANGE 合併群組：取得名額 -> 下載 -> 交給解密池"""
+        is_group = isinstance(unit, RangeGroup)
+        url = unit.url if is_group else unit[0]
+        req_headers = {"Range": f"bytes={unit.start}-{unit.end}"} if is_group else None
+
+        if not await gate.acquire(lambda: self.is_cancelled): return False
+        # 跨任務的同主機上限 (與執行緒引擎共用同一份預算)
+        host = host_of(url)
+        while not GLOBAL_HOST_LIMITER.try_acquire(host):
+            if self.is_cancelled:
+                await gate.release()
+                return False
+            await asyncio.sleep(0.02)
+        try:
+            status, body, resp_headers, reserved = await self._hedged_get(
+                http, url, req_headers, timeout, (200, 206) if is_group else (200,), controller
+            )
+            if body is None: return False
+            reason = check_response(status, resp_headers, body)
+            if reason:
+                GLOBAL_MEMORY_BUDGET.release(reserved)
+                for task in ([m[0] for m in unit.members] if is_group else [unit]):
+                    tracker.record_invalid(task[1], reason)
+                return False
+        finally:
+            GLOBAL_HOST_LIMITER.release(host)
+            await gate.release()
+
+        # 解密池滿了就先讓出事件迴圈 (不佔執行緒空等)
+        try:
+            while GLOBAL_DECRYPT_POOL.saturated() and not self.is_cancelled:
+                await asyncio.sleep(0.02)
+        except asyncio.CancelledError:
+            # 使用者停止：body 不會再交給解密池，直接歸還預算
+            GLOBAL_MEMORY_BUDGET.release(reserved)
+            raise
+        # submit() 在佇列滿時會阻塞，群組切段還會等記憶體預算 / 讀磁碟：一律丟到執行緒，事件迴圈不被卡住
+        # 交出去之後預算由 submit / _submit_range_body 負責歸還；shield 讓取消時這段仍會做完，不會漏掉預算
+        if is_group:
+            job = functools.partial(self._submit_range_body, unit, status, resp_headers, body, writer, tracker, reserved)
+        else:
+            job = functools.partial(self._submit_single, unit, body, writer, tracker, reserved)
+        return await asyncio.shield(asyncio.get_running_loop().run_in_executor(None, job))
+
+    @staticmethod
+    def _submit_single(unit, body, writer, tracker, reserved: int) -> bool:
+        GLOBAL_DECRYPT_POOL.submit(tracker, unit[1], body, unit[2], unit[3], unit[4], writer, reserved)
+        return True
+
+    async def _timed_get(self, http, url, req_headers, timeout, ok_statuses, controller):
+        """單次請求並記錄到控制器；被取消 (對沖輸家 / 使用者停止) 時不記錄"""
+        start = time.time()
+        try:
+            status, body, resp_headers, reserved = await http.get(
+                url, req_headers, timeout, ok_statuses, lambda: self.is_cancelled, self.stall_min_rate, self._throttle
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.debug(f"[Async] 請求失敗 ({url}): {e}")
+            controller.record(time.time() - start, None)
+            return None, None, {}, 0
+        controller.record(time.time() - start, status, len(body) if body is not None else 0,
+                          resp_headers.get("Retry-After"))
+        return status, body, resp_headers, reserved
+
+    async def _hedged_get(self, http, url, req_headers, timeout, ok_statuses, controller):
+        """
+        [Hedging] 與執行緒引擎相同的策略：超過 p95 延遲仍未完成就再送一個對沖請求 (可改打備援主機)
+        取先成功者，另一個直接取消 (取消時會歸還記憶體預算)
+        """
+        primary = asyncio.ensure_future(self._timed_get(http, url, req_headers, timeout, ok_statuses, controller))
+        racers = [primary]
+        delay = self.hedge.delay(controller)
+        try:
+            if delay is None: return await primary
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done: return primary.result()
+
+            hedge_url = self.hedge.alternate_url(url)
+            hedge_host = host_of(hedge_url)
+            if self.is_cancelled or not self.hedge.try_start(controller) or not GLOBAL_HOST_LIMITER.try_acquire(hedge_host):
+                return await primary
+            hedge = asyncio.ensure_future(self._timed_get(http, hedge_url, req_headers, timeout, ok_statuses, controller))
+            hedge.add_done_callback(lambda _: GLOBAL_HOST_LIMITER.release(hedge_host))
+            racers.append(hedge)
+
+            pending = {primary, hedge}
+            winner, fallback = None, None
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    if result[1] is None:
+                        fallback = fallback or result
+                    elif winner is None:
+                        winner = result
+                        if future is hedge: self.hedge.record_win()
+                    else:
+                        GLOBAL_MEMORY_BUDGET.release(result[3])   # 兩邊同時完成：多的那份直接丟掉
+            for future in pending: future.cancel()
+            return winner or fallback
+        except asyncio.CancelledError:
+            for future in racers: future.cancel()
+            raise
+
+    async def _cancel_watcher(self, workers):
+        """使用者停止時直接取消所有 worker (包含等待中的請求)"""
+        while not self.is_cancelled:
+            await asyncio.sleep(0.2)
+        for w in workers: w.cancel()
+
+    async def _throttle(self, nbytes: int):
+        """[限速] 每個區塊讀入後扣全域 / 任務額度，佔著併發名額等待"""
+        wait = GLOBAL_BANDWIDTH.reserve(nbytes, self.task_id)
+        if wait > 0: await self._async_sleep(wait)
+
+    async def _async_sleep(self, seconds: float):
+        end = time.time() + seconds
+        while not self.is_cancelled and time.time() < end:
+            await asyncio.sleep(min(0.2, end - time.time()))
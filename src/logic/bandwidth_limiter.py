@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+# src/logic/bandwidth_limiter.py
+# [VibeCoding] Bandwidth Limiter: 全域 Token Bucket + 單一任務上限，可在執行中即時調整 (含 yt-dlp ratelimit)
+
+import time
+import threading
+from typing import Callable, Dict, Optional
+
+
+class TokenBucket:
+    """
+    以「欠債」方式運作的 Token Bucket：reserve() 立即扣款並回傳需要等待的秒數
+    rate <= 0 代表不限速；burst 預設為 1 秒的量
+    """
+    def __init__(self, rate: float = 0, burst: Optional[float] = None):
+        self._lock = threading.Lock()
+        self.rate = 0.0
+        self.burst = 0.0
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate: float, burst: Optional[float] = None):
+        with self._lock:
+            self.rate = max(0.0, float(rate or 0))
+            self.burst = float(burst) if burst else self.rate
+            # 調整速率時清掉累積的債務，讓新速率立即生效
+            self._tokens = min(max(self._tokens, 0.0), self.burst)
+            self._last = time.monotonic()
+
+    def reserve(self, nbytes: int) -> float:
+        with self._lock:
+            if self.rate <= 0: return 0.0
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= nbytes
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+
+class BandwidthLimiter:
+    """
+    全域頻寬管理
+    - 所有引擎 (Native / Async / Ranged / Browser) 每收到一批位元組就呼叫 throttle()，同時扣全域與該任務的額度
+    - yt-dlp 自己控制下載迴圈，改為把 ratelimit 寫進 ydl.params (yt-dlp 每個區塊都會重新讀取)，
+      其值 = min(任務上限, 全域上限 / 進行中任務數)，任務數或上限變動時即時重算
+    - 速率調整後，正在等待中的請求最多 0.5 秒內就會依新速率放行
+    """
+    def __init__(self, global_rate: float = 0):
+        self._lock = threading.Lock()
+        self.global_bucket = TokenBucket(global_rate)
+        self._task_buckets: Dict[str, TokenBucket] = {}
+        self._ytdlp_params: Dict[str, dict] = {}
+        self._version = 0
+
+    # --- 設定 ---
+    def set_global_rate(self, rate: float):
+        self.global_bucket.set_rate(rate)
+        self._bump()
+
+    def set_task_rate(self, task_id: str, rate: float):
+        with self._lock:
+            bucket = self._task_buckets.get(task_id)
+        if bucket is None: return
+        bucket.set_rate(rate)
+        self._bump()
+
+    def register_task(self, task_id: str, rate: float = 0):
+        with self._lock:
+            self._task_buckets[task_id] = TokenBucket(rate)
+        self._bump()
+
+    def unregister_task(self, task_id: str):
+        with self._lock:
+            self._task_buckets.pop(task_id, None)
+            self._ytdlp_params.pop(task_id, None)
+        self._bump()
+
+    def _bump(self):
+        with self._lock:
+            self._version += 1
+        self._refresh_ytdlp()
+
+    # --- 引擎端 ---
+    def reserve(self, nbytes: int, task_id: Optional[str] = None) -> float:
+        """扣款並回傳需要等待的秒數 (asyncio 引擎自行 await)"""
+        wait = self.global_bucket.reserve(nbytes)
+        with self._lock:
+            bucket = self._task_buckets.get(task_id) if task_id else None
+        if bucket is not None:
+            wait = max(wait, bucket.reserve(nbytes))
+        return wait
+
+    def throttle(self, nbytes: int, task_id: Optional[str] = None, sleep: Callable[[float], None] = time.sleep,
+                 should_stop: Optional[Callable[[], bool]] = None):
+        """
+        同步引擎用：扣款後睡到額度恢復；sleep 可傳入引擎可被取消的 _sleep
+        分段等待，速率被調整或任務被取消時提早放行
+        """
+        wait = self.reserve(nbytes, task_id)
+        if wait <= 0: return
+        version = self._version
+        end = time.monotonic() + wait
+        while True:
+            remaining = end - time.monotonic()
+            if remaining <= 0 or self._version != version: return
+            if should_stop and should_stop(): return
+            sleep(min(remaining, 0.5))
+
+    # --- yt-dlp ---
+    def ytdlp_rate(self, task_id: Optional[str]) -> Optional[int]:
+        """yt-dlp 的 ratelimit (bytes/s)；None 代表不限速"""
+        with self._lock:
+            active = max(1, len(self._task_buckets))
+            bucket = self._task_buckets.get(task_id) if task_id else None
+        limits = []
+        if self.global_bucket.rate > 0: limits.append(self.global_bucket.rate / active)
+        if bucket is not None and bucket.rate > 0: limits.append(bucket.rate)
+        return int(min(limits)) if limits else None
+
+    def attach_ytdlp(self, task_id: str, params: dict):
+        """登記 YoutubeDL.params，之後速率變動時直接改寫其中的 ratelimit"""
+        with self._lock:
+            self._ytdlp_params[task_id] = params
+        params["ratelimit"] = self.ytdlp_rate(task_id)
+
+    def detach_ytdlp(self, task_id: str):
+        with self._lock:
+            self._ytdlp_params.pop(task_id, None)
+
+    def _refresh_ytdlp(self):
+        with self._lock:
+            attached = list(self._ytdlp_params.items())
+        for task_id, params in attached:
+            params["ratelimit"] = self.ytdlp_rate(task_id)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {"global_rate": self.global_bucket.rate, "tasks": len(self._task_buckets)}
+
+
+# 全域共用實例 (所有任務共用)
+GLOBAL_BANDWIDTH = BandwidthLimiter()
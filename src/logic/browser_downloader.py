@@ -3,14 +3,19 @@
 # [VibeCoding] Phase 10: The Clone (Header Cloning + curl_cffi)
 
 import os
-import time
 import json
-import base64
 import logging
 import m3u8
 import shutil
 import re
 from typing import Callable, Optional
+from src.logic.key_store import GLOBAL_KEY_STORE, fetch_key, segment_key_plan
+from src.logic.ts_sanitizer import sanitize
+from src.logic.segment_validator import CONTAINER_AUTO, check_response, check_payload, playlist_container, resolve_container, strip_pkcs7
+from src.logic.memory_budget import GLOBAL_MEMORY_BUDGET, read_body
+from src.logic.bandwidth_limiter import GLOBAL_BANDWIDTH
+from src.logic.cancel_token import CancelToken
+from src.logic.browser_pool import GLOBAL_BROWSER_POOL
 
 # Selenium
 from selenium import webdriver
@@ -32,10 +37,30 @@ except ImportError:
     HAS_CRYPTO = False
 
 class BrowserDownloader:
-    def __init__(self, logger=None):
+    def __init__(self, logger=None, task_id: Optional[str] = None, cancel_token: Optional[CancelToken] = None):
         self.logger = logger or logging.getLogger("BrowserBridge")
+        self.task_id = task_id
         self.driver = None
-        self.is_cancelled = False
+        self.lease = None      # 常駐瀏覽器池的借用 (None = 自己啟動的 Chrome)
+        self.container = CONTAINER_AUTO   # 片段容器 (每個播放清單判定一次)
+        self.cancel_token = cancel_token or CancelToken()  # 與 DownloadWorker 共用
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self.cancel_token.cancelled
+
+    def stop(self):
+        self.cancel_token.cancel()
+
+    def _quit_driver(self):
+        driver, self.driver = self.driver, None
+        lease, self.lease = self.lease, None
+        if driver:
+            try:
+                if lease: driver.close()   # 附掛模式只關自己開的分頁
+                driver.quit()
+            except: pass
+        if lease: lease.release()
 
     def _init_driver(self):
         options = Options()
@@ -47,9 +72,14 @@ class BrowserDownloader:
         options.add_argument("--log-level=3")
         options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
 
+        # [Browser Pool] 與嗅探器共用同一個設定檔的常駐 Chrome，只開新分頁；池子不可用時照舊自己啟動
+        pool_args = [a for a in options.arguments if not a.startswith("--user-data-dir")]
+        self.lease = GLOBAL_BROWSER_POOL.lease(profile_dir, pool_args, should_stop=self.cancel_token)
+
         service = Service(ChromeDriverManager().install())
         service.creation_flags = 0x08000000 
-        self.driver = webdriver.Chrome(service=service, options=options)
+        self.driver = webdriver.Chrome(service=service, options=self.lease.selenium_options() if self.lease else options)
+        if self.lease: self.driver.switch_to.new_window('tab')
 
     def download(self, target_url: str, output_path: str, progress_callback: Optional[Callable] = None) -> bool:
         if not HAS_CURL or not HAS_CRYPTO:
@@ -58,6 +88,8 @@ class BrowserDownloader:
 
         self.logger.info(f"[Clone] 啟動表頭複製模式...")
         
+        # 取消時直接關閉瀏覽器 (阻塞中的 driver 呼叫會丟出例外)
+        quit_driver = self.cancel_token.on_cancel(self._quit_driver)
         try:
             self._init_driver()
             self.logger.info("[Clone] 進入頁面，請等待 M3U8...")
@@ -88,7 +120,7 @@ class BrowserDownloader:
                     except: pass
                 
                 if m3u8_url: break
-                time.sleep(3)
+                if self.cancel_token.wait(3): return False
             
             if not m3u8_url:
                 self.logger.error("❌ 找不到 M3U8")
@@ -111,8 +143,8 @@ class BrowserDownloader:
                 session.cookies.set(c['name'], c['value'], domain=c['domain'])
 
             self.logger.info("[Clone] 關閉瀏覽器，轉交 Python 下載...")
-            self.driver.quit()
-            self.driver = None
+            self.cancel_token.remove(quit_driver)
+            self._quit_driver()
 
             # 3. 下載 M3U8
             resp = session.get(m3u8_url)
@@ -129,64 +161,46 @@ class BrowserDownloader:
 
             segments = playlist.segments
             total_segments = len(segments)
+            key_plan = segment_key_plan(playlist)
+            self.container = playlist_container(playlist)
             self.logger.info(f"[Clone] 開始下載 {total_segments} 個切片...")
 
             temp_dir = output_path + "_temp"
             if not os.path.exists(temp_dir): os.makedirs(temp_dir)
 
             # 4. 單線程下載 (避免並發觸發風控)
-            success_count = 0
-            for idx, seg in enumerate(segments):
-                if self.is_cancelled: break
-                
-                fname = f"seg_{idx:05d}.ts"
-                save_path = os.path.join(temp_dir, fname)
-                
-                if os.path.exists(save_path) and os.path.getsize(save_path) > 0:
-                    success_count += 1
-                    continue
-                
-                # Key
-                key_info = None
-                if seg.key and seg.key.method == 'AES-128':
-                    key_uri = seg.key.absolute_uri
-                    iv = seg.key.iv
-                    if not iv: iv = idx.to_bytes(16, byteorder='big')
-                    elif isinstance(iv, str) and iv.startswith('0x'):
-                        iv = base64.b16decode(iv[2:].upper().zfill(32))
-                    key_info = {'uri': key_uri, 'iv': iv}
-
-                # 下載
-                try:
-                    # 使用偷來的 Headers 去請求 segment
-                    # 這裡不需要改 Headers，因為 session 已經有了
-                    s_resp = session.get(seg.absolute_uri, timeout=10)
-                    if s_resp.status_code == 200:
-                        data = s_resp.content
-                        
-                        # 解密
-                        if key_info:
-                            # 獲取 Key
-                            k_resp = session.get(key_info['uri'])
-                            key_bytes = k_resp.content
-                            cipher = AES.new(key_bytes, AES.MODE_CBC, key_info['iv'])
-                            try: data = cipher.decrypt(data)
-                            except: pass
-
-                        with open(save_path, 'wb') as f:
-                            f.write(data)
-                        success_count += 1
+            # [Integrity] 片段通過驗證才落地；第二輪只重抓第一輪失敗的 index
+            gaps = {}
+            for _ in range(2):
+                pending = [i for i in range(total_segments)
+                           if not os.path.exists(os.path.join(temp_dir, f"seg_{i:05d}.ts"))]
+                for n, idx in enumerate(pending):
+                    if self.is_cancelled: break
+                    # Key (依片段當下生效的 EXT-X-KEY；IV 依 Media Sequence 推算)
+                    key_uri, iv = key_plan[idx]
+                    key_info = {'uri': key_uri, 'iv': iv} if key_uri and segments[idx].key.method == 'AES-128' else None
+                    save_path = os.path.join(temp_dir, f"seg_{idx:05d}.ts")
+                    reason = self._fetch_segment(session, segments[idx].absolute_uri, key_info, save_path)
+                    if reason:
+                        gaps[idx] = reason
+                        self.logger.warning(f"切片 {idx} 失敗: {reason}")
                     else:
-                        self.logger.warning(f"切片 {idx} 失敗: {s_resp.status_code}")
-                except Exception as e:
-                    pass
+                        gaps.pop(idx, None)
+
+                    if progress_callback and idx % 5 == 0:
+                        percent = ((total_segments - len(pending) + n + 1) / total_segments) * 95
+                        progress_callback(percent, f"下載中 {idx}/{total_segments}")
+                if not gaps or self.is_cancelled: break
+                self.logger.info(f"[Clone] 重抓 {len(gaps)} 個失敗切片...")
+            success_count = total_segments - len(gaps)
+
+            key_stats = GLOBAL_KEY_STORE.stats()
+            self.logger.info(f"[Clone] 🔑 KeyStore: 命中 {key_stats['hits']} / 未命中 {key_stats['misses']}")
 
-                if progress_callback and idx % 5 == 0:
-                    percent = ((idx + 1) / total_segments) * 95
-                    progress_callback(percent, f"下載中 {idx}/{total_segments}")
-            
             # 5. 結算
-            if success_count < total_segments * 0.8:
+            if gaps:
+                self.logger.warning(f"[Clone] 缺片 {len(gaps)} 個: {sorted(gaps)[:20]}")
+            if self.is_cancelled or success_count < total_segments * 0.8:
                 self.logger.error("❌ 下載失敗")
                 return False
 
@@ -206,5 +220,51 @@ class BrowserDownloader:
             return True
 
         except Exception as e:
+            if self.is_cancelled: return False
             self.logger.error(f"[Clone] 異常: {e}")
-            return False
\ No newline at end of file
+            return False
+        finally:
+            self.cancel_token.remove(quit_driver)
+            self._quit_driver()
+
+    def _fetch_segment(self, session, url: str, key_info: Optional[dict], save_path: str) -> Optional[str]:
+        """下載 -> 清洗 -> 解密 -> 驗證 -> 以 .part 寫入後 rename；成功回傳 None，失敗回傳原因"""
+        try:
+            # 使用偷來的 Headers 去請求 segment (session 已經帶上)
+            s_resp = session.get(url, timeout=10, stream=True)
+            if s_resp.status_code != 200:
+                s_resp.close()
+                return f"HTTP {s_resp.status_code}"
+            # [Memory] 先取得全域記憶體預算才讀入 body
+            # [限速] 每個區塊讀入後扣額度
+            body, reserved = read_body(s_resp, GLOBAL_MEMORY_BUDGET, lambda: self.is_cancelled, throttle=lambda n: GLOBAL_BANDWIDTH.throttle(
+                n, self.task_id, should_stop=lambda: self.is_cancelled))
+        except Exception as e:
+            return f"連線錯誤: {e}"
+        if body is None: return "已取消"
+        try:
+            return self._store_segment(session, s_resp, body, key_info, save_path)
+        finally:
+            GLOBAL_MEMORY_BUDGET.release(reserved)
+
+    def _store_segment(self, session, s_resp, body: bytes, key_info: Optional[dict], save_path: str) -> Optional[str]:
+        reason = check_response(s_resp.status_code, s_resp.headers, body)
+        if reason: return reason
+
+        data = sanitize(body).data  # 移除偽裝頭
+        if key_info:
+            # 獲取 Key (KeyStore 快取，同一把 key 只下載一次)
+            key_bytes = GLOBAL_KEY_STORE.get(key_info['uri'], lambda u: fetch_key(session, u))
+            if not key_bytes: return "無法取得金鑰"
+            try: data = strip_pkcs7(AES.new(key_bytes, AES.MODE_CBC, key_info['iv']).decrypt(data))
+            except Exception: return "解密失敗"
+            data = sanitize(data).data
+
+        # 單線程下載：副檔名看不出容器時，以第一個可辨識的片段判定後沿用
+        self.container = resolve_container(self.container, data)
+        reason = check_payload(data, self.container)
+        if reason: return reason
+        with open(save_path + ".part", 'wb') as f:
+            f.write(data)
+        os.replace(save_path + ".part", save_path)
+        return None
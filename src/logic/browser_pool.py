@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+# src/logic/browser_pool.py
+# [VibeCoding] Browser Pool: 常駐 Chromium (remote debugging)，任務以 CDP / debuggerAddress 附掛，不再各自啟動瀏覽器
+
+import os
+import sys
+import time
+import shutil
+import atexit
+import threading
+import subprocess
+import urllib.request
+from typing import Callable, Dict, List, Optional, Sequence
+
+try:
+    import psutil
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
+
+try:
+    from selenium.webdriver.chrome.options import Options as ChromeOptions
+    HAS_SELENIUM = True
+except ImportError:
+    HAS_SELENIUM = False
+
+# 系統 Chrome 的常見安裝位置 (Selenium 端使用；Playwright 端會指定自己的 Chromium)
+CHROME_CANDIDATES = [
+    os.path.join(os.environ.get("PROGRAMFILES", r"C:\Program Files"), "Google", "Chrome", "Application", "chrome.exe"),
+    os.path.join(os.environ.get("PROGRAMFILES(X86)", r"C:\Program Files (x86)"), "Google", "Chrome", "Application", "chrome.exe"),
+    os.path.join(os.environ.get("LOCALAPPDATA", ""), "Google", "Chrome", "Application", "chrome.exe"),
+]
+
+
+def find_chrome() -> Optional[str]:
+    for path in CHROME_CANDIDATES:
+        if path and os.path.isfile(path): return path
+    for name in ("chrome", "google-chrome", "chromium", "chromium-browser"):
+        found = shutil.which(name)
+        if found: return found
+    return None
+
+
+class _PooledBrowser:
+    """一個常駐的 Chromium 行程 (一個設定檔一個)"""
+    def __init__(self, profile_dir: str, process: subprocess.Popen, port: int):
+        self.profile_dir = profile_dir
+        self.process = process
+        self.port = port
+        self.leases = 0        # 目前借出中的次數
+        self.uses = 0          # 累計借出次數 (達 max_uses 後回收重啟)
+        self.last_used = time.time()
+        self.close_on_release = False   # 登入中的設定檔：最後一個借用者歸還時就關閉，不常駐
+
+    @property
+    def endpoint(self) -> str:
+        return f"127.0.0.1:{self.port}"
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def memory_bytes(self) -> int:
+        """整個行程樹 (含 renderer / GPU 子行程) 的 RSS；沒有 psutil 時回傳 0 (不檢查)"""
+        if not HAS_PSUTIL: return 0
+        try:
+            root = psutil.Process(self.process.pid)
+            procs = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return 0
+        total = 0
+        for proc in procs:
+            try: total += proc.memory_info().rss
+            except psutil.Error: pass
+        return total
+
+
+class BrowserLease:
+    """
+    一次借用：endpoint (host:port) 給 Selenium 的 debuggerAddress，cdp_url 給 Playwright 的 connect_over_cdp
+    使用完畢呼叫 release() (或用 with)；借用者只能關閉自己開的分頁 / context，不可關閉整個瀏覽器
+    """
+    def __init__(self, pool: "BrowserPool", browser: _PooledBrowser):
+        self._pool = pool
+        self._browser = browser
+        self._released = False
+
+    @property
+    def endpoint(self) -> str:
+        return self._browser.endpoint
+
+    @property
+    def cdp_url(self) -> str:
+        return f"http://{self._browser.endpoint}"
+
+    def selenium_options(self):
+        """附掛到常駐瀏覽器的 Selenium 選項 (附掛模式不能再帶 arguments / excludeSwitches)"""
+        options = ChromeOptions()
+        options.debugger_address = self.endpoint
+        options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        return options
+
+    def release(self):
+        if self._released: return
+        self._released = True
+        self._pool._release(self._browser)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class BrowserPool:
+    """
+    常駐瀏覽器池 (所有任務共用)
+    - 每個設定檔 (profile_dir) 只啟動一個 Chromium，開啟 remote debugging；任務借用後自行開分頁 / context
+    - 借出滿 max_uses 次，或整個行程樹記憶體超過 memory_limit_mb (需 psutil) 時，在沒人使用的當下關閉，下次借用再重啟
+    - shutdown_idle(): 佇列閒置時呼叫，關掉所有沒人借用的瀏覽器 (GUI 執行緒請用 shutdown_idle_async)
+    - 啟動 (最長 launch_timeout) 與關閉 (最長 5 秒) 都在鎖外進行：鎖內只預留 / 摘除設定檔，
+      同一設定檔正在啟動或關閉時，其他借用者在鎖外等待完成，不會同時開兩個行程搶同一個設定檔
+    - 找不到瀏覽器執行檔或啟動失敗時 lease() 回傳 None，呼叫端退回原本自己啟動瀏覽器的流程
+    - 安全性：除錯埠只綁 127.0.0.1，讀到埠號後即刪除 DevToolsActivePort，埠號不寫進 log；
+      附掛端 (Selenium debuggerAddress / Playwright connect_over_cdp) 需要 TCP 埠，無法改用 --remote-debugging-pipe。
+      受 ProfileLock 保護的登入設定檔以 close_on_release=True 借用：歸還時 (釋放鎖之前) 就關閉，
+      不會在鎖釋放後繼續佔著設定檔、也不會閒置時開著除錯埠
+    """
+    def __init__(self, enabled: bool = True, max_uses: int = 20, memory_limit_mb: float = 1500,
+                 launch_timeout: float = 20):
+        self.enabled = enabled
+        self.max_uses = max_uses
+        self.memory_limit_mb = memory_limit_mb
+        self.launch_timeout = launch_timeout
+        self._lock = threading.Lock()
+        self._browsers: Dict[str, _PooledBrowser] = {}
+        self._pending: Dict[str, threading.Event] = {}   # 正在啟動或關閉中的設定檔
+        self.launches = 0
+        self.reuses = 0
+        self.recycles = 0
+
+    def configure(self, enabled: Optional[bool] = None, max_uses: Optional[int] = None,
+                  memory_limit_mb: Optional[float] = None):
+        with self._lock:
+            if enabled is not None: self.enabled = enabled
+            if max_uses is not None: self.max_uses = max_uses
+            if memory_limit_mb is not None: self.memory_limit_mb = memory_limit_mb
+
+    def lease(self, profile_dir: str, args: Sequence[str] = (), executable: Optional[str] = None,
+              should_stop: Optional[Callable[[], bool]] = None, close_on_release: bool = False) -> Optional[BrowserLease]:
+        """
+        借用 profile_dir 對應的常駐瀏覽器 (沒有就啟動)；不可用時回傳 None
+        close_on_release=True：最後一個借用者歸還時同步關閉該瀏覽器 (release() 返回時行程已結束)
+        """
+        if not self.enabled: return None
+        profile_dir = os.path.abspath(profile_dir)
+        while True:
+            with self._lock:
+                pending = self._pending.get(profile_dir)
+                if pending is None:
+                    browser = self._browsers.get(profile_dir)
+                    if browser is not None and not browser.alive():
+                        del self._browsers[profile_dir]
+                        browser = None
+                    if browser is not None:
+                        self.reuses += 1
+                        return self._checkout(browser, close_on_release)
+                    # 預留這個設定檔，鎖外啟動
+                    pending = self._pending[profile_dir] = threading.Event()
+                    break
+            # 其他執行緒正在啟動 / 關閉同一設定檔的瀏覽器：等它完成再重新檢查
+            while not pending.wait(0.2):
+                if should_stop and should_stop(): return None
+
+        browser = None
+        try:
+            browser = self._launch(profile_dir, args, executable or find_chrome(), should_stop)
+        finally:
+            with self._lock:
+                del self._pending[profile_dir]
+                lease = None
+                if browser is not None:
+                    self._browsers[profile_dir] = browser
+                    self.launches += 1
+                    lease = self._checkout(browser, close_on_release)
+            pending.set()
+        return lease
+
+    def _release(self, browser: _PooledBrowser):
+        with self._lock:
+            browser.leases = max(0, browser.leases - 1)
+            browser.last_used = time.time()
+            if browser.leases or self._browsers.get(browser.profile_dir) is not browser: return
+            limit = self.memory_limit_mb * 1024 * 1024
+            if browser.uses >= self.max_uses or (limit > 0 and browser.memory_bytes() > limit):
+                self.recycles += 1
+            elif not browser.close_on_release:
+                return
+            closing = [self._detach(browser)]
+        self._reap(closing)
+
+    def shutdown_idle(self):
+        """關閉所有沒有借用中的瀏覽器 (佇列閒置時呼叫；會等待行程結束，GUI 執行緒請用 shutdown_idle_async)"""
+        with self._lock:
+            closing = [self._detach(b) for b in list(self._browsers.values()) if not b.leases]
+        self._reap(closing)
+
+    def shutdown_idle_async(self):
+        """在背景執行緒關閉閒置瀏覽器，呼叫端 (GUI 執行緒) 不會被 terminate / wait 卡住"""
+        threading.Thread(target=self.shutdown_idle, name="BrowserPoolIdle", daemon=True).start()
+
+    def shutdown(self):
+        with self._lock:
+            closing = [self._detach(b) for b in list(self._browsers.values())]
+        self._reap(closing)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"browsers": len(self._browsers), "leases": sum(b.leases for b in self._browsers.values()),
+                    "launches": self.launches, "reuses": self.reuses, "recycles": self.recycles}
+
+    # --- 內部 (呼叫端需持有鎖) ---
+    def _checkout(self, browser: _PooledBrowser, close_on_release: bool = False) -> BrowserLease:
+        browser.close_on_release = browser.close_on_release or close_on_release
+        browser.leases += 1
+        browser.uses += 1
+        browser.last_used = time.time()
+        return BrowserLease(self, browser)
+
+    def _detach(self, browser: _PooledBrowser):
+        """從池中摘除並標記為關閉中 (同設定檔的下一次借用會等關閉完成)；實際關閉交給 _reap 在鎖外執行"""
+        self._browsers.pop(browser.profile_dir, None)
+        pending = self._pending[browser.profile_dir] = threading.Event()
+        return browser, pending
+
+    # --- 內部 (鎖外呼叫：可能阻塞) ---
+    def _reap(self, closing):
+        for browser, pending in closing:
+            try:
+                self._terminate(browser.process)
+            finally:
+                with self._lock:
+                    if self._pending.get(browser.profile_dir) is pending:
+                        del self._pending[browser.profile_dir]
+                pending.set()
+
+    def _launch(self, profile_dir: str, args: Sequence[str], executable: Optional[str],
+                should_stop: Optional[Callable[[], bool]]) -> Optional[_PooledBrowser]:
+        if not executable: return None
+        os.makedirs(profile_dir, exist_ok=True)
+        # --remote-debugging-port=0 由瀏覽器自選空閒埠，寫在設定檔目錄的 DevToolsActivePort
+        port_file = os.path.join(profile_dir, "DevToolsActivePort")
+        try: os.remove(port_file)
+        except OSError: pass
+        cmd: List[str] = [executable, "--remote-debugging-port=0", f"--user-data-dir={profile_dir}",
+                          "--no-first-run", "--no-default-browser-check", *args, "about:blank"]
+        flags = 0x08000000 if sys.platform == "win32" else 0   # CREATE_NO_WINDOW (不開主控台視窗)
+        try:
+            process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, creationflags=flags)
+        except OSError:
+            return None
+        deadline = time.time() + self.launch_timeout
+        while time.time() < deadline and process.poll() is None:
+            if should_stop and should_stop(): break
+            port = self._read_port(port_file)
+            if port and self._ready(port):
+                # 埠號只留在記憶體：不讓其他程序從設定檔目錄找到除錯埠
+                try: os.remove(port_file)
+                except OSError: pass
+                return _PooledBrowser(profile_dir, process, port)
+            time.sleep(0.1)
+        self._terminate(process)
+        return None
+
+    @staticmethod
+    def _read_port(port_file: str) -> Optional[int]:
+        try:
+            with open(port_file, "r") as f:
+                first = f.readline().strip()
+            return int(first) if first.isdigit() else None
+        except OSError:
+            return None
+
+    @staticmethod
+    def _ready(port: int) -> bool:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/json/version", timeout=1) as resp:
+                return resp.status == 200
+        except Exception:
+            return False
+
+    @staticmethod
+    def _terminate(process: subprocess.Popen):
+        if process.poll() is not None: return
+        process.terminate()
+        try: process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+# 全域共用實例 (所有任務共用)
+GLOBAL_BROWSER_POOL = BrowserPool()
+atexit.register(GLOBAL_BROWSER_POOL.shutdown)
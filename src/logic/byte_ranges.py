@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# src/logic/byte_ranges.py
+# [VibeCoding] EXT-X-BYTERANGE 規劃：同一檔案中相鄰的子區段合併成較大的 Range 請求
+
+from collections import namedtuple
+from typing import Dict, List, Optional, Tuple
+
+# start / end 為含頭含尾的絕對位元組位置 (與 HTTP Range 一致)
+RangeGroup = namedtuple("RangeGroup", ["url", "start", "end", "members"])
+
+
+def parse_byterange(value: Optional[str], implied_offset: int = 0) -> Optional[Tuple[int, int]]:
+    """'length[@offset]' -> (offset, length)；省略 offset 時接在同一資源上一段之後"""
+    if not value: return None
+    text = str(value).strip()
+    if "@" in text:
+        length, offset = text.split("@", 1)
+        return int(offset), int(length)
+    return implied_offset, int(text)
+
+
+def segment_byteranges(playlist) -> List[Optional[Tuple[int, int]]]:
+    """
+    逐片段解析 EXT-X-BYTERANGE：回傳 [(offset, length) 或 None, ...]，與 playlist.segments 一一對應
+    依 HLS 規範，未寫 offset 的子區段從同一 URI 上一段的結尾開始
+    """
+    plan = []
+    next_offset: Dict[str, int] = {}
+    for seg in playlist.segments:
+        url = seg.absolute_uri
+        rng = parse_byterange(getattr(seg, "byterange", None), next_offset.get(url, 0))
+        if rng: next_offset[url] = rng[0] + rng[1]
+        plan.append(rng)
+    return plan
+
+
+def coalesce_ranges(items, max_bytes: int = 16 * 1024 * 1024, max_gap: int = 0) -> List[RangeGroup]:
+    """
+    items: [(url, offset, length, payload), ...]
+    同一 URL 且相鄰 (間隙 <= max_gap) 的子區段合併成一個 RangeGroup，單組不超過 max_bytes
+    (單一子區段本身超過上限時自成一組)；members = [(payload, offset, length), ...]
+    """
+    by_url: Dict[str, list] = {}
+    for url, offset, length, payload in items:
+        by_url.setdefault(url, []).append((offset, length, payload))
+
+    groups = []
+    for url, parts in by_url.items():
+        parts.sort(key=lambda p: p[0])
+        members, start, end = [], None, None
+        for offset, length, payload in parts:
+            last = offset + length - 1
+            if members and (offset - end - 1 > max_gap or offset <= end or last - start + 1 > max_bytes):
+                groups.append(RangeGroup(url, start, end, members))
+                members, start = [], None
+            if start is None: start = offset
+            members.append((payload, offset, length))
+            end = last
+        if members:
+            groups.append(RangeGroup(url, start, end, members))
+    return groups
+
+
+def split_group(group: RangeGroup, body: bytes, body_offset: int):
+    """把 Range 回應切回各子區段；body_offset 為 body 第一個位元組在原檔中的位置 (200 整檔回應時為 0)"""
+    for payload, offset, length in group.members:
+        rel = offset - body_offset
+        chunk = body[rel:rel + length]
+        yield payload, chunk if len(chunk) == length else None
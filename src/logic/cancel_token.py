@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# src/logic/cancel_token.py
+# [VibeCoding] Cancellation: 每個任務一個取消權杖，傳進所有引擎；所有等待 / 阻塞都掛在它上面
+
+import socket
+import threading
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+
+class CancelToken:
+    """
+    任務層級的取消訊號 (DownloadWorker 建立，同一個實例傳給該任務用到的每個引擎)
+    - cancelled / token(): 輪詢用，本身可直接當 should_stop 傳入
+    - wait(seconds): 取代 time.sleep()；取消時立即返回 True
+    - on_cancel(callback): 取消時呼叫 (中斷連線、關閉瀏覽器)；已取消則立即呼叫
+    - hook(callback): on_cancel 的 with 版本，離開區塊時自動移除
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def __call__(self) -> bool:
+        return self._event.is_set()
+
+    def wait(self, seconds: Optional[float] = None) -> bool:
+        """等待 seconds 秒 (None = 直到取消)；回傳是否已取消"""
+        if seconds is not None and seconds <= 0: return self._event.is_set()
+        return self._event.wait(seconds)
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set(): return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try: callback()
+            except Exception: pass
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return callback
+        try: callback()
+        except Exception: pass
+        return callback
+
+    def remove(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks: self._callbacks.remove(callback)
+
+    @contextmanager
+    def hook(self, callback: Callable[[], None]):
+        self.on_cancel(callback)
+        try:
+            yield self
+        finally:
+            self.remove(callback)
+
+
+def abort_response(resp):
+    """
+    從其他執行緒中斷串流中的 HTTP 回應 (requests / urllib3)：對底層 socket 做 shutdown，
+    阻塞中的讀取立即返回錯誤，不必等 read timeout。其他用戶端 (curl_cffi) 沒有可用的 socket 時不做事，
+    由讀取迴圈在下一個區塊檢查取消旗標
+    """
+    raw = getattr(resp, "raw", None)
+    sock = getattr(getattr(raw, "connection", None), "sock", None)
+    if sock is None:
+        # 不保持連線 (Connection: close / HTTP/1.0) 時連線物件已放掉 socket，只剩回應的 fp 持有
+        fp = getattr(getattr(raw, "_fp", None), "fp", None)
+        sock = getattr(getattr(fp, "raw", None), "_sock", None)
+    if sock is None: return
+    try: sock.shutdown(socket.SHUT_RDWR)
+    except OSError: pass
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# src/logic/decrypt_pool.py
+# [VibeCoding] Decrypt Stage: 解密 / 清洗移出網路執行緒，改由依 CPU 數量配置的批次解密池處理
+
+import os
+import queue
+import threading
+from typing import Dict, Optional
+from src.logic.ts_sanitizer import sanitize
+from src.logic.segment_validator import CONTAINER_AUTO, SegmentInvalid, check_payload, resolve_container, strip_pkcs7
+from src.logic.memory_budget import GLOBAL_MEMORY_BUDGET, SpooledBody
+
+try:
+    from Crypto.Cipher import AES
+    HAS_CRYPTO = True
+except ImportError:
+    HAS_CRYPTO = False
+
+
+class DecryptTracker:
+    """
+    追蹤某一個下載任務送進解密池的工作，讓任務可以只等待自己的片段
+    container: "ts" / "fmp4" / "audio"，決定解密後要跑哪一種完整性檢查 (None = 不檢查)；
+    "auto" 時以第一個可辨識的片段內容判定，之後整個播放清單沿用
+    """
+    def __init__(self, container: Optional[str] = None):
+        self._cond = threading.Condition()
+        self.container = container
+        self.pending = 0
+        self.failed = 0
+        self.stripped_packets = 0   # 清洗時裁掉的偽裝封包數
+        self.invalid: Dict[int, str] = {}   # index -> 最近一次驗證失敗的原因 (缺片報告用)
+
+    def resolve_container(self, data: bytes) -> Optional[str]:
+        if self.container != CONTAINER_AUTO: return self.container
+        container = resolve_container(self.container, data)
+        if container != CONTAINER_AUTO:
+            with self._cond:
+                self.container = container
+        return container
+
+    def record_invalid(self, index: int, reason: str):
+        with self._cond:
+            self.invalid[index] = reason
+
+    def _add(self):
+        with self._cond:
+            self.pending += 1
+
+    def _done(self, ok: bool, stripped: int = 0):
+        with self._cond:
+            self.pending -= 1
+            self.stripped_packets += stripped
+            if not ok: self.failed += 1
+            self._cond.notify_all()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等到此任務的工作全部完成；逾時回傳 False"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.pending == 0, timeout=timeout)
+
+
+class DecryptPool:
+    """
+    解密 / 清洗工作池
+    - 執行緒數 = CPU 核心數 (pycryptodome 的 C 實作在運算時會釋放 GIL，執行緒即可平行)
+    - 每個工作執行緒一次從佇列取出最多 batch_size 個片段批次處理
+    - 佇列有上限：解密跟不上時會反壓網路執行緒，避免未解密資料在記憶體堆積
+    - 抓取端登記的記憶體預算 (reserved) 在片段交給 writer 之後歸還
+    - 磁碟暫存的大型片段 (SpooledBody) 輪到處理時才讀回記憶體 (讀回時記入記憶體預算，不等待)
+    """
+    def __init__(self, workers: Optional[int] = None, batch_size: int = 16, max_queued: int = 128):
+        self.workers = workers or os.cpu_count() or 2
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._threads: return
+        with self._start_lock:
+            if self._threads: return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"Decrypt-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def new_tracker(self, container: Optional[str] = None) -> DecryptTracker:
+        return DecryptTracker(container)
+
+    def saturated(self) -> bool:
+        """佇列已滿 (submit 會阻塞)；asyncio 引擎據此先讓出事件迴圈，而不是卡住整個 loop"""
+        return self._queue.full()
+
+    def submit(self, tracker: DecryptTracker, index: int, data: bytes, key: Optional[bytes],
+               iv: Optional[bytes], key_id: str, writer, reserved: int = 0):
+        """排入一個片段；處理完成後由解密池直接交給 writer.put()，並歸還 reserved 位元組的記憶體預算"""
+        self._ensure_started()
+        tracker._add()
+        self._queue.put((tracker, index, data, key, iv, key_id, writer, reserved))
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try: batch.append(self._queue.get_nowait())
+                except queue.Empty: break
+            for i, job in enumerate(batch):
+                tracker, reserved = job[0], job[7]
+                if isinstance(job[2], SpooledBody):
+                    # 溢寫到磁碟的片段不佔抓取端預算：讀回記憶體前先記帳，處理完與 reserved 一起歸還
+                    # 只記帳不等待：佇列中其他片段的預算要等工作執行緒處理完才歸還，在這裡等待會讓整個池子死結
+                    GLOBAL_MEMORY_BUDGET.charge(len(job[2]))
+                    reserved += len(job[2])
+                ok = False
+                stripped = 0
+                try:
+                    stripped = self._process(*job[:7])
+                    ok = True
+                except SegmentInvalid as e:
+                    # 驗證失敗：不交給 writer，該 index 維持未完成，下一輪只重抓它
+                    tracker.record_invalid(job[1], str(e))
+                except Exception:
+                    pass
+                finally:
+                    # 先放掉引用再歸還預算，批次中其他片段處理時不會繼續佔著記憶體
+                    batch[i] = job = None
+                    GLOBAL_MEMORY_BUDGET.release(reserved)
+                    tracker._done(ok, stripped)
+                    self._queue.task_done()
+
+    @staticmethod
+    def _process(tracker, index, data, key, iv, key_id, writer) -> int:
+        if isinstance(data, SpooledBody):
+            body = data
+            data = body.read_range(0, body.length)
+            body.discard()
+        # [Fix 1] 移除偽裝頭
+        first = sanitize(data)
+        data = first.data
+
+        # 解密
+        if key and iv and HAS_CRYPTO:
+            try:
+                data = strip_pkcs7(AES.new(key, AES.MODE_CBC, iv).decrypt(data))
+            except ValueError: pass
+
+        # [Fix 2] 解密後再次檢查偽裝頭
+        second = sanitize(data)
+
+        # [Integrity] 解密後檢查 TS 對齊 / 同步位元組 / Continuity Counter (fMP4 檢查 box)
+        reason = check_payload(second.data, tracker.resolve_container(second.data))
+        if reason: raise SegmentInvalid(reason)
+
+        writer.put(index, second.data, key_id)
+        return first.stripped_packets + second.stripped_packets
+
+
+# 全域共用解密池 (所有任務共用，依 CPU 數量配置)
+GLOBAL_DECRYPT_POOL = DecryptPool()
@@ -8,6 +8,10 @@ from typing import Dict, Any, Optional
 from PySide6.QtCore import QThread, Signal, QObject, QMutex
 from src.logic.playwright_downloader import PlaywrightDownloader
 from src.logic.native_downloader import NativeHLSDownloader
+from src.logic.async_downloader import AsyncHLSDownloader
+from src.logic.ranged_downloader import RangedDownloader
+from src.logic.bandwidth_limiter import GLOBAL_BANDWIDTH
+from src.logic.cancel_token import CancelToken
 
 GLOBAL_SNIFFER_LOCK = QMutex()
 
@@ -54,10 +58,23 @@ class DownloadWorker(QThread):
         self.url = url
         self.config = config
         self.signals = WorkerSignals()
-        self.is_cancelled = False
+        # 取消權杖：傳給這個任務用到的每個引擎 (等待、連線、瀏覽器都掛在上面)，stop() 後一秒內釋放
+        self.cancel_token = CancelToken()
         self.logger = logging.getLogger(f"Worker-{task_id[:4]}")
 
+    @property
+    def is_cancelled(self) -> bool:
+        return self.cancel_token.cancelled
+
     def run(self):
+        # [限速] 任務期間登記到全域頻寬管理 (單一任務上限來自 config['rate_limit'])
+        GLOBAL_BANDWIDTH.register_task(self.task_id, self.config.get('rate_limit', 0))
+        try:
+            self._run()
+        finally:
+            GLOBAL_BANDWIDTH.unregister_task(self.task_id)
+
+    def _run(self):
         self.logger.info(f"任務啟動: {self.url}")
         
         # === Pressplay 特規 ===
@@ -74,7 +91,9 @@ class DownloadWorker(QThread):
                 self.signals.progress.emit(self.task_id, "0%", 0.0, "啟動救援模式...", "N/A")
                 self.signals.status.emit(self.task_id, "解析失敗，轉入嗅探模式...")
                 
-                GLOBAL_SNIFFER_LOCK.lock()
+                # 嗅探器同一時間只能跑一個：排隊時也要能被取消
+                while not GLOBAL_SNIFFER_LOCK.tryLock(200):
+                    if self.is_cancelled: return
                 real_url = None
                 sniffed_headers = {}
                 try:
@@ -88,7 +107,15 @@ class DownloadWorker(QThread):
                 
                 if real_url:
                     self.signals.status.emit(self.task_id, "嗅探成功，開始下載...")
-                    success_retry = self._try_download(real_url, is_retry=True, headers=sniffed_headers)
+                    success_retry = False
+                    if ".m3u8" in real_url.split('?')[0].lower():
+                        # HLS (含 master playlist) 優先交給原生引擎，失敗再退回 yt-dlp
+                        success_retry = self._try_native_hls(real_url, sniffed_headers)
+                    else:
+                        # 單一媒體檔 (抖音/TikTok mp4)：多連線 Range 下載，伺服器不支援再退回 yt-dlp
+                        success_retry = self._try_ranged(real_url, sniffed_headers)
+                    if not success_retry and not self.is_cancelled:
+                        success_retry = self._try_download(real_url, is_retry=True, headers=sniffed_headers)
                     if success_retry:
                         self._finalize_success()
                     else:
@@ -112,14 +139,11 @@ class DownloadWorker(QThread):
 
     def _run_pressplay(self):
         self.signals.status.emit(self.task_id, "啟動瀏覽器攔截...")
-        save_path = self.config.get('download_path', os.getcwd())
-        custom_name = self.config.get('custom_name', '')
-        custom_name = re.sub(r'[\\/*?:"<>|]', "", custom_name)
-        filename = f"{custom_name}.mp4" if custom_name else f"Video_{self.task_id[:8]}.mp4"
-        output_path = os.path.join(save_path, filename)
+        output_path = self._output_path()
         
         try:
-            downloader = PlaywrightDownloader(self.logger)
+            downloader = PlaywrightDownloader(self.logger, cancel_token=self.cancel_token,
+                                              hybrid=self.config.get('browser_hybrid', True), task_id=self.task_id)
             success = downloader.download(self.url, output_path, lambda p, m: self.signals.progress.emit(self.task_id, f"{p:.1f}%", p, m, "N/A"))
             if success:
                 self._finalize_success()
@@ -128,9 +152,62 @@ class DownloadWorker(QThread):
         except Exception as e:
             self.signals.error.emit(self.task_id, f"錯誤: {e}")
 
+    def _output_path(self, ext: str = "mp4") -> str:
+        save_path = self.config.get('download_path', os.getcwd())
+        custom_name = re.sub(r'[\\/*?:"<>|]', "", self.config.get('custom_name', ''))
+        filename = f"{custom_name}.{ext}" if custom_name else f"Video_{self.task_id[:8]}.{ext}"
+        return os.path.join(save_path, filename)
+
+    def _try_native_hls(self, m3u8_url: str, headers: Dict = None) -> bool:
+        self.signals.status.emit(self.task_id, "原生 HLS 引擎下載中...")
+        try:
+            options = dict(
+                variant_policy=self.config.get('variant_policy', 'max_bandwidth'),
+                max_height=self.config.get('max_height'),
+                pipe_remux=self.config.get('pipe_remux', True),
+                task_id=self.task_id,
+                hedge=self.config.get('hedge_requests', True),
+                stall_min_rate=self.config.get('stall_min_kbps', 32) * 1024,
+                cdn_mirrors=self.config.get('cdn_mirrors'),
+                cancel_token=self.cancel_token,
+            )
+            # 片段抓取模型：async 引擎介面相同，超大型清單 (auto 模式下 >= 2000 片段) 才切換
+            engine = self.config.get('hls_engine', 'auto')
+            if engine == 'threads':
+                downloader = NativeHLSDownloader(self.logger, **options)
+            else:
+                downloader = AsyncHLSDownloader(self.logger, async_threshold=0 if engine == 'async' else 2000, **options)
+            # 直播錄製中按下停止：引擎會收尾並保留已錄製的部分
+            return downloader.download(
+                m3u8_url, self._output_path(), headers=headers, page_url=self.url,
+                progress_callback=lambda p, m: self.signals.progress.emit(self.task_id, f"{p:.1f}%", p, m, "N/A")
+            )
+        except Exception as e:
+            self.logger.error(f"原生 HLS 引擎異常: {e}", exc_info=True)
+            return False
+
+    def _try_ranged(self, media_url: str, headers: Dict = None) -> bool:
+        self.signals.status.emit(self.task_id, "多連線下載中...")
+        try:
+            downloader = RangedDownloader(self.logger, connections=self.config.get('range_connections', 8),
+                                          task_id=self.task_id, cancel_token=self.cancel_token)
+            req_headers = dict(headers or {})
+            req_headers.setdefault('Referer', self.url)
+            ext = downloader.media_extension(media_url, req_headers)
+            if ext is None:
+                self.logger.info("[Ranged] 無法判斷媒體格式，交給 yt-dlp 處理")
+                return False
+            return downloader.download(
+                media_url, self._output_path(ext), headers=req_headers,
+                progress_callback=lambda p, m: self.signals.progress.emit(self.task_id, f"{p:.1f}%", p, m, "N/A")
+            )
+        except Exception as e:
+            self.logger.error(f"多連線下載異常: {e}", exc_info=True)
+            return False
+
     def _perform_sniffing(self, target_url: str):
         try:
-            sniffer = BrowserSniffer()
+            sniffer = BrowserSniffer(cancel_token=self.cancel_token)
             return sniffer.extract_stream_url(target_url)
         except Exception as e:
             self.logger.error(f"嗅探異常: {e}", exc_info=True)
@@ -162,6 +239,7 @@ class DownloadWorker(QThread):
             'progress_hooks': [self._progress_hook],
             'http_headers': ydl_headers,
             'retries': 3,
+            'ratelimit': GLOBAL_BANDWIDTH.ytdlp_rate(self.task_id),
             'nocolor': True,
             'logger': YtDlpLogger(is_retry),
             'js-runtimes': [f'node:{node_path}'],
@@ -175,6 +253,8 @@ class DownloadWorker(QThread):
 
         try:
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                # yt-dlp 每個區塊都會重新讀取 params['ratelimit']，登記後即可在執行中調整速率
+                GLOBAL_BANDWIDTH.attach_ytdlp(self.task_id, ydl.params)
                 if not is_retry:
                     self.signals.status.emit(self.task_id, "解析資訊中...")
                     ydl.extract_info(download_url, download=False)
@@ -197,6 +277,8 @@ class DownloadWorker(QThread):
             if not is_retry and needs_sniff: return False
             if not is_retry: self.signals.error.emit(self.task_id, err_msg)
             return False
+        finally:
+            GLOBAL_BANDWIDTH.detach_ytdlp(self.task_id)
 
     def _clean_ansi(self, text: str) -> str:
         ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
@@ -228,4 +310,5 @@ class DownloadWorker(QThread):
             self.signals.status.emit(self.task_id, "下載完畢，正在整理檔案...")
     
     def stop(self):
-        self.is_cancelled = True
\ No newline at end of file
+        """只發出取消訊號，不等待執行緒結束 (由 QueueManager 在 finished 後回收)"""
+        self.cancel_token.cancel()
\ No newline at end of file
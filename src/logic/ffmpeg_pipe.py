@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# src/logic/ffmpeg_pipe.py
+# [VibeCoding] Pipeline Remux: 下載同時把依序完成的片段餵進 ffmpeg (-i pipe:0)，最後一片到齊後幾秒內即完成 MP4
+
+import os
+import subprocess
+import threading
+from collections import deque
+from typing import List, Optional
+
+
+def find_ffmpeg() -> str:
+    """與 _convert_to_mp4 相同的尋找順序：bin/ffmpeg.exe 優先，否則用 PATH 上的 ffmpeg"""
+    return "bin/ffmpeg.exe" if os.path.exists("bin/ffmpeg.exe") else "ffmpeg"
+
+
+class FFmpegPipe:
+    """
+    以 stdin 餵資料給 ffmpeg 的串流轉檔器
+    - write() 不會丟出例外：管線一旦失敗就標記 failed 並停止寫入，呼叫端最後改用批次轉檔
+    - stderr 由背景執行緒持續讀出 (避免緩衝區塞滿卡住 ffmpeg)，只保留最後幾行供除錯
+    """
+    def __init__(self, output_path: str, input_format: str = "mpegts", output_args: Optional[List[str]] = None,
+                 ffmpeg_exe: Optional[str] = None, logger=None):
+        self.output_path = output_path
+        self.input_format = input_format
+        self.output_args = output_args if output_args is not None else ["-c", "copy", "-bsf:a", "aac_adtstoasc"]
+        self.ffmpeg_exe = ffmpeg_exe or find_ffmpeg()
+        self.logger = logger
+        self.failed = False
+        self.bytes_fed = 0
+        self._proc = None
+        self._stderr_tail = deque(maxlen=20)
+        self._stderr_thread = None
+
+    def start(self) -> bool:
+        cmd = [self.ffmpeg_exe, "-y", "-loglevel", "error", "-fflags", "+genpts",
+               "-f", self.input_format, "-i", "pipe:0"] + self.output_args + [self.output_path]
+        kwargs = {}
+        if os.name == "nt":
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+            kwargs["startupinfo"] = startupinfo
+        try:
+            self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                          stderr=subprocess.PIPE, **kwargs)
+        except OSError as e:
+            if self.logger: self.logger.warning(f"[Pipe] 無法啟動 ffmpeg: {e}")
+            self.failed = True
+            return False
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+        self._stderr_thread.start()
+        return True
+
+    def _drain_stderr(self):
+        for line in iter(self._proc.stderr.readline, b""):
+            self._stderr_tail.append(line.decode("utf-8", "replace").rstrip())
+
+    def write(self, data: bytes):
+        if self.failed or self._proc is None: return
+        try:
+            self._proc.stdin.write(data)
+            self.bytes_fed += len(data)
+        except (BrokenPipeError, OSError, ValueError) as e:
+            self.failed = True
+            if self.logger: self.logger.warning(f"[Pipe] ffmpeg 管線中斷: {e}")
+
+    def close(self, timeout: float = 300) -> bool:
+        """關閉 stdin 並等 ffmpeg 寫完檔尾；成功回傳 True"""
+        if self._proc is None: return False
+        try:
+            self._proc.stdin.close()
+        except (BrokenPipeError, OSError, ValueError):
+            self.failed = True
+        try:
+            code = self._proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+            code = -1
+        if self._stderr_thread: self._stderr_thread.join(timeout=1)
+        ok = code == 0 and not self.failed and self.bytes_fed > 0
+        if not ok and self.logger:
+            detail = self._stderr_tail[-1] if self._stderr_tail else f"exit {code}"
+            self.logger.warning(f"[Pipe] ffmpeg 串流轉檔失敗: {detail}")
+        return ok
+
+    def abort(self):
+        """放棄串流轉檔並刪除不完整的輸出檔"""
+        self.failed = True
+        if self._proc is not None:
+            try: self._proc.kill()
+            except OSError: pass
+            try: self._proc.wait(timeout=5)
+            except subprocess.TimeoutExpired: pass
+        try:
+            if os.path.exists(self.output_path): os.remove(self.output_path)
+        except OSError:
+            pass
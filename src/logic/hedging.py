@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# src/logic/hedging.py
+# [VibeCoding] Hedged Requests: 片段超過近期 p95 延遲仍未完成時，再送一個對沖請求 (可指向備援 CDN)
+
+import threading
+from itertools import count
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+
+class HedgePolicy:
+    """
+    決定何時、往哪裡送出對沖請求
+    - 等待時間 = 控制器觀測到的 p95 延遲 (樣本不足時不對沖)，最短 min_delay 秒
+    - 對沖預算：對沖次數不超過請求數的 max_ratio (另給 burst 次起步額度)，避免壅塞時放大流量
+    - mirrors: {主機: [備援主機, ...]}，對沖請求輪流改打備援主機；沒有設定時打原網址 (換一條連線)
+    """
+    def __init__(self, enabled: bool = True, max_ratio: float = 0.05, min_delay: float = 0.2,
+                 burst: int = 2, mirrors: Optional[Dict[str, List[str]]] = None):
+        self.enabled = enabled
+        self.max_ratio = max_ratio
+        self.min_delay = min_delay
+        self.burst = burst
+        self.mirrors = {host.lower(): list(alts) for host, alts in (mirrors or {}).items() if alts}
+        self._lock = threading.Lock()
+        self._rotation = count()
+        self.hedges = 0      # 送出的對沖請求數
+        self.wins = 0        # 對沖請求先完成的次數
+
+    def delay(self, controller) -> Optional[float]:
+        """主請求要等多久才對沖；None = 不對沖"""
+        if not self.enabled: return None
+        p95 = controller.latency_quantile(0.95)
+        return None if p95 is None else max(p95, self.min_delay)
+
+    def try_start(self, controller) -> bool:
+        """取得一次對沖額度"""
+        with self._lock:
+            if self.hedges >= controller.total_requests * self.max_ratio + self.burst: return False
+            self.hedges += 1
+            return True
+
+    def record_win(self):
+        with self._lock:
+            self.wins += 1
+
+    def alternate_url(self, url: str) -> str:
+        parts = urlsplit(url)
+        alts = self.mirrors.get(parts.netloc.lower())
+        if not alts: return url
+        return urlunsplit(parts._replace(netloc=alts[next(self._rotation) % len(alts)]))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hedges": self.hedges, "wins": self.wins}
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# src/logic/hls_variants.py
+# [VibeCoding] Master Playlist 解析：畫質選擇策略 + EXT-X-MEDIA 獨立音軌
+
+from typing import Optional
+
+# 選擇策略
+POLICY_MAX_BANDWIDTH = "max_bandwidth"    # 最高位元率 (BrowserDownloader 原本的做法)
+POLICY_RESOLUTION_CAP = "resolution_cap"  # 不超過指定高度 (例如 1080) 中最好的
+POLICY_THROUGHPUT = "throughput"          # 實測頻寬能負擔的最高位元率
+
+
+def _bandwidth(variant) -> int:
+    info = variant.stream_info
+    return (info.bandwidth or info.average_bandwidth or 0) if info else 0
+
+
+def _height(variant) -> int:
+    info = variant.stream_info
+    if info and info.resolution:
+        return info.resolution[1]
+    return 0
+
+
+def select_variant(master, policy: str = POLICY_MAX_BANDWIDTH, max_height: Optional[int] = None,
+                   throughput_bps: Optional[float] = None, headroom: float = 0.8):
+    """
+    從 master playlist 挑出一個 variant
+    - resolution_cap: 只考慮高度 <= max_height 的 (未標解析度者視為符合)
+    - throughput    : 只考慮 BANDWIDTH <= 實測頻寬 (bit/s) * headroom 的
+    條件都不符時退回最低位元率，確保至少能下載
+    """
+    variants = [v for v in master.playlists if v.uri]
+    if not variants: return None
+    ranked = sorted(variants, key=lambda v: (_bandwidth(v), _height(v)))
+
+    candidates = ranked
+    if policy == POLICY_RESOLUTION_CAP and max_height:
+        candidates = [v for v in ranked if _height(v) <= max_height]
+    elif policy == POLICY_THROUGHPUT and throughput_bps:
+        budget = throughput_bps * headroom
+        candidates = [v for v in ranked if _bandwidth(v) <= budget]
+
+    return candidates[-1] if candidates else ranked[0]
+
+
+def find_audio_rendition(master, variant):
+    """
+    找出 variant 對應的獨立音軌 (EXT-X-MEDIA TYPE=AUDIO 且有 URI)
+    優先 DEFAULT=YES，其次 AUTOSELECT=YES，再其次第一個
+    """
+    group_id = variant.stream_info.audio if variant.stream_info else None
+    if not group_id: return None
+    renditions = [m for m in master.media if m.type == "AUDIO" and m.group_id == group_id and m.uri]
+    if not renditions: return None
+    for attr in ("default", "autoselect"):
+        for m in renditions:
+            if (getattr(m, attr) or "").upper() == "YES":
+                return m
+    return renditions[0]
+
+
+def describe_variant(variant) -> str:
+    h = _height(variant)
+    bw = _bandwidth(variant)
+    return f"{h}p @ {bw / 1000:.0f} kbps" if h else f"{bw / 1000:.0f} kbps"
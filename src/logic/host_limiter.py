@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# src/logic/host_limiter.py
+# [VibeCoding] Per-Host Admission: 跨任務、跨引擎的同主機同時請求上限
+
+import threading
+from typing import Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+
+def host_of(url: str) -> str:
+    return urlsplit(url or "").netloc.lower()
+
+
+class HostLimiter:
+    """
+    以主機名稱為單位的同時請求名額
+    - 所有任務、所有引擎的片段請求都要先取得該主機的名額，同一個 CDN 的多個任務共用預算
+    - 不同主機互不影響，各自跑滿
+    - limit <= 0 代表不限制
+    """
+    def __init__(self, default_limit: int = 16):
+        self.default_limit = default_limit
+        self._limits: Dict[str, int] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._cond = threading.Condition()
+
+    def set_default_limit(self, limit: int):
+        with self._cond:
+            self.default_limit = limit
+            self._cond.notify_all()
+
+    def set_limit(self, host: str, limit: int):
+        with self._cond:
+            self._limits[host.lower()] = limit
+            self._cond.notify_all()
+
+    def limit_for(self, host: str) -> int:
+        return self._limits.get(host, self.default_limit)
+
+    def _available(self, host: str) -> bool:
+        limit = self.limit_for(host)
+        return limit <= 0 or self._in_flight.get(host, 0) < limit
+
+    def try_acquire(self, host: str) -> bool:
+        """不阻塞版本 (asyncio 引擎用)"""
+        with self._cond:
+            if not self._available(host): return False
+            self._in_flight[host] = self._in_flight.get(host, 0) + 1
+            return True
+
+    def acquire(self, host: str, should_stop: Optional[Callable[[], bool]] = None) -> bool:
+        with self._cond:
+            while not self._available(host):
+                if should_stop and should_stop(): return False
+                self._cond.wait(timeout=0.5)
+            self._in_flight[host] = self._in_flight.get(host, 0) + 1
+            return True
+
+    def release(self, host: str):
+        with self._cond:
+            count = self._in_flight.get(host, 0) - 1
+            if count > 0: self._in_flight[host] = count
+            else: self._in_flight.pop(host, None)
+            self._cond.notify_all()
+
+    def in_flight(self, host: str) -> int:
+        with self._cond:
+            return self._in_flight.get(host, 0)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._cond:
+            return dict(self._in_flight)
+
+
+# 全域共用實例 (所有任務共用)
+GLOBAL_HOST_LIMITER = HostLimiter()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# src/logic/key_store.py
+# [VibeCoding] Shared Key Management: 三個引擎共用的 AES 金鑰快取 (支援 EXT-X-KEY 輪換)
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+KeyFetcher = Callable[[str], Optional[bytes]]
+
+AES_KEY_BYTES = 16
+KEY_FETCH_TIMEOUT = 15
+
+
+def parse_iv(iv) -> Optional[bytes]:
+    """EXT-X-KEY 的 IV 屬性 (0x 開頭十六進位) -> 16 bytes"""
+    if not iv: return None
+    if isinstance(iv, bytes): return iv
+    text = iv[2:] if iv.lower().startswith("0x") else iv
+    return bytes.fromhex(text.zfill(32))
+
+
+def fetch_key(session, uri: str, timeout: float = KEY_FETCH_TIMEOUT) -> Optional[bytes]:
+    """
+    以 HTTP 取得 AES-128 金鑰：必須是 200 且剛好 16 bytes，否則回傳 None
+    (403 / 錯誤頁若被當成金鑰存進共用快取，所有引擎都會解密失敗直到被淘汰)
+    """
+    r = session.get(uri, timeout=timeout)
+    content = r.content if r.status_code == 200 else None
+    return content if content and len(content) == AES_KEY_BYTES else None
+
+
+def sequence_iv(media_sequence: int) -> bytes:
+    """未指定 IV 時，依 HLS 規範以 Media Sequence Number 作為 IV (128-bit big-endian)"""
+    return int(media_sequence).to_bytes(16, 'big')
+
+
+def segment_key_plan(playlist) -> List[Tuple[Optional[str], Optional[bytes]]]:
+    """
+    逐片段解析金鑰：回傳 [(key_uri, iv), ...]，與 playlist.segments 一一對應
+    - 依每個片段當下生效的 EXT-X-KEY (支援中途輪換 / METHOD=NONE 關閉加密)
+    - IV 優先取 EXT-X-KEY 的 IV，否則用 EXT-X-MEDIA-SEQUENCE + 片段位置
+    """
+    plan = []
+    base_seq = playlist.media_sequence or 0
+    for i, seg in enumerate(playlist.segments):
+        key = seg.key
+        if not key or not key.uri or (key.method or "").upper() == "NONE":
+            plan.append((None, None))
+            continue
+        seq = getattr(seg, "media_sequence", None)
+        if seq is None: seq = base_seq + i
+        plan.append((key.absolute_uri, parse_iv(key.iv) or sequence_iv(seq)))
+    return plan
+
+
+class KeyStore:
+    """
+    以 URI 為鍵的金鑰快取 (LRU)
+    - 同一把 key 在所有片段 / 所有任務間只下載一次
+    - 同時有多個執行緒要同一把 key 時，只有一個會真正發請求，其餘等待結果
+    """
+    def __init__(self, max_keys: int = 256):
+        self.max_keys = max_keys
+        self._keys: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, threading.Event] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, uri: str, key: bytes):
+        with self._lock:
+            self._keys[uri] = key
+            self._keys.move_to_end(uri)
+            while len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+
+    def peek(self, uri: str) -> Optional[bytes]:
+        with self._lock:
+            return self._keys.get(uri)
+
+    def get(self, uri: str, fetcher: KeyFetcher) -> Optional[bytes]:
+        while True:
+            with self._lock:
+                if uri in self._keys:
+                    self.hits += 1
+                    self._keys.move_to_end(uri)
+                    return self._keys[uri]
+                event = self._inflight.get(uri)
+                if event is None:
+                    # 由本執行緒負責下載
+                    self.misses += 1
+                    event = threading.Event()
+                    self._inflight[uri] = event
+                    owner = True
+                else:
+                    owner = False
+
+            if not owner:
+                event.wait()
+                with self._lock:
+                    if uri in self._keys: continue
+                # 負責下載的執行緒失敗了：不重試，交給呼叫端決定
+                return None
+
+            key = None
+            try:
+                key = fetcher(uri)
+                # 長度不對的內容 (錯誤頁等) 不可進快取，也不交給呼叫端
+                if key and len(key) != AES_KEY_BYTES: key = None
+            finally:
+                if key: self.put(uri, key)
+                with self._lock:
+                    self._inflight.pop(uri, None)
+                event.set()
+            return key
+
+    def key_id(self, uri: str) -> str:
+        key = self.peek(uri)
+        return hashlib.md5(key).hexdigest()[:8] if key else ""
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "keys": len(self._keys)}
+
+
+# 全域共用實例 (所有引擎、所有任務共用)
+GLOBAL_KEY_STORE = KeyStore()
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+# src/logic/memory_budget.py
+# [VibeCoding] Memory Budget: 全程序共用的「在途媒體位元組」預算，取得額度後才能把回應讀進記憶體
+
+import os
+import time
+import asyncio
+import threading
+from typing import Callable, Dict, List, Optional
+
+READ_CHUNK_BYTES = 256 * 1024
+SPOOL_THRESHOLD_BYTES = 8 * 1024 * 1024    # 超過此大小的回應分塊寫到磁碟，不整包留在記憶體
+
+
+class MemoryBudget:
+    """
+    全域記憶體預算 (所有任務、所有引擎共用)
+    - acquire(): 額度不足時阻塞，對抓取端形成反壓；單筆超過上限者等到預算清空後獨自放行，不會永久卡住
+    - try_acquire(): 不阻塞版本 (寫入器的重排緩衝)
+    - acquire_async(): asyncio 版 acquire()，等待時讓出事件迴圈，同樣會觸發 reclaimer
+    - charge(): 不等待直接記帳 (長度未知的回應讀完後補登差額)
+    - 資料離開記憶體 (寫入檔案 / 溢寫 / 丟棄) 時 release()
+    - add_reclaimer(): 登記可釋放的持有者 (例如重排緩衝)；acquire() 需要等待時先請它們溢寫到磁碟，
+      避免「緩衝區佔著預算等隊首片段、隊首片段又等預算」的死結
+    limit <= 0 代表不限制 (仍會統計用量)
+    """
+    def __init__(self, limit_bytes: int = 512 * 1024 * 1024):
+        self._cond = threading.Condition()
+        self.limit = limit_bytes
+        self.used = 0
+        self.peak = 0
+        self.waiting = 0
+        self._reclaimers: List[Callable[[], None]] = []
+
+    def add_reclaimer(self, reclaim: Callable[[], None]):
+        with self._cond:
+            self._reclaimers.append(reclaim)
+
+    def remove_reclaimer(self, reclaim: Callable[[], None]):
+        with self._cond:
+            if reclaim in self._reclaimers: self._reclaimers.remove(reclaim)
+
+    def _reclaim(self):
+        """請登記的持有者釋放記憶體 (呼叫端不可持有 _cond；持有者會各自 release())"""
+        with self._cond:
+            reclaimers = list(self._reclaimers)
+        for reclaim in reclaimers:
+            reclaim()
+
+    def set_limit(self, limit_bytes: int):
+        with self._cond:
+            self.limit = limit_bytes
+            self._cond.notify_all()
+
+    def _fits(self, nbytes: int) -> bool:
+        return self.limit <= 0 or self.used == 0 or self.used + nbytes <= self.limit
+
+    def _take(self, nbytes: int):
+        self.used += nbytes
+        if self.used > self.peak: self.peak = self.used
+
+    def try_acquire(self, nbytes: int) -> bool:
+        with self._cond:
+            if not self._fits(nbytes): return False
+            self._take(nbytes)
+            return True
+
+    def acquire(self, nbytes: int, should_stop: Optional[Callable[[], bool]] = None) -> bool:
+        if self.try_acquire(nbytes): return True
+        self._reclaim()
+        with self._cond:
+            self.waiting += 1
+            try:
+                while not self._fits(nbytes):
+                    if should_stop and should_stop(): return False
+                    if not self._cond.wait(timeout=0.5) and self._reclaimers:
+                        self._cond.release()
+                        try: self._reclaim()
+                        finally: self._cond.acquire()
+            finally:
+                self.waiting -= 1
+            self._take(nbytes)
+            return True
+
+    async def acquire_async(self, nbytes: int, should_stop: Optional[Callable[[], bool]] = None,
+                            poll: float = 0.02) -> bool:
+        """
+        asyncio 版 acquire()：額度不足時 await 等待而不阻塞事件迴圈
+        reclaimer (溢寫重排緩衝) 會寫磁碟，丟到預設執行緒池執行；之後每 0.5 秒仍不足就再觸發一次
+        """
+        if self.try_acquire(nbytes): return True
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._reclaim)
+        with self._cond:
+            self.waiting += 1
+        try:
+            last_reclaim = time.monotonic()
+            while not self.try_acquire(nbytes):
+                if should_stop and should_stop(): return False
+                await asyncio.sleep(poll)
+                if self._reclaimers and time.monotonic() - last_reclaim >= 0.5:
+                    await loop.run_in_executor(None, self._reclaim)
+                    last_reclaim = time.monotonic()
+            return True
+        finally:
+            with self._cond:
+                self.waiting -= 1
+
+    def charge(self, nbytes: int):
+        if nbytes <= 0: return
+        with self._cond:
+            self._take(nbytes)
+
+    def release(self, nbytes: int):
+        if nbytes <= 0: return
+        with self._cond:
+            self.used = max(0, self.used - nbytes)
+            self._cond.notify_all()
+
+    def reset_peak(self):
+        with self._cond:
+            self.peak = self.used
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {"used": self.used, "peak": self.peak, "limit": self.limit, "waiting": self.waiting}
+
+
+class SpooledBody:
+    """已分塊寫到磁碟的大型回應；需要時再逐段讀回"""
+    def __init__(self, path: str, length: int):
+        self.path = path
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def head(self, size: int = 64) -> bytes:
+        return self.read_range(0, size)
+
+    def read_range(self, offset: int, length: int) -> bytes:
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def discard(self):
+        try: os.remove(self.path)
+        except OSError: pass
+
+
+class StalledTransfer(IOError):
+    """傳輸速率低於下限 (連線卡住)"""
+
+
+class RateFloor:
+    """
+    低速偵測：每 window 秒檢查一次該時段的平均速率，低於 min_rate (bytes/s) 就丟出 StalledTransfer
+    完全沒有資料進來的情況由請求的 read timeout 負責
+    """
+    def __init__(self, min_rate: float = 0, window: float = 5.0):
+        self.min_rate = min_rate
+        self.window = window
+        self._start = time.monotonic()
+        self._bytes = 0
+
+    def skip(self, seconds: float):
+        """把刻意等待的時間 (限速) 排除在統計時段外：被限速的連線不算卡住"""
+        self._start += seconds
+
+    def feed(self, nbytes: int):
+        if self.min_rate <= 0: return
+        self._bytes += nbytes
+        now = time.monotonic()
+        span = now - self._start
+        if span < self.window: return
+        if self._bytes / span < self.min_rate:
+            raise StalledTransfer(f"速率過低 ({self._bytes / span / 1024:.1f} KB/s)")
+        self._start, self._bytes = now, 0
+
+
+def iter_blocks(resp):
+    """
+    收到多少就回傳多少 (最多 READ_CHUNK_BYTES)，低速偵測與取消旗標才能在每次收到資料時生效
+    requests (urllib3 2.x) 的 iter_content 會等湊滿 chunk_size 才回傳，改用 raw.read1()；
+    curl_cffi 的 iter_content 本來就依 libcurl 回呼逐塊送出
+    """
+    read1 = getattr(getattr(resp, "raw", None), "read1", None)
+    if read1 is None:
+        yield from resp.iter_content(chunk_size=READ_CHUNK_BYTES)
+        return
+    while True:
+        block = read1(READ_CHUNK_BYTES, decode_content=True)
+        if not block: return
+        yield block
+
+
+def content_length(headers) -> Optional[int]:
+    """Content-Length (有 Content-Encoding 時只是壓縮後大小，僅供估計)"""
+    value = headers.get("Content-Length") if headers else None
+    return int(value) if value and str(value).isdigit() else None
+
+
+def _throttle_block(throttle: Optional[Callable[[int], None]], floor: RateFloor, nbytes: int):
+    """每收到一個區塊就向頻寬限制扣款 (在讀取途中等待，而不是整包讀完才補睡)"""
+    if throttle is None: return
+    start = time.monotonic()
+    throttle(nbytes)
+    floor.skip(time.monotonic() - start)
+
+
+def _spool(chunks, blocks, spool_path: str, should_stop, floor: RateFloor,
+           throttle: Optional[Callable[[int], None]] = None) -> Optional[SpooledBody]:
+    """先寫出已讀到的區塊，再把剩下的串流直接寫入磁碟 (.part -> rename)"""
+    part = spool_path + ".part"
+    length = 0
+    try:
+        with open(part, 'wb') as f:
+            for block in chunks:
+                f.write(block)
+                length += len(block)
+            chunks.clear()
+            for block in blocks:
+                if should_stop and should_stop(): raise InterruptedError
+                floor.feed(len(block))
+                f.write(block)
+                length += len(block)
+                _throttle_block(throttle, floor, len(block))
+    except InterruptedError:
+        os.remove(part)
+        return None
+    except Exception:
+        try: os.remove(part)
+        except OSError: pass
+        raise
+    os.replace(part, spool_path)
+    return SpooledBody(spool_path, length)
+
+
+def read_body(resp, budget: MemoryBudget, should_stop: Optional[Callable[[], bool]] = None,
+              spool_path: Optional[str] = None, spool_threshold: int = SPOOL_THRESHOLD_BYTES,
+              min_rate: float = 0, throttle: Optional[Callable[[int], None]] = None):
+    """
+    以串流方式讀取回應 (需以 stream=True 發出請求)
+    - 先依 Content-Length 向預算取得額度 (不足時阻塞 = 反壓)，再分塊讀入記憶體
+    - 有 spool_path 且回應超過 spool_threshold 時改為分塊寫到磁碟，回傳 SpooledBody 且不佔預算
+    - min_rate > 0 時速率低於下限即中止 (StalledTransfer)；throttle(nbytes) 的等待時間不計入
+    - throttle 有值時每個區塊讀入後呼叫一次 (頻寬限制)
+    回傳 (bytes 或 SpooledBody, 已登記的位元組數)；取消時回傳 (None, 0)
+    """
+    try:
+        length = content_length(resp.headers)
+        blocks = iter_blocks(resp)
+        if spool_path and length is not None and length > spool_threshold:
+            return _spool([], blocks, spool_path, should_stop, RateFloor(min_rate), throttle), 0
+
+        reserved = length if length is not None else READ_CHUNK_BYTES
+        if not budget.acquire(reserved, should_stop): return None, 0
+        floor = RateFloor(min_rate)
+        chunks, size = [], 0
+        try:
+            for block in blocks:
+                if should_stop and should_stop():
+                    budget.release(reserved)
+                    return None, 0
+                floor.feed(len(block))
+                chunks.append(block)
+                size += len(block)
+                _throttle_block(throttle, floor, len(block))
+                if size > reserved:
+                    if spool_path and size > spool_threshold:
+                        body = _spool(chunks, blocks, spool_path, should_stop, floor, throttle)
+                        budget.release(reserved)
+                        return body, 0
+                    # 長度未知 / 解壓後變大：不等待直接補登，避免讀到一半互相卡住
+                    budget.charge(size - reserved)
+                    reserved = size
+        except Exception:
+            budget.release(reserved)
+            raise
+        data = b"".join(chunks)
+        if reserved > size:
+            budget.release(reserved - size)
+        return data, size
+    finally:
+        resp.close()
+
+
+def drop_body(body, reserved: int, budget: Optional[MemoryBudget] = None):
+    """放棄一個已讀取的回應：歸還預算、刪除磁碟暫存"""
+    (budget or GLOBAL_MEMORY_BUDGET).release(reserved)
+    if isinstance(body, SpooledBody): body.discard()
+
+
+# 全域共用實例 (所有任務共用)
+GLOBAL_MEMORY_BUDGET = MemoryBudget()
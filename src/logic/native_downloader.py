@@ -1,28 +1,68 @@
 # src/logic/native_downloader.py
 import os
-import requests
+import json
 import m3u8
 import shutil
 import subprocess
 import time
-import random
 import threading
-from Crypto.Cipher import AES
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Optional, Dict, Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED, TimeoutError as FutureTimeout
+from typing import Optional, Dict, List, Callable
+from urllib.parse import urlsplit
+from src.logic.segment_writer import OrderedSegmentWriter
+from src.logic.resume_journal import ResumeJournal, canonical_playlist_id
+from src.logic.aimd_controller import AIMDController
+from src.logic.key_store import GLOBAL_KEY_STORE, fetch_key, segment_key_plan
+from src.logic.decrypt_pool import GLOBAL_DECRYPT_POOL
+from src.logic.session_pool import GLOBAL_SESSION_POOL, PooledSession
+from src.logic.bandwidth_limiter import GLOBAL_BANDWIDTH
+from src.logic.host_limiter import GLOBAL_HOST_LIMITER, host_of
+from src.logic.ffmpeg_pipe import FFmpegPipe
+from src.logic.segment_validator import CONTAINER_FMP4, check_response, playlist_container
+from src.logic.memory_budget import GLOBAL_MEMORY_BUDGET, SpooledBody, read_body, drop_body
+from src.logic.hedging import HedgePolicy
+from src.logic.cancel_token import CancelToken, abort_response
+from src.logic.profile_lock import ProfileLock, get_profile_lock
+from src.logic.byte_ranges import parse_byterange, segment_byteranges, coalesce_ranges, split_group
+from src.logic.hls_variants import (
+    POLICY_MAX_BANDWIDTH, POLICY_THROUGHPUT, select_variant, find_audio_rendition, describe_variant
+)
 
-# 嘗試引入 curl_cffi，若無則降級使用 requests
-try:
-    from curl_cffi import requests as cffi_requests
-    HAS_CURL_CFFI = True
-except ImportError:
-    HAS_CURL_CFFI = False
+# 各主機最近一次實測的下載速率 (bytes/s)，供 "throughput" 畫質策略使用
+HOST_THROUGHPUT: Dict[str, float] = {}
+
+# fMP4 / CMAF 片段的副檔名 (另以 EXT-X-MAP 判斷)
+FMP4_EXTENSIONS = (".m4s", ".mp4", ".m4v", ".m4a", ".cmfv", ".cmfa")
+
+# 兩個位元組之間最多等待的秒數 (完全卡住的連線)；低速但仍有資料的連線由 stall_min_rate 判斷
+STALL_READ_TIMEOUT = 10
+
+# 續傳暫存資料夾的鎖定檔 (同一清單同時只允許一個任務寫入)
+TEMP_DIR_LOCK = "task.lock"
 
 class NativeHLSDownloader:
-    def __init__(self, logger=None):
+    def __init__(self, logger=None, max_workers: int = 16,
+                 variant_policy: str = POLICY_MAX_BANDWIDTH, max_height: Optional[int] = None,
+                 range_group_bytes: int = 16 * 1024 * 1024, pipe_remux: bool = True,
+                 task_id: Optional[str] = None, hedge: bool = True, stall_min_rate: float = 32 * 1024,
+                 cdn_mirrors: Optional[Dict[str, List[str]]] = None, cancel_token: Optional[CancelToken] = None):
         self.logger = logger
-        self.is_cancelled = False
+        self.task_id = task_id  # 頻寬限制依任務計算
+        # 取消訊號 (與 DownloadWorker 共用)：等待時直接阻塞在權杖上，串流中的請求在取消時被中斷
+        self.cancel_token = cancel_token or CancelToken()
         self.session = None
+        self.max_workers = max_workers
+        self.range_group_bytes = range_group_bytes  # EXT-X-BYTERANGE 合併後單一請求的上限
+        self.pipe_remux = pipe_remux                # 邊下載邊把片段餵給 ffmpeg (失敗時退回批次轉檔)
+        self.variant_policy = variant_policy
+        self.max_height = max_height
+        self.last_rate_summary = {}
+        # [Hedging] 超過 p95 延遲的片段再送一個對沖請求；低於 stall_min_rate (bytes/s) 的連線直接中止
+        self.hedge = HedgePolicy(enabled=hedge, mirrors=cdn_mirrors)
+        self.stall_min_rate = stall_min_rate
+        self._attempts = None
+        self._attempts_lock = threading.Lock()
+        self._temp_locks: List[ProfileLock] = []   # 本任務佔用中的續傳暫存資料夾
         # 偽裝成真實瀏覽器的 Headers
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
@@ -32,236 +72,786 @@ class NativeHLSDownloader:
             "Referer": "https://www.google.com/"
         }
 
+    @property
+    def is_cancelled(self) -> bool:
+        return self.cancel_token.cancelled
+
     def stop(self):
-        self.is_cancelled = True
+        self.cancel_token.cancel()
+
+    def _sleep(self, seconds: float):
+        """可被取消的等待 (stop() 會立即喚醒)"""
+        self.cancel_token.wait(seconds)
 
     def _get_session(self):
+        # [Session Pool] 任務自己的 Headers + 全域連線池：每條執行緒各用一個 Session，連線跨任務重用
         if self.session: return self.session
-        if HAS_CURL_CFFI:
-            # 隨機切換一點指紋版本
-            self.session = cffi_requests.Session(impersonate="chrome120")
-        else:
-            self.session = requests.Session()
-        self.session.headers.update(self.headers)
+        self.session = PooledSession(GLOBAL_SESSION_POOL, self.headers)
         return self.session
 
     def download(self, m3u8_url: str, output_path: str, headers: Dict = None, page_url: str = None, progress_callback: Callable = None) -> bool:
         """
-        主下載邏輯：智能兩段式變速 (Hybrid Mode - Optimized for Stability)
-        Phase 1: 穩健衝刺 (8線程 + 微延遲，避免觸發 800 片段限制)
-        Phase 2: 持久補漏 (抗壓模式)
+        主下載邏輯：自適應併發 (AIMD)
+        併發數依延遲 / 403 / 429 / 5xx / Retry-After 即時增減，殘留片段在下一輪依控制器建議冷卻後補抓
+        Master playlist 會先依 variant_policy 挑選畫質，獨立音軌 (EXT-X-MEDIA) 平行下載後再合併
         """
         session = self._get_session()
         if headers: session.headers.update(headers)
         if page_url: session.headers["Referer"] = page_url
 
-        temp_dir = os.path.join(os.path.dirname(output_path), "_temp_" + str(int(time.time())))
-        if not os.path.exists(temp_dir): os.makedirs(temp_dir)
-
         try:
             self.logger.info(f"[Native] 解析 M3U8: {m3u8_url}")
-            r = session.get(m3u8_url, timeout=15)
-            if r.status_code != 200:
-                self.logger.error(f"[Native] M3U8 讀取失敗: {r.status_code}")
-                return False
+            playlist = self._load_playlist(session, m3u8_url)
+            if playlist is None: return False
+
+            audio_url, audio_playlist = None, None
+            if playlist.is_variant:
+                m3u8_url, playlist, audio_url, audio_playlist = self._resolve_variant(session, m3u8_url, playlist)
+                if playlist is None: return False
 
-            playlist = m3u8.loads(r.text)
             if not playlist.segments:
                 self.logger.error("[Native] M3U8 中沒有影片片段")
                 return False
 
-            # --- 處理加密 Key ---
-            key = None
-            iv = None
-            if playlist.keys and playlist.keys[0] and playlist.keys[0].uri:
-                key_obj = playlist.keys[0]
-                key_uri = key_obj.uri
-                if not key_uri.startswith(('http', 'https')):
-                    base_uri = m3u8_url.rsplit('/', 1)[0]
-                    key_uri = f"{base_uri}/{key_uri}"
-
-                self.logger.info(f"[Native] 下載金鑰: {key_uri}")
-                key_r = session.get(key_uri, timeout=15)
-                if key_r.status_code == 200:
-                    key = key_r.content
-                    if key_obj.iv:
-                        iv = bytes.fromhex(key_obj.iv.replace("0x", ""))
-                else:
+            # 獨立音軌與影片平行下載
+            audio_result = {}
+            audio_thread = None
+            if audio_playlist is not None:
+                def _audio_job():
+                    audio_result["res"] = self._download_media_playlist(session, audio_url, audio_playlist, output_path, "音軌", None)
+                audio_thread = threading.Thread(target=_audio_job, daemon=True)
+                audio_thread.start()
+
+            # 有獨立音軌時需要兩個輸入一起封裝，只能等下載完再批次轉檔
+            pipe_output = output_path if self.pipe_remux and audio_playlist is None else None
+            video_res = self._download_media_playlist(session, m3u8_url, playlist, output_path, "影片",
+                                                      progress_callback, pipe_output)
+            if audio_thread: audio_thread.join()
+            if not video_res: return False
+
+            audio_res = audio_result.get("res")
+            if audio_thread and not audio_res:
+                self.logger.warning("[Native] ⚠️ 獨立音軌下載失敗，僅輸出影片軌")
+
+            key_stats = GLOBAL_KEY_STORE.stats()
+            self.logger.info(f"[Native] 🔑 KeyStore: 命中 {key_stats['hits']} / 未命中 {key_stats['misses']} / 快取 {key_stats['keys']} 把")
+            pool_stats = GLOBAL_SESSION_POOL.stats()
+            if pool_stats['reuse_ratio'] is not None:
+                self.logger.info(f"[Native] 🔌 連線池: {pool_stats['requests']} 請求 / {pool_stats['handshakes']} 次新建連線 | "
+                                 f"重用率 {pool_stats['reuse_ratio']:.1%} | Session {pool_stats['sessions']} 個")
+            else:
+                self.logger.info(f"[Native] 🔌 連線池: {pool_stats['requests']} 請求 | Session {pool_stats['sessions']} 個")
+
+            if video_res[2]:
+                self.logger.info("[Native] 🚰 串流轉檔已同步完成 (略過批次轉檔)")
+                success = True
+            elif video_res[0].endswith(".mp4") and not audio_res:
+                # [fMP4] init + 片段直接串接就是可播放的 Fragmented MP4，不必再跑一次 ffmpeg
+                if os.path.exists(output_path): os.remove(output_path)
+                os.replace(video_res[0], output_path)
+                self.logger.info("[Native] 🎞️ fMP4 片段已直接串接為 MP4 (略過轉檔)")
+                success = True
+            else:
+                if progress_callback: progress_callback(99.5, "正在修復轉檔...")
+                success = self._convert_to_mp4(video_res[0], output_path, audio_res[0] if audio_res else None)
+
+            if success:
+                self._release_temp_dirs()
+                for res in (video_res, audio_res):
+                    if res:
+                        try: shutil.rmtree(res[1], ignore_errors=True)
+                        except: pass
+
+            return success
+
+        except Exception as e:
+            self.logger.error(f"[Native] 錯誤: {e}", exc_info=True)
+            return False
+        finally:
+            # 輸掉的對沖請求可能還在等 read timeout，不必等它們
+            if self._attempts: self._attempts.shutdown(wait=False)
+            self._release_temp_dirs()
+
+    def _claim_temp_dir(self, temp_dir: str) -> Optional[str]:
+        """
+        續傳暫存資料夾一次只給一個任務 (跨程序鎖，鎖定檔放在資料夾內)
+        同一清單已有其他任務在下載時，改用本任務專屬的資料夾，不共用 merged.ts / 日誌
+        """
+        suffix = self.task_id[:8] if self.task_id else f"{os.getpid()}_{id(self):x}"
+        for candidate in (temp_dir, f"{temp_dir}_{suffix}"):
+            if not os.path.exists(candidate): os.makedirs(candidate)
+            lock = get_profile_lock(os.path.join(candidate, TEMP_DIR_LOCK))
+            if lock.try_acquire():
+                self._temp_locks.append(lock)
+                return candidate
+            self.logger.info(f"[Native] 暫存資料夾使用中 (另一個任務正在下載同一清單): {candidate}")
+        return None
+
+    def _release_temp_dirs(self):
+        """刪除暫存資料夾前 / 任務結束時釋放 (Windows 上鎖定檔開著就刪不掉)"""
+        locks, self._temp_locks = self._temp_locks, []
+        for lock in locks:
+            lock.release()
+
+    def _load_playlist(self, session, url):
+        r = session.get(url, timeout=15)
+        if r.status_code != 200:
+            self.logger.error(f"[Native] M3U8 讀取失敗: {r.status_code}")
+            return None
+        return m3u8.loads(r.text, uri=url)
+
+    def _resolve_variant(self, session, master_url, master):
+        """Master playlist -> (媒體清單網址, 媒體清單, 音軌網址, 音軌清單)"""
+        throughput_bps = None
+        if self.variant_policy == POLICY_THROUGHPUT:
+            throughput_bps = self._measure_throughput(session, master_url, master)
+
+        variant = select_variant(master, self.variant_policy, self.max_height, throughput_bps)
+        if variant is None:
+            self.logger.error("[Native] Master playlist 中沒有可用的畫質")
+            return master_url, None, None, None
+
+        self.logger.info(f"[Native] 🎚️ 畫質選擇 ({self.variant_policy}): {describe_variant(variant)} / 共 {len(master.playlists)} 種")
+        media_url = variant.absolute_uri
+        media = self._load_playlist(session, media_url)
+
+        audio_url, audio_playlist = None, None
+        rendition = find_audio_rendition(master, variant)
+        if rendition is not None:
+            audio_url = rendition.absolute_uri
+            audio_playlist = self._load_playlist(session, audio_url)
+            if audio_playlist is not None:
+                self.logger.info(f"[Native] 🔊 偵測到獨立音軌: {rendition.name or rendition.group_id} ({rendition.language or '-'})")
+        return media_url, media, audio_url, audio_playlist
+
+    def _measure_throughput(self, session, master_url, master) -> Optional[float]:
+        """取得實測頻寬 (bit/s)：優先使用同主機歷史紀錄，否則下載最低畫質的第一個片段測速"""
+        host = urlsplit(master_url).netloc
+        if host in HOST_THROUGHPUT:
+            return HOST_THROUGHPUT[host] * 8
+        try:
+            lowest = min((v for v in master.playlists if v.uri), key=lambda v: v.stream_info.bandwidth or 0)
+            probe = self._load_playlist(session, lowest.absolute_uri)
+            if probe is None or not probe.segments: return None
+            first_range = segment_byteranges(probe)[0]
+            req_headers = {"Range": f"bytes={first_range[0]}-{sum(first_range) - 1}"} if first_range else None
+            start = time.time()
+            r = session.get(probe.segments[0].absolute_uri, headers=req_headers, timeout=15)
+            elapsed = time.time() - start
+            if r.status_code not in (200, 206) or elapsed <= 0: return None
+            bps = len(r.content) * 8 / elapsed
+            self.logger.info(f"[Native] 📶 實測頻寬: {bps / 1e6:.1f} Mbps")
+            return bps
+        except Exception:
+            return None
+
+    def _download_media_playlist(self, session, m3u8_url, playlist, output_path, label, progress_callback,
+                                 pipe_output: Optional[str] = None):
+        """
+        下載單一媒體清單並依序寫入 merged.ts (fMP4 清單則為 merged.mp4，init segment 佔第 0 格)
+        pipe_output 有值時同步把片段餵給 ffmpeg 直接產出該 MP4
+        成功回傳 (合併檔, temp_dir, 串流轉檔是否成功)，失敗回傳 None (暫存資料夾保留供續傳)
+        """
+        # [Live] 沒有 EXT-X-ENDLIST 的清單是直播：改用滑動視窗錄製
+        if not playlist.is_endlist and (playlist.playlist_type or "").upper() != "VOD":
+            return self._record_live(session, m3u8_url, playlist, output_path, label, progress_callback, pipe_output)
+
+        pipe = None
+        try:
+            # [Resume] 暫存資料夾改以正規化播放清單命名 (不含 query token)，重啟後可接續
+            # 同一檔案的 BYTERANGE 子區段 URI 相同，需帶上區段資訊才能區分
+            playlist_id = canonical_playlist_id(
+                m3u8_url, [seg.uri + (f"#{seg.byterange}" if seg.byterange else "") for seg in playlist.segments]
+            )
+            temp_dir = self._claim_temp_dir(os.path.join(os.path.dirname(output_path), f"_native_{playlist_id[:16]}"))
+            if temp_dir is None:
+                self.logger.error(f"[Native] {label}暫存資料夾皆被佔用，無法下載")
+                return None
+
+            # --- 處理加密 Key (逐片段，支援 EXT-X-KEY 輪換；共用 KeyStore 快取) ---
+            key_plan = segment_key_plan(playlist)
+            for key_uri in dict.fromkeys(u for u, _ in key_plan if u):
+                if GLOBAL_KEY_STORE.peek(key_uri) is None:
+                    self.logger.info(f"[Native] 下載金鑰: {key_uri}")
+                if not GLOBAL_KEY_STORE.get(key_uri, lambda u: self._fetch_key(session, u)):
                     self.logger.error(f"[Native] Key 下載失敗")
-                    return False
+                    return None
 
             # --- 準備任務 ---
-            base_uri = m3u8_url.rsplit('/', 1)[0]
-            all_tasks = []
-            
+            # [fMP4] init segment 當作第 0 個任務，與其他片段共用重試 / BYTERANGE 合併
+            is_fmp4 = self._is_fmp4(playlist)
+            if is_fmp4 and not self._fmp4_supported(playlist, label): return None
+            init_task = self._init_task(session, playlist, key_plan) if is_fmp4 else None
+            offset = 1 if init_task else 0
+            all_tasks = [init_task] if init_task else []
+            byteranges = segment_byteranges(playlist)
+
             for i, seg in enumerate(playlist.segments):
-                seg_url = seg.uri
-                if not seg_url.startswith(('http', 'https')):
-                    seg_url = f"{base_uri}/{seg_url}"
-                
-                current_iv = iv
-                if key and not current_iv:
-                    seq_num = seg.media_sequence if seg.media_sequence else i
-                    current_iv = seq_num.to_bytes(16, 'big')
-
-                fname = f"seg_{i:05d}.ts"
-                fpath = os.path.join(temp_dir, fname)
-                all_tasks.append((seg_url, fpath, key, current_iv))
+                key_uri, current_iv = key_plan[i]
+                key = GLOBAL_KEY_STORE.get(key_uri, lambda u: self._fetch_key(session, u)) if key_uri else None
+                key_id = GLOBAL_KEY_STORE.key_id(key_uri) if key_uri else ""
+                all_tasks.append((seg.absolute_uri, i + offset, key, current_iv, key_id, byteranges[i]))
 
             total_segs = len(all_tasks)
-            self.logger.info(f"[Native] 任務準備就緒: {total_segs} 片段。啟動智能變速引擎 (穩健版)...")
 
-            # --- 智能變速迴圈 ---
-            round_idx = 0
-            consecutive_no_progress = 0
-            
+            # [Streaming Merge] 片段完成即依序寫入合併檔，不再產生 seg_XXXXX.ts 再二次合併
+            merged_path = os.path.join(temp_dir, "merged.mp4" if init_task else "merged.ts")
+            journal = ResumeJournal(temp_dir, playlist_id, total_segs)
+            writer = OrderedSegmentWriter(merged_path, total_segs, spill_dir=temp_dir, journal=journal,
+                                          key_ids=[task[4] for task in all_tasks])
+            if writer.resumed_count:
+                self.logger.info(f"[Native] 🔁 續傳: 日誌中已有 {writer.resumed_count}/{total_segs} 片段，只下載缺少的部分")
+            if pipe_output and not init_task:
+                pipe = self._open_pipe(writer, pipe_output)
+            self.logger.info(f"[Native] {label}任務準備就緒: {total_segs} 片段。啟動自適應併發引擎...")
+
+            # --- 自適應併發迴圈 (AIMD) ---
+            # 不再使用固定檔位：併發數由控制器依延遲、403/429/5xx 與 Retry-After 即時調整
+            host = urlsplit(m3u8_url).netloc
+            controller = AIMDController(initial=4, max_limit=self.max_workers)
+            # 網路執行緒只搬運位元組，解密 / 清洗交給共用解密池
+            tracker = GLOBAL_DECRYPT_POOL.new_tracker(CONTAINER_FMP4 if init_task else playlist_container(playlist))
+            self._run_rounds(session, all_tasks, writer, tracker, controller, label, progress_callback)
+
+            if self.is_cancelled:
+                tracker.wait(timeout=5)
+            if tracker.stripped_packets:
+                self.logger.info(f"[Native] 🧽 {label}清洗: 共移除 {tracker.stripped_packets} 個偽裝封包")
+
+            stats = controller.summary()
+            self.last_rate_summary = dict(stats, host=host)
+            if stats['bytes_per_sec'] > 0: HOST_THROUGHPUT[host] = stats['bytes_per_sec']
+            self.logger.info(
+                f"[Native] 📈 AIMD 收斂 ({host}): 併發 {stats['limit']} (峰值 {stats['peak_limit']}) | "
+                f"{stats['req_per_sec']:.1f} 片段/s | {stats['bytes_per_sec'] / 1024 / 1024:.2f} MB/s | "
+                f"延遲 {stats['latency']:.2f}s | 錯誤率 {stats['error_rate']:.1%}"
+            )
+            hedge_stats = self.hedge.stats()
+            if hedge_stats['hedges']:
+                self.logger.info(f"[Native] 🪝 對沖請求: 送出 {hedge_stats['hedges']} 次，其中 {hedge_stats['wins']} 次先完成")
+
+            if self.is_cancelled:
+                if pipe: pipe.abort()
+                writer.abort()
+                return None
+
+            # --- 收尾 ---
+            final_count = writer.done_count
+            if init_task and not writer.is_done(0):
+                self.logger.error(f"[Native] 嚴重失敗: {label} init segment 下載失敗，無法輸出 MP4")
+                writer.abort()
+                return None
+            if final_count < total_segs:
+                self._report_gaps(all_tasks, writer, tracker, output_path, label)
+                if final_count > total_segs * 0.8:
+                    self.logger.warning(f"[Native] 警告: 仍有缺片 ({final_count}/{total_segs})，強行合併...")
+                else:
+                    self.logger.error(f"[Native] 嚴重失敗: {label}缺片過多，放棄合併")
+                    if pipe: pipe.abort()
+                    writer.abort()
+                    return None
+
+            writer.finish(allow_gaps=True)
+            return merged_path, temp_dir, self._close_pipe(pipe)
+
+        except Exception as e:
+            if pipe: pipe.abort()
+            self.logger.error(f"[Native] {label}下載錯誤: {e}", exc_info=True)
+            return None
+
+    def _run_rounds(self, session, all_tasks, writer, tracker, controller, label, progress_callback):
+        """
+        自適應併發迴圈 (AIMD)：每輪把尚未完成的任務丟進執行緒池，殘留的依控制器建議冷卻後補抓
+        連續 5 輪毫無進展視為被封鎖；子類別可覆寫此方法改用其他 I/O 模型
+        """
+        total_segs = len(all_tasks)
+        round_idx = 0
+        consecutive_no_progress = 0
+        futures = []
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
             while True:
                 if self.is_cancelled: break
                 round_idx += 1
-                
-                # 1. 找出未完成的任務
-                pending = [t for t in all_tasks if not (os.path.exists(t[1]) and os.path.getsize(t[1]) > 0)]
-                
+
+                # 1. 找出未完成的任務 (直接查詢寫入器狀態，不再掃描磁碟)
+                pending = [t for t in all_tasks if not writer.is_done(t[1])]
+
                 if not pending:
-                    self.logger.info("[Native] 所有片段下載完成！")
+                    self.logger.info(f"[Native] {label}所有片段下載完成！")
                     break
 
-                # 2. 智能檔位切換 (Intelligent Gear Shift) - [TWEAKED]
-                if round_idx == 1:
-                    # === R1: 穩健衝刺 (Steady Blitz) ===
-                    # [修改] 降速以求穩。16線程->8線程，0延遲->0.1s延遲
-                    # 這樣通常能繞過 "800片段" 的觸發閾值
-                    workers = 8           
-                    sleep_time = 0.1      
-                    timeout = 15
-                    mode_name = "🚄 穩健衝刺"
-                else:
-                    # === R2+: 抗壓補漏 (Endurance Mode) ===
-                    workers = 3           
-                    sleep_time = 1.5      
-                    timeout = 30
-                    mode_name = "🛡️ 抗壓補漏"
-                    
-                    cooldown = min(10 + (round_idx * 5), 60)
-                    self.logger.warning(f"[Native] {mode_name}: 檢測到 R{round_idx-1} 有殘留 ({len(pending)}個)，休息 {cooldown} 秒避風頭...")
-                    time.sleep(cooldown)
-
-                self.logger.info(f"[Native] 第 {round_idx} 輪: {mode_name} | 線程: {workers} | 剩餘: {len(pending)}")
-
-                # 3. 執行下載
-                success_in_this_round = 0
-                with ThreadPoolExecutor(max_workers=workers) as executor:
-                    futures = {
-                        executor.submit(
-                            self._download_segment_core, 
-                            t[0], t[1], t[2], t[3], session, sleep_time, timeout
-                        ): t[1] for t in pending
-                    }
-                    
-                    completed_so_far = 0
-                    for future in as_completed(futures):
-                        if self.is_cancelled: break
-                        if future.result():
-                            success_in_this_round += 1
-                        
-                        completed_so_far += 1
-                        current_total_done = total_segs - len(pending) + success_in_this_round
-                        if progress_callback:
-                            percent = (current_total_done / total_segs) * 99
-                            mode_icon = "🚄" if round_idx == 1 else "🛡️"
-                            msg = f"{mode_icon} {current_total_done}/{total_segs} (R{round_idx})"
-                            progress_callback(percent, msg)
-
-                # 4. 死局判斷
-                if success_in_this_round > 0:
+                if round_idx > 1:
+                    cooldown = controller.cooldown()
+                    self.logger.warning(f"[Native] 🛡️ R{round_idx-1} 有殘留 ({len(pending)}個)，併發降至 {controller.limit}，休息 {cooldown:.1f} 秒...")
+                    self._sleep(cooldown)
+                    if self.is_cancelled: break
+
+                timeout = 15 if round_idx == 1 else 30
+                self.logger.info(f"[Native] 第 {round_idx} 輪 | 併發上限: {controller.limit} | 剩餘: {len(pending)}")
+
+                # 2. 執行下載 (每個請求先向控制器取得名額)
+                # [ByteRange] 同一檔案中相鄰的子區段合併成一個 Range 請求，回來後再切回各片段
+                done_before = writer.done_count
+                groups = coalesce_ranges(
+                    [(t[0], t[5][0], t[5][1], t) for t in pending if t[5]], self.range_group_bytes
+                )
+                if groups:
+                    self.logger.info(f"[Native] 🧩 位元組區段合併: {sum(len(g.members) for g in groups)} 片段 -> {len(groups)} 個請求")
+                futures = [
+                    executor.submit(
+                        self._download_segment_core,
+                        t[0], t[1], t[2], t[3], t[4], session, controller, timeout, writer, tracker
+                    ) for t in pending if not t[5]
+                ] + [
+                    executor.submit(
+                        self._download_range_group_core, g, session, controller, timeout, writer, tracker
+                    ) for g in groups
+                ]
+
+                for future in as_completed(futures):
+                    if self.is_cancelled: break
+
+                    current_total_done = writer.done_count
+                    if progress_callback:
+                        percent = (current_total_done / total_segs) * 99
+                        msg = f"⚡x{controller.limit} {current_total_done}/{total_segs} (R{round_idx})"
+                        progress_callback(percent, msg)
+
+                # 等解密池把本輪片段處理完，寫入器狀態才準確
+                while not self.is_cancelled and not tracker.wait(timeout=0.5): pass
+
+                # 3. 死局判斷
+                if writer.done_count > done_before:
                     consecutive_no_progress = 0
                 else:
                     consecutive_no_progress += 1
-                
-                if consecutive_no_progress >= 5 and round_idx > 1:
+
+                if consecutive_no_progress >= 5:
                     self.logger.error("[Native] IP 可能已被永久封鎖，停止任務。")
                     break
 
-            if self.is_cancelled: return False
+            if self.is_cancelled:
+                for f in futures: f.cancel()
 
-            # --- 合併與轉檔 ---
-            final_count = len([t for t in all_tasks if os.path.exists(t[1]) and os.path.getsize(t[1]) > 0])
-            if final_count < total_segs:
-                if final_count > total_segs * 0.8:
-                    self.logger.warning(f"[Native] 警告: 仍有缺片 ({final_count}/{total_segs})，強行合併...")
-                else:
-                    self.logger.error(f"[Native] 嚴重失敗: 缺片過多，放棄合併")
-                    return False
-
-            files = [t[1] for t in all_tasks if os.path.exists(t[1])]
-            merged_ts = os.path.join(temp_dir, "merged.ts")
-            with open(merged_ts, 'wb') as outfile:
-                for f in files:
-                    with open(f, 'rb') as infile: shutil.copyfileobj(infile, outfile)
-
-            if progress_callback: progress_callback(99.5, "正在修復轉檔...")
-            success = self._convert_to_mp4(merged_ts, output_path)
-            
-            try: shutil.rmtree(temp_dir, ignore_errors=True)
-            except: pass
-            
-            return success
+    def _report_gaps(self, all_tasks, writer, tracker, output_path, label):
+        """把仍缺少的片段 (index / URL / 最後一次失敗原因) 寫成 <輸出檔>_<label>_gaps.json 並記錄在日誌"""
+        gaps = [
+            {"index": t[1], "url": t[0], "reason": tracker.invalid.get(t[1], "下載失敗")}
+            for t in all_tasks if not writer.is_done(t[1])
+        ]
+        for gap in gaps[:10]:
+            self.logger.warning(f"[Native] 🕳️ {label}缺片 #{gap['index']}: {gap['reason']}")
+        if len(gaps) > 10:
+            self.logger.warning(f"[Native] 🕳️ {label}另有 {len(gaps) - 10} 個缺片")
+        report_path = f"{os.path.splitext(output_path)[0]}_{label}_gaps.json"
+        try:
+            with open(report_path, 'w', encoding='utf-8') as f:
+                json.dump(gaps, f, ensure_ascii=False, indent=1)
+            self.logger.info(f"[Native] 缺片清單已寫入: {report_path}")
+        except OSError as e:
+            self.logger.debug(f"[Native] 缺片清單寫入失敗: {e}")
 
-        except Exception as e:
-            self.logger.error(f"[Native] 錯誤: {e}", exc_info=True)
-            return False
+    def _open_pipe(self, writer, pipe_output) -> Optional[FFmpegPipe]:
+        """把 ffmpeg 串流轉檔掛到寫入器上；續傳時前段資料已在合併檔中，改走批次轉檔"""
+        if writer.resumed_count:
+            self.logger.info("[Native] 續傳任務不使用串流轉檔，完成後再批次轉檔")
+            return None
+        pipe = FFmpegPipe(pipe_output, logger=self.logger)
+        if not pipe.start(): return None
+        writer.sink = pipe
+        self.logger.info("[Native] 🚰 串流轉檔啟動: 片段依序寫出時同步餵給 ffmpeg")
+        return pipe
+
+    def _close_pipe(self, pipe) -> bool:
+        if pipe is None: return False
+        if pipe.close(): return True
+        self.logger.warning("[Native] 串流轉檔失敗，改用批次轉檔")
+        return False
 
-    def _download_segment_core(self, url, save_path, key, iv, session, sleep_time, timeout) -> bool:
+    def _record_live(self, session, m3u8_url, playlist, output_path, label, progress_callback,
+                     pipe_output: Optional[str] = None, max_reload_failures: int = 10):
         """
-        核心下載單元
+        直播錄製 (滑動視窗)
+        1. 每隔 target_duration 重新載入清單，只下載新出現的 Media Sequence
+        2. 片段以 sequence - 起始 sequence 作為索引，經解密池後依序串流寫入 merged.ts
+        3. 滑出視窗仍未取得的片段直接跳過；遇到 EXT-X-ENDLIST 或使用者取消時正常收尾
+        直播無法續傳，因此不使用 ResumeJournal；取消時保留已錄製的部分並照常轉檔
         """
-        if sleep_time > 0:
-            time.sleep(random.uniform(sleep_time * 0.8, sleep_time * 1.2))
-        
+        pipe = None
         try:
-            r = session.get(url, timeout=timeout)
-            if r.status_code != 200: return False
-            
-            data = r.content
-
-            # [Fix 1] 移除偽裝頭 (PNG/JPG)
-            if len(data) > 10 and (data.startswith(b'\x89PNG') or data.startswith(b'\xFF\xD8\xFF')):
-                sync_offset = -1
-                for i in range(min(len(data), 4096)):
-                    if data[i] == 0x47 and (i+188 < len(data) and data[i+188] == 0x47):
-                        sync_offset = i
-                        break
-                if sync_offset > 0: data = data[sync_offset:]
-
-            # 解密
-            if key and iv:
-                try:
-                    cipher = AES.new(key, AES.MODE_CBC, iv)
-                    data = cipher.decrypt(data)
-                except: pass
-
-            # [Fix 2] 解密後再次檢查偽裝頭
-            if len(data) > 10 and (data.startswith(b'\x89PNG') or data.startswith(b'\xFF\xD8\xFF')):
-                 sync_offset = -1
-                 for i in range(min(len(data), 4096)):
-                    if data[i] == 0x47 and (i+188 < len(data) and data[i+188] == 0x47):
-                        sync_offset = i
+            first_seq = playlist.media_sequence or 0
+            stamp = time.strftime("%Y%m%d_%H%M%S")
+            temp_dir = os.path.join(os.path.dirname(output_path), f"_live_{stamp}_{first_seq}")
+            if not os.path.exists(temp_dir): os.makedirs(temp_dir)
+            is_fmp4 = self._is_fmp4(playlist)
+            if is_fmp4 and not self._fmp4_supported(playlist, label): return None
+            init_task = self._init_task(session, playlist, segment_key_plan(playlist)) if is_fmp4 else None
+            offset = 1 if init_task else 0
+            merged_path = os.path.join(temp_dir, "merged.mp4" if init_task else "merged.ts")
+            writer = OrderedSegmentWriter(merged_path, None, spill_dir=temp_dir)
+            pipe = self._open_pipe(writer, pipe_output) if pipe_output and not init_task else None
+
+            host = urlsplit(m3u8_url).netloc
+            controller = AIMDController(initial=4, max_limit=self.max_workers)
+            tracker = GLOBAL_DECRYPT_POOL.new_tracker(CONTAINER_FMP4 if init_task else playlist_container(playlist))
+            self.logger.info(f"[Native] 🔴 {label}偵測到直播清單 (無 ENDLIST)，開始錄製 | 起始序號 {first_seq}")
+
+            submitted = {}          # index -> future
+            durations = {}          # index -> 片段秒數
+            reload_failures = 0
+            ended = False
+            start_time = time.time()
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while not self.is_cancelled:
+                    base_seq = playlist.media_sequence or 0
+                    key_plan = segment_key_plan(playlist)
+                    byteranges = segment_byteranges(playlist)
+                    window = {0} if init_task else set()
+                    new_count = 0
+
+                    # init segment 只需要一份 (失敗則下一輪重試)
+                    if init_task and not writer.is_done(0):
+                        future = submitted.get(0)
+                        if future is None or self._failed(future):
+                            submitted[0] = executor.submit(
+                                self._download_range_group_core,
+                                coalesce_ranges([(init_task[0], init_task[5][0], init_task[5][1], init_task)])[0],
+                                session, controller, 30, writer, tracker
+                            ) if init_task[5] else executor.submit(
+                                self._download_segment_core, *init_task[:5], session, controller, 30, writer, tracker
+                            )
+
+                    for i, seg in enumerate(playlist.segments):
+                        idx = base_seq + i - first_seq + offset
+                        if idx < offset: continue
+                        window.add(idx)
+                        durations[idx] = seg.duration or 0
+                        future = submitted.get(idx)
+                        if writer.is_done(idx) or (future is not None and not self._failed(future)):
+                            continue
+                        key_uri, iv = key_plan[i]
+                        key, key_id = None, ""
+                        if key_uri:
+                            key = GLOBAL_KEY_STORE.get(key_uri, lambda u: self._fetch_key(session, u))
+                            key_id = GLOBAL_KEY_STORE.key_id(key_uri)
+                            if key is None:
+                                self.logger.warning(f"[Native] 直播金鑰下載失敗，稍後重試: {key_uri}")
+                                continue
+                        if byteranges[i]:
+                            task = (seg.absolute_uri, idx, key, iv, key_id, byteranges[i])
+                            group = coalesce_ranges([(task[0], task[5][0], task[5][1], task)])[0]
+                            submitted[idx] = executor.submit(
+                                self._download_range_group_core, group, session, controller, 30, writer, tracker
+                            )
+                        else:
+                            submitted[idx] = executor.submit(
+                                self._download_segment_core,
+                                seg.absolute_uri, idx, key, iv, key_id, session, controller, 30, writer, tracker
+                            )
+                        new_count += 1
+
+                    # 已滑出視窗、且確定沒拿到的片段：跳過，讓後續片段可以繼續寫出
+                    for idx, future in list(submitted.items()):
+                        if idx in window or not future.done(): continue
+                        if self._failed(future) and not writer.is_done(idx):
+                            self.logger.warning(f"[Native] ⚠️ 直播片段 #{idx - offset + first_seq} 已滑出視窗，跳過")
+                            writer.skip(idx)
+                        del submitted[idx]
+
+                    if progress_callback:
+                        recorded = sum(d for i, d in durations.items() if writer.is_done(i))
+                        mins, secs = divmod(int(recorded), 60)
+                        progress_callback(50, f"🔴 LIVE 已錄製 {mins:02d}:{secs:02d} | 片段 {writer.done_count} | ⚡x{controller.limit}")
+
+                    if playlist.is_endlist:
+                        ended = True
+                        self.logger.info(f"[Native] 🏁 {label}直播已結束 (EXT-X-ENDLIST)")
                         break
-                 if sync_offset > 0: data = data[sync_offset:]
 
-            with open(save_path, 'wb') as f: f.write(data)
-            return True
-        except:
+                    # 依 target duration 重新載入；沒有新片段時縮短為一半，避免延遲落後
+                    interval = float(playlist.target_duration or 2)
+                    self._sleep(interval if new_count else interval / 2)
+                    if self.is_cancelled: break
+
+                    try:
+                        refreshed = self._load_playlist(session, m3u8_url)
+                    except Exception as e:
+                        self.logger.debug(f"[Native] 直播清單重新載入失敗: {e}")
+                        refreshed = None
+                    if refreshed is None or refreshed.is_variant:
+                        reload_failures += 1
+                        if reload_failures >= max_reload_failures:
+                            self.logger.error(f"[Native] 直播清單連續 {reload_failures} 次載入失敗，結束錄製")
+                            break
+                        continue
+                    reload_failures = 0
+                    playlist = refreshed
+
+                # 取消時不再等待網路請求；正常結束則等最後一批片段下載完
+                if self.is_cancelled:
+                    for future in submitted.values(): future.cancel()
+
+            tracker.wait(timeout=30)
+            if tracker.stripped_packets:
+                self.logger.info(f"[Native] 🧽 {label}清洗: 共移除 {tracker.stripped_packets} 個偽裝封包")
+
+            stats = controller.summary()
+            self.last_rate_summary = dict(stats, host=host)
+            elapsed = time.time() - start_time
+            reason = "ENDLIST" if ended else ("使用者停止" if self.is_cancelled else "清單失效")
+            self.logger.info(f"[Native] 🔴 {label}錄製結束 ({reason}) | {writer.done_count} 片段 | 歷時 {elapsed:.0f} 秒")
+
+            writer.finish(allow_gaps=True)
+            if writer.done_count <= offset or (init_task and not writer.is_done(0)):
+                if pipe: pipe.abort()
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                return None
+            return merged_path, temp_dir, self._close_pipe(pipe)
+
+        except Exception as e:
+            if pipe: pipe.abort()
+            self.logger.error(f"[Native] {label}直播錄製錯誤: {e}", exc_info=True)
+            return None
+
+    @staticmethod
+    def _is_fmp4(playlist) -> bool:
+        """EXT-X-MAP 或 .m4s / .mp4 片段 -> fMP4 (CMAF)"""
+        for seg in playlist.segments:
+            if getattr(seg, "init_section", None) is not None: return True
+            if urlsplit(seg.uri or "").path.lower().endswith(FMP4_EXTENSIONS): return True
+        return False
+
+    def _fmp4_supported(self, playlist, label) -> bool:
+        """SAMPLE-AES (CENC) 屬於 DRM 範圍，整段 AES-CBC 解不開，交回 yt-dlp 處理"""
+        for key in playlist.keys:
+            method = ((key.method if key else None) or "NONE").upper()
+            if method not in ("NONE", "AES-128"):
+                self.logger.warning(f"[Native] {label}為 {method} 加密的 fMP4，原生引擎不支援")
+                return False
+        maps = {(seg.init_section.absolute_uri, seg.init_section.byterange)
+                for seg in playlist.segments if getattr(seg, "init_section", None) is not None}
+        if len(maps) > 1:
+            self.logger.warning(f"[Native] ⚠️ {label}有 {len(maps)} 個不同的 EXT-X-MAP，只會使用第一個 init segment")
+        return True
+
+    def _init_task(self, session, playlist, key_plan):
+        """建立 init segment 任務 (索引 0)；AES-128 的 init 只有在 EXT-X-KEY 帶 IV 時才加密"""
+        init = next((seg.init_section for seg in playlist.segments if getattr(seg, "init_section", None)), None)
+        if init is None or not init.uri: return None
+        rng = parse_byterange(init.byterange)
+        key, iv, key_id = None, None, ""
+        first = playlist.segments[0]
+        key_uri = key_plan[0][0] if key_plan else None
+        if key_uri and first.key and first.key.iv:
+            key = GLOBAL_KEY_STORE.get(key_uri, lambda u: self._fetch_key(session, u))
+            iv = key_plan[0][1]
+            key_id = GLOBAL_KEY_STORE.key_id(key_uri)
+        return init.absolute_uri, 0, key, iv, key_id, rng
+
+    @staticmethod
+    def _failed(future) -> bool:
+        """已結束但沒有成功取得片段 (回傳 False / 例外 / 被取消)"""
+        if not future.done(): return False
+        if future.cancelled() or future.exception() is not None: return True
+        return not future.result()
+
+    def _fetch_key(self, session, key_uri) -> Optional[bytes]:
+        return fetch_key(session, key_uri)
+
+    def _fetch_body(self, session, url, req_headers, timeout, ok_statuses, spool_path, controller,
+                    lost: Optional[threading.Event] = None):
+        """
+        發出串流請求並記錄到 AIMD 控制器；狀態碼可接受時才在記憶體預算內讀入 body
+        timeout 只限制連線建立；讀取時兩個位元組間最多等 STALL_READ_TIMEOUT 秒，速率低於 stall_min_rate 即中止
+        lost 被設定代表對沖的另一方已先完成：在下一個區塊時放棄，且不計入控制器
+        回傳 (status, headers, body, reserved)；連線錯誤、狀態碼不符或取消時 body 為 None
+        """
+        start = time.time()
+        abandoned = lambda: self.is_cancelled or (lost is not None and lost.is_set())
+        try:
+            r = session.get(url, headers=req_headers, timeout=(timeout, STALL_READ_TIMEOUT), stream=True)
+            body, reserved = None, 0
+            if r.status_code in ok_statuses:
+                # [Memory] 先取得全域記憶體預算才讀入 body (用完時在此等待 = 反壓)；大型回應分塊寫到磁碟
+                # 讀取期間任務被取消時直接中斷連線，不等下一個區塊
+                with self.cancel_token.hook(lambda: abort_response(r)):
+                    # [限速] 每個區塊讀入後就扣頻寬額度，佔著併發名額等待，限速時自然也壓低請求速率
+                    body, reserved = read_body(r, GLOBAL_MEMORY_BUDGET, abandoned, spool_path, min_rate=self.stall_min_rate,
+                                               throttle=lambda n: GLOBAL_BANDWIDTH.throttle(n, self.task_id, self._sleep, abandoned))
+            else:
+                r.close()
+        except Exception as e:
+            if abandoned(): return None, None, None, 0
+            self.logger.debug(f"[Native] 請求失敗 ({url}): {e}")
+            controller.record(time.time() - start, None)
+            return None, None, None, 0
+        if body is None and abandoned(): return None, None, None, 0
+        controller.record(time.time() - start, r.status_code, len(body) if body is not None else 0,
+                          r.headers.get("Retry-After"))
+        return r.status_code, r.headers, body, reserved
+
+    def _attempt_pool(self) -> ThreadPoolExecutor:
+        with self._attempts_lock:
+            if self._attempts is None:
+                self._attempts = ThreadPoolExecutor(max_workers=self.max_workers * 3, thread_name_prefix="Hedge")
+            return self._attempts
+
+    def _fetch_with_hedge(self, session, url, req_headers, timeout, ok_statuses, spool_path, controller):
+        """
+        [Hedging] 主請求超過近期 p95 延遲仍未完成時，再送一個對沖請求 (有設定備援 CDN 時改打備援主機)，取先成功者
+        輸的一方在下一個區塊時放棄並歸還預算；樣本不足或對沖額度用完時等同 _fetch_body
+        """
+        delay = self.hedge.delay(controller)
+        if delay is None:
+            return self._fetch_body(session, url, req_headers, timeout, ok_statuses, spool_path, controller)
+
+        pool = self._attempt_pool()
+        primary_lost = threading.Event()
+        primary = pool.submit(self._fetch_body, session, url, req_headers, timeout, ok_statuses,
+                              spool_path, controller, primary_lost)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeout:
+            pass
+
+        hedge_url = self.hedge.alternate_url(url)
+        hedge_host = host_of(hedge_url)
+        if self.is_cancelled or not self.hedge.try_start(controller) or not GLOBAL_HOST_LIMITER.try_acquire(hedge_host):
+            return primary.result()
+        hedge_lost = threading.Event()
+        hedge = pool.submit(self._fetch_body, session, hedge_url, req_headers, timeout, ok_statuses,
+                            spool_path and spool_path + ".hedge", controller, hedge_lost)
+        hedge.add_done_callback(lambda _: GLOBAL_HOST_LIMITER.release(hedge_host))
+
+        racers = {primary: primary_lost, hedge: hedge_lost}
+        pending = set(racers)
+        winner, fallback = None, None
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result[2] is None:
+                    fallback = fallback or result
+                elif winner is None:
+                    winner = result
+                    if future is hedge: self.hedge.record_win()
+                else:
+                    drop_body(result[2], result[3])   # 兩邊同時完成：多的那份直接丟掉
+
+        # 還沒結束的一方標記為輸家；萬一它仍讀完了 body，完成時丟掉
+        for future in pending:
+            racers[future].set()
+            future.add_done_callback(self._discard_late)
+        return winner or fallback
+
+    @staticmethod
+    def _discard_late(future):
+        _, _, body, reserved = future.result()
+        if body is not None: drop_body(body, reserved)
+
+    def _download_segment_core(self, url, index, key, iv, key_id, session, controller, timeout, writer, tracker) -> bool:
+        """
+        核心下載單元：只負責網路 (取得併發名額 -> 下載)，位元組交給解密池 (清洗 -> 解密 -> 寫入器)
+        併發名額有兩層：任務自己的 AIMD 控制器 + 跨任務共用的同主機上限
+        body 的記憶體預算在解密池交給 writer 之後才歸還
+        """
+        if not controller.acquire(lambda: self.is_cancelled): return False
+        host = host_of(url)
+        if not GLOBAL_HOST_LIMITER.acquire(host, lambda: self.is_cancelled):
+            controller.release()
             return False
+        try:
+            status, resp_headers, body, reserved = self._fetch_with_hedge(
+                session, url, None, timeout, (200,), os.path.join(writer.spill_dir, f"body_{index:05d}.spool"), controller
+            )
+            if body is None: return False
+            # [Integrity] 長度與 Content-Length 不符、狀態 200 的錯誤頁：視為失敗，下一輪只重抓此片段
+            reason = check_response(status, resp_headers, body)
+            if reason:
+                drop_body(body, reserved)
+                tracker.record_invalid(index, reason)
+                self.logger.debug(f"[Native] 片段 #{index} 驗證失敗: {reason}")
+                return False
+        finally:
+            GLOBAL_HOST_LIMITER.release(host)
+            controller.release()
+
+        GLOBAL_DECRYPT_POOL.submit(tracker, index, body, key, iv, key_id, writer, reserved)
+        return True
+
+    def _download_range_group_core(self, group, session, controller, timeout, writer, tracker) -> bool:
+        """
+        一次 Range 請求取回多個相鄰的 BYTERANGE 子區段，切開後逐一交給解密池
+        伺服器忽略 Range 回 200 整檔時，依絕對位置照樣切割；全部子區段都拿到才算成功
+        """
+        if not controller.acquire(lambda: self.is_cancelled): return False
+        host = host_of(group.url)
+        if not GLOBAL_HOST_LIMITER.acquire(host, lambda: self.is_cancelled):
+            controller.release()
+            return False
+        try:
+            spool_path = os.path.join(writer.spill_dir, f"group_{group.members[0][0][1]:05d}.spool")
+            status, resp_headers, body, reserved = self._fetch_with_hedge(
+                session, group.url, {"Range": f"bytes={group.start}-{group.end}"}, timeout, (200, 206), spool_path, controller
+            )
+            if body is None: return False
+            reason = check_response(status, resp_headers, body)
+            if reason:
+                drop_body(body, reserved)
+                for task, _, _ in group.members: tracker.record_invalid(task[1], reason)
+                return False
+        finally:
+            GLOBAL_HOST_LIMITER.release(host)
+            controller.release()
 
-    def _convert_to_mp4(self, ts_path, mp4_path):
+        return self._submit_range_body(group, status, resp_headers, body, writer, tracker, reserved)
+
+    def _submit_range_body(self, group, status, resp_headers, body, writer, tracker, reserved: int = 0) -> bool:
+        """
+        依 Content-Range 把回應切回各子區段交給解密池；任一子區段長度不足即回傳 False
+        切出的子區段各自登記記憶體預算 (磁碟暫存的 body 逐段取得預算再讀回)，整包 body 的預算切完即歸還
+        """
+        body_offset = 0
+        if status == 206:
+            content_range = resp_headers.get("Content-Range", "")
+            try: body_offset = int(content_range.split(" ", 1)[1].split("-", 1)[0])
+            except (IndexError, ValueError): body_offset = group.start
+
+        complete = True
+        try:
+            pieces = self._split_spooled(group, body, body_offset) if isinstance(body, SpooledBody) \
+                else split_group(group, body, body_offset)
+            for task, chunk in pieces:
+                if chunk is None:
+                    complete = False
+                    continue
+                if not isinstance(body, SpooledBody): GLOBAL_MEMORY_BUDGET.charge(len(chunk))
+                GLOBAL_DECRYPT_POOL.submit(tracker, task[1], chunk, task[2], task[3], task[4], writer, len(chunk))
+        finally:
+            drop_body(body, reserved)
+        return complete
+
+    def _split_spooled(self, group, body, body_offset):
+        """磁碟暫存版 split_group：每個子區段先取得記憶體預算再從檔案讀回"""
+        for payload, offset, length in group.members:
+            rel = offset - body_offset
+            if rel < 0 or rel + length > body.length:
+                yield payload, None
+                continue
+            if not GLOBAL_MEMORY_BUDGET.acquire(length, lambda: self.is_cancelled): return
+            yield payload, body.read_range(rel, length)
+
+    def _convert_to_mp4(self, ts_path, mp4_path, audio_path=None):
         ffmpeg_exe = "ffmpeg"
         if os.path.exists("bin/ffmpeg.exe"): ffmpeg_exe = "bin/ffmpeg.exe"
         
-        cmd = [
-            ffmpeg_exe, "-y", "-fflags", "+genpts", "-ignore_unknown",
-            "-i", ts_path, "-c", "copy", "-bsf:a", "aac_adtstoasc", mp4_path
-        ]
+        cmd = [ffmpeg_exe, "-y", "-fflags", "+genpts", "-ignore_unknown", "-i", ts_path]
+        if audio_path:
+            # 獨立音軌：影像取自主檔，聲音取自音軌檔
+            cmd += ["-i", audio_path, "-map", "0:v", "-map", "1:a"]
+        cmd += ["-c", "copy", "-bsf:a", "aac_adtstoasc", mp4_path]
         try:
             startupinfo = subprocess.STARTUPINFO()
             startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
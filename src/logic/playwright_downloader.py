@@ -10,12 +10,28 @@ import logging
 import base64
 import json
 import uuid
-import subprocess
 import random
 import hashlib # [Phase 42] 新增：用於計算數位指紋
-from urllib.parse import urljoin
+import queue
+import threading
+from collections import deque
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
 from typing import Callable, Optional
 from playwright.sync_api import sync_playwright
+from src.logic.key_store import GLOBAL_KEY_STORE, segment_key_plan
+from src.logic.ts_sanitizer import sanitize
+from src.logic.memory_budget import GLOBAL_MEMORY_BUDGET, READ_CHUNK_BYTES, read_body
+from src.logic.cancel_token import CancelToken, abort_response
+from src.logic.session_pool import GLOBAL_SESSION_POOL, PooledSession
+from src.logic.segment_validator import check_response
+from src.logic.native_downloader import STALL_READ_TIMEOUT
+from src.logic.bandwidth_limiter import GLOBAL_BANDWIDTH
+from src.logic.host_limiter import GLOBAL_HOST_LIMITER, host_of
+from src.logic.browser_pool import GLOBAL_BROWSER_POOL
+from src.logic.segment_writer import OrderedSegmentWriter
+from src.logic.profile_lock import get_profile_lock
 
 try:
     from Crypto.Cipher import AES
@@ -23,10 +39,24 @@ try:
 except ImportError:
     HAS_CRYPTO = False
 
+SEGMENT_MARKERS = (".pms", ".ts", ".m4s", "segment")
+CAPTURE_RESOURCE_TYPES = ("XHR", "Fetch", "Media")   # 播放器抓片段的請求類型；頁面、腳本、圖片不攔截
+IO_READ_BYTES = 1024 * 1024     # IO.read 每次讀取的上限
+PUMP_INTERVAL = 0.1             # 監控迴圈等待時，每隔多久讓 Playwright 派送一次 CDP 事件
+
+
 class PlaywrightDownloader:
-    def __init__(self, logger=None):
+    def __init__(self, logger=None, cancel_token: Optional[CancelToken] = None,
+                 hybrid: bool = True, hybrid_workers: int = 6, task_id: Optional[str] = None):
         self.logger = logger or logging.getLogger("Playwright")
-        self.is_cancelled = False
+        self.task_id = task_id  # 頻寬限制依任務計算 (混合模式直連)
+        # 取消訊號 (與 DownloadWorker 共用)：排隊與監控迴圈都等在權杖上，取消後一秒內關閉瀏覽器
+        self.cancel_token = cancel_token or CancelToken()
+        # [Hybrid] 清單與金鑰確認後，其餘片段改用 HTTP 直連平行抓取 (hybrid_workers 條連線)
+        self.hybrid = hybrid
+        self.hybrid_workers = hybrid_workers
+        self._hybrid_done = False
+        self.segment_headers = {}    # 瀏覽器送出片段請求時的標頭 (直連沿用)
         
         # 狀態容器
         self.key_candidates = [] 
@@ -37,59 +67,61 @@ class PlaywrightDownloader:
         self.segment_counter = 0
         self.output_dir = ""
         self.profile_dir = "" 
+        self.temp_profile_dir = ""   # 隔離模式自己啟動瀏覽器時的一次性設定檔 (結束後刪除)
         self.is_persistent = False
         self.video_duration = None 
         
         # [Phase 42] 指紋資料庫：用來儲存已下載切片的 MD5
         self.seen_fingerprints = set()
+        self._capture_lock = threading.Lock()   # CDP 回呼與直連執行緒共用擷取區
+
+        # [Capture] CDP 回呼只把事件排進佇列，由監控迴圈取出讀取 body；雜湊與寫檔交給背景寫入執行緒
+        self._cdp_events = deque()
+        self._capture_queue = queue.Queue()
+        self._capture_thread = None
+        self._fetch_capture = False     # Fetch.enable 成功：片段以 Fetch.requestPaused + IO.read 串流讀取
+        self._segment_paths = set()     # 清單載入後的片段 path；暫停的請求不在其中就立即放行
+
+        # [Incremental] 清單與金鑰到齊的片段立即解密 / 清洗，依清單順序寫入 ts_output (不必等瀏覽器關閉)
+        self.ts_output = ""
+        self._assemble_lock = threading.Lock()
+        self._unassembled = {}          # 已擷取但還沒寫入 .ts 的片段: filename -> url
+        self._assembly_writer = None
+        self._assembly_closed = False
+        self._assembly_index = {}       # 清單片段 path -> index
+        self._assembly_plan = []        # segment_key_plan(): [(key_uri, iv), ...]
+        self.stripped_packets = 0
         
-        # 鎖定檔路徑
+        # Pressplay 設定檔互斥鎖 (跨程序 OS 鎖 + 程序內 FIFO 排隊)
         self.lock_file = os.path.join(os.getcwd(), "pressplay_global.lock")
+        self.profile_lock = get_profile_lock(self.lock_file)
         self.locked_by_me = False
 
-    def _is_pid_alive(self, pid: int) -> bool:
-        try:
-            cmd = f'tasklist /FI "PID eq {pid}"'
-            output = subprocess.check_output(cmd, shell=True).decode('big5', errors='ignore')
-            return str(pid) in output
-        except:
-            return False
+    @property
+    def is_cancelled(self) -> bool:
+        return self.cancel_token.cancelled
+
+    def stop(self):
+        self.cancel_token.cancel()
 
     def _acquire_lock(self, progress_callback):
         self.logger.info("[Queue] 正在排隊等待執行權...")
-        while True:
-            if self.is_cancelled: return False
-            try:
-                fd = os.open(self.lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
-                os.write(fd, f"{os.getpid()}".encode())
-                os.close(fd)
-                self.locked_by_me = True
-                self.logger.info("🟢 已取得執行權，準備開始...")
-                return True
-            except FileExistsError:
-                try:
-                    with open(self.lock_file, 'r') as f:
-                        content = f.read().strip()
-                    if content.isdigit():
-                        locking_pid = int(content)
-                        if not self._is_pid_alive(locking_pid):
-                            self.logger.warning(f"⚠️ 發現殭屍鎖 (PID {locking_pid} 已死亡)，強制移除！")
-                            try: os.remove(self.lock_file)
-                            except: pass
-                            continue
-                except: pass
 
-                if progress_callback:
-                    progress_callback(0, "⏳ 排隊中 (等待其他 Pressplay 任務)...")
-                time.sleep(2)
-            except Exception as e:
-                self.logger.error(f"鎖定機制錯誤: {e}")
-                time.sleep(1)
+        def on_position(ahead: int):
+            self.logger.info(f"[Queue] 排隊中，前面還有 {ahead} 個 Pressplay 任務")
+            if progress_callback:
+                progress_callback(0, f"⏳ 排隊中 (前面還有 {ahead} 個 Pressplay 任務)...")
+
+        # 取消時喚醒排隊中的執行緒 (不必等到下一次輪詢)
+        with self.cancel_token.hook(self.profile_lock.interrupt):
+            if not self.profile_lock.acquire(self.cancel_token, on_position): return False
+        self.locked_by_me = True
+        self.logger.info("🟢 已取得執行權，準備開始...")
+        return True
 
     def _release_lock(self):
-        if self.locked_by_me and os.path.exists(self.lock_file):
-            try: os.remove(self.lock_file)
-            except: pass
+        if self.locked_by_me:
+            self.profile_lock.release()
             self.locked_by_me = False
 
     def _get_duration_from_page(self, page):
@@ -138,9 +170,10 @@ class PlaywrightDownloader:
         
         self.output_dir = output_path + "_temp"
         if not os.path.exists(self.output_dir): os.makedirs(self.output_dir)
+        self.ts_output = output_path.replace(".mp4", ".ts")
 
         try:
-            with sync_playwright() as p:
+            with sync_playwright() as p, ExitStack() as stack:
                 browser_args = [
                     "--disable-blink-features=AutomationControlled", 
                     "--mute-audio",
@@ -151,22 +184,52 @@ class PlaywrightDownloader:
                     "--aggressive-cache-discard",       
                 ]
 
-                context = p.chromium.launch_persistent_context(
-                    self.profile_dir,
-                    headless=False,
-                    args=browser_args,
-                    viewport={"width": 1280, "height": 720},
-                    service_workers='block',            
-                    bypass_csp=True,
-                    ignore_https_errors=True
-                )
-
-                page = context.pages[0] if context.pages else context.new_page()
+                # [Browser Pool] 附掛到常駐的 Chromium (每個設定檔一個，以 CDP 連線)，只開自己的分頁 / context
+                # 池子不可用時照舊自己啟動瀏覽器
+                # 隔離模式共用一個池設定檔，靠獨立的 context 隔離 Cookie / 快取
+                # 登入設定檔受 ProfileLock 保護：歸還時 (釋放鎖之前) 就關閉瀏覽器，不在鎖外常駐
+                pool_profile = self.profile_dir if self.is_persistent else os.path.join(base_profile_dir, "pool_isolated")
+                lease = GLOBAL_BROWSER_POOL.lease(pool_profile, browser_args + ["--ignore-certificate-errors"],
+                                                  executable=p.chromium.executable_path, should_stop=self.cancel_token,
+                                                  close_on_release=self.is_persistent)
+                if lease:
+                    stack.callback(lease.release)
+                    browser = p.chromium.connect_over_cdp(lease.cdp_url)
+                    if self.is_persistent and browser.contexts:
+                        # 設定檔的預設 context (保留登入狀態)：只開一個新分頁，結束時只關這個分頁
+                        context = browser.contexts[0]
+                        page = context.new_page()
+                        owned = page
+                    else:
+                        context = browser.new_context(viewport={"width": 1280, "height": 720}, service_workers='block',
+                                                      bypass_csp=True, ignore_https_errors=True)
+                        page = context.new_page()
+                        owned = context
+                    stack.callback(self._close_quietly, owned)
+                    self.logger.info("♻️ [Pool] 附掛常駐瀏覽器")
+                else:
+                    if not self.is_persistent: self.temp_profile_dir = self.profile_dir
+                    context = p.chromium.launch_persistent_context(
+                        self.profile_dir,
+                        headless=False,
+                        args=browser_args,
+                        viewport={"width": 1280, "height": 720},
+                        service_workers='block',            
+                        bypass_csp=True,
+                        ignore_https_errors=True
+                    )
+                    page = context.pages[0] if context.pages else context.new_page()
+                    owned = context
 
                 try:
                     client = context.new_cdp_session(page)
                     client.send("Network.enable")
-                    if not self.is_persistent:
+                    if lease and owned is page:
+                        # 預設 context 無法帶啟動選項，改以 CDP 逐頁設定
+                        page.set_viewport_size({"width": 1280, "height": 720})
+                        client.send("Page.setBypassCSP", {"enabled": True})
+                        client.send("Network.setBypassServiceWorker", {"bypass": True})
+                    if not self.is_persistent and not lease:
                         client.send("Network.clearBrowserCookies")
                     client.send("Network.clearBrowserCache")
                     client.send("Network.setCacheDisabled", {"cacheDisabled": True})
@@ -175,76 +238,55 @@ class PlaywrightDownloader:
                     return False
 
                 # === CDP 攔截邏輯 (加入指紋識別) ===
+                # 回呼只排入佇列立即返回，不在事件派送中同步抓 body；由 _drain_cdp() 在監控迴圈中處理
                 def on_cdp_response(event):
                     if self.is_cancelled: return
-                    try:
-                        resp = event.get("response", {})
-                        request_id = event.get("requestId")
-                        url = resp.get("url", "")
-                        mime = resp.get("mimeType", "").lower()
-                        status = resp.get("status", 0)
-
-                        if status != 200: return
-
-                        if ".m3u8" in url and not self.playlist:
-                            try:
-                                body_data = client.send("Network.getResponseBody", {"requestId": request_id})
-                                body = body_data.get("body", "")
-                                content = base64.b64decode(body).decode() if body_data.get("base64Encoded") else body
-                                if "#EXTINF" in content:
-                                    self.playlist = m3u8.loads(content, uri=url)
-                                    self.playlist_url = url
-                                    # 初始化指紋庫
-                                    self.seen_fingerprints.clear()
-                                    self.logger.info(f"📜 [CDP] 鎖定 M3U8: {len(self.playlist.segments)} 切片")
-                            except: pass
-
-                        is_segment = False
-                        if any(ext in url for ext in [".pms", ".ts", ".m4s", "segment"]): is_segment = True
-                        elif "video/mp2t" in mime: is_segment = True
-
-                        if is_segment:
-                            # 1. 網址去重 (第一道防線)
-                            if url in self.segments_map: return
-
-                            try:
-                                body_data = client.send("Network.getResponseBody", {"requestId": request_id})
-                                body = body_data.get("body", "")
-                                is_base64 = body_data.get("base64Encoded", False)
-                                final_bytes = base64.b64decode(body) if is_base64 else body.encode('latin1')
-
-                                if len(final_bytes) > 1024:
-                                    # [Phase 42] 2. 內容指紋去重 (核心防線)
-                                    # 計算檔案的 MD5 雜湊值
-                                    file_hash = hashlib.md5(final_bytes).hexdigest()
-                                    
-                                    if file_hash in self.seen_fingerprints:
-                                        # 如果這個內容已經下載過，那就是重複的片段 (例如重播的片頭)
-                                        # 直接丟棄，不要寫入硬碟
-                                        return
-                                    
-                                    # 加入指紋庫
-                                    self.seen_fingerprints.add(file_hash)
-
-                                    # 存檔
-                                    self.segment_counter += 1
-                                    fname = f"raw_{self.segment_counter:05d}.tmp"
-                                    fpath = os.path.join(self.output_dir, fname)
-                                    with open(fpath, "wb") as f:
-                                        f.write(final_bytes)
-                                    
-                                    self.segments_map[url] = {'filename': fname}
-                                    
-                                    if self.segment_counter % 5 == 0:
-                                        print(f"📥 [CDP] 已抓取 {self.segment_counter} 個切片", end='\r')
-                            except: pass
-                            
-                    except Exception: pass
+                    resp = event.get("response", {})
+                    request_id = event.get("requestId")
+                    url = resp.get("url", "")
+                    mime = resp.get("mimeType", "").lower()
+                    if resp.get("status", 0) != 200: return
+
+                    if ".m3u8" in url and not self.playlist:
+                        self._cdp_events.append(("playlist", (request_id, url)))
+                    # Fetch 攔截已涵蓋的片段不再重複抓；只有 MIME 才認得出的片段走 Network.getResponseBody
+                    if self._fetch_capture and self._looks_like_segment(url): return
+                    if self._looks_like_segment(url) or "video/mp2t" in mime:
+                        self._cdp_events.append(("network", (request_id, url)))
+
+                # 不是片段的請求 (例如金鑰) 在回呼中立即放行：監控迴圈可能正卡在 page.evaluate (JS 奪鑰)，
+                # 排隊等它處理會讓請求一直暫停、evaluate 永遠等不到回應
+                def on_fetch_paused(event):
+                    if self._is_playlist_segment(event.get("request", {}).get("url", "")):
+                        self._cdp_events.append(("paused", event))
+                        return
+                    try: client.send("Fetch.continueRequest", {"requestId": event["requestId"]})
+                    except Exception as e: self.logger.debug(f"[CDP] 放行失敗: {e}")
+
+                # 記下瀏覽器抓片段時送出的標頭 (Referer / Origin / 自訂 token)，混合模式直連時沿用
+                def on_cdp_request(event):
+                    request = event.get("request", {})
+                    if self._looks_like_segment(request.get("url", "")):
+                        self.segment_headers = request.get("headers", {})
 
                 client.on("Network.responseReceived", on_cdp_response)
+                client.on("Network.requestWillBeSent", on_cdp_request)
+                client.on("Fetch.requestPaused", on_fetch_paused)
+                try:
+                    # 片段在回應階段暫停，以 takeResponseBodyAsStream + IO.read 分塊讀出後再交還給播放器
+                    client.send("Fetch.enable", {"patterns": [
+                        {"urlPattern": f"*{m}*", "resourceType": t, "requestStage": "Response"}
+                        for m in SEGMENT_MARKERS for t in CAPTURE_RESOURCE_TYPES]})
+                    self._fetch_capture = True
+                except Exception as e:
+                    self.logger.warning(f"⚠️ [CDP] Fetch 攔截不可用，改用 Network.getResponseBody: {e}")
+
+                self._start_capture_writer()
+                stack.callback(self._stop_capture_writer)
 
                 self.logger.info("🚀 前往頁面...")
-                page.goto(target_url, timeout=0)
+                # 只等到導覽確立 (commit)：sync API 不能從其他執行緒中斷，頁面載入改由下方迴圈等待，取消才能即時生效
+                page.goto(target_url, timeout=0, wait_until="commit")
 
                 # === 5. 循環監控 ===
                 check_interval = 0
@@ -262,45 +304,39 @@ class PlaywrightDownloader:
 
                     if self.playlist and not self.confirmed_key and not key_fetched_via_js:
                         try:
-                            target_key_uri = None
-                            if self.playlist.keys:
-                                key_info = self.playlist.keys[0]
-                                if key_info and key_info.uri:
-                                    target_key_uri = key_info.uri
-                                    if not target_key_uri.startswith("http"):
-                                        target_key_uri = urljoin(self.playlist_url, target_key_uri)
-                            
-                            if target_key_uri:
-                                self.logger.info(f"🔫 [JS] 發動主動奪鑰: {target_key_uri}")
-                                key_b64 = page.evaluate(f"""
-                                    async () => {{
-                                        try {{
-                                            const resp = await fetch('{target_key_uri}');
-                                            if (resp.status !== 200) return null;
-                                            const buf = await resp.arrayBuffer();
-                                            if (buf.byteLength !== 16) return 'BAD_LEN:' + buf.byteLength;
-                                            let binary = '';
-                                            const bytes = new Uint8Array(buf);
-                                            for (let i = 0; i < bytes.byteLength; i++) {{
-                                                binary += String.fromCharCode(bytes[i]);
-                                            }}
-                                            return btoa(binary);
-                                        }} catch (e) {{ return 'ERR:' + e.toString(); }}
-                                    }}
-                                """)
-                                
-                                if key_b64 and not key_b64.startswith("ERR") and not key_b64.startswith("BAD"):
-                                    self.confirmed_key = base64.b64decode(key_b64)
-                                    self.logger.info(f"🎉 [JS] 奪鑰成功！Hex: {self.confirmed_key.hex()}")
+                            # 支援 EXT-X-KEY 輪換：清單中每一把 key 都要拿到，存入共用 KeyStore
+                            key_uris = list(dict.fromkeys(u for u, _ in segment_key_plan(self.playlist) if u))
+                            if key_uris:
+                                all_ok = True
+                                for target_key_uri in key_uris:
+                                    if GLOBAL_KEY_STORE.peek(target_key_uri): continue
+                                    self.logger.info(f"🔫 [JS] 發動主動奪鑰: {target_key_uri}")
+                                    key_b64 = self._fetch_key_via_js(page, target_key_uri)
+                                    if key_b64 and not key_b64.startswith("ERR") and not key_b64.startswith("BAD"):
+                                        key_bytes = base64.b64decode(key_b64)
+                                        GLOBAL_KEY_STORE.put(target_key_uri, key_bytes)
+                                        self.logger.info(f"🎉 [JS] 奪鑰成功！Hex: {key_bytes.hex()}")
+                                    else:
+                                        all_ok = False
+                                        self.logger.warning(f"⚠️ [JS] 奪鑰失敗: {key_b64}")
+                                if all_ok:
+                                    self.confirmed_key = GLOBAL_KEY_STORE.peek(key_uris[0])
                                     key_fetched_via_js = True
-                                else:
-                                    self.logger.warning(f"⚠️ [JS] 奪鑰失敗: {key_b64}")
                             else:
                                 self.logger.info("ℹ️ Playlist 中未發現 Key 定義 (判定為無加密)")
                                 key_fetched_via_js = True 
+                            if key_fetched_via_js:
+                                # 金鑰到手前擷取的片段現在可以解密寫入了
+                                self._request_assembly()
                         except Exception as e:
                             self.logger.error(f"❌ JS 注入錯誤: {e}")
 
+                    # [Hybrid] 清單與金鑰都確認後，其餘片段改由 HTTP 直連平行抓取，只有失敗的才回頭靠播放擷取
+                    if self.hybrid and not self._hybrid_done and self.playlist and key_fetched_via_js:
+                        self._hybrid_done = True
+                        self._hybrid_fetch(context, page, progress_callback)
+                        if self.is_cancelled: break
+
                     # 自動加速
                     if check_interval % 2 == 0:
                         try:
@@ -343,7 +379,7 @@ class PlaywrightDownloader:
                     if total > 0 and saved >= total:
                         if self.confirmed_key or key_fetched_via_js:
                             self.logger.info("✅ 下載完成！")
-                            time.sleep(2)
+                            self._pump_events(client, page, 2)
                             break
                         else:
                             if check_interval % 5 == 0:
@@ -365,11 +401,11 @@ class PlaywrightDownloader:
                             break
                     except: pass
 
-                    time.sleep(1)
+                    if self._pump_events(client, page, 1): break
                     check_interval += 1
                     if check_interval > max_idle: break
 
-                if not self.video_duration:
+                if not self.video_duration and not self.is_cancelled:
                     self.logger.info("🔍 最後嘗試獲取影片時長...")
                     dur = self._get_duration_from_page(page)
                     if dur:
@@ -379,11 +415,11 @@ class PlaywrightDownloader:
                         self.logger.warning("⚠️ 警告：無法偵測影片時長，將跳過修剪步驟")
 
                 self.logger.info("🛑 關閉瀏覽器...")
-                try: context.close()
-                except: pass
+                self._close_quietly(owned)
 
             # === 6. 後處理解密 ===
             if self.is_cancelled: 
+                self._abort_assembly()
                 self._cleanup_profile()
                 self._release_lock()
                 return False
@@ -395,25 +431,13 @@ class PlaywrightDownloader:
                 with open(os.path.join(self.output_dir, "key.bin"), "wb") as f:
                     f.write(final_key)
 
-            files = sorted([f for f in os.listdir(self.output_dir) if f.startswith("raw_") and f.endswith(".tmp")])
-            ts_output = output_path.replace(".mp4", ".ts")
-            
-            with open(ts_output, 'wb') as outfile:
-                for fname in files:
-                    fpath = os.path.join(self.output_dir, fname)
-                    with open(fpath, 'rb') as infile:
-                        data = infile.read()
-                    
-                    decrypted_data = data
-                    if final_key and len(data) % 16 == 0:
-                        try:
-                            seq_str = fname.split('_')[1].split('.')[0]
-                            iv = int(seq_str).to_bytes(16, byteorder='big')
-                            cipher = AES.new(final_key, AES.MODE_CBC, iv)
-                            decrypted_data = cipher.decrypt(data)
-                        except: pass
-                    
-                    outfile.write(decrypted_data)
+            ts_output = self.ts_output
+            # 擷取期間已邊解密邊寫入；只有對不回播放清單的情況才退回整批重讀合併
+            if not self._finish_assembly():
+                self._merge_captures(ts_output, final_key)
+
+            if self.stripped_packets:
+                self.logger.info(f"🧽 清洗: 共移除 {self.stripped_packets} 個偽裝封包")
 
             try: shutil.rmtree(self.output_dir)
             except: pass
@@ -426,10 +450,444 @@ class PlaywrightDownloader:
 
         except Exception as e:
             self.logger.error(f"[Playwright] Critical Error: {e}", exc_info=True)
+            self._abort_assembly()
             self._cleanup_profile()
             self._release_lock()
             return False
 
+    @staticmethod
+    def _close_quietly(target):
+        try: target.close()
+        except: pass
+
+    @staticmethod
+    def _looks_like_segment(url: str) -> bool:
+        return any(ext in url for ext in SEGMENT_MARKERS)
+
+    def _is_playlist_segment(self, url: str) -> bool:
+        """清單載入後只認清單裡的片段 (比對 path)；載入前以副檔名 / 關鍵字推測"""
+        if self._segment_paths: return self._segment_lookup_key(url) in self._segment_paths
+        return self._looks_like_segment(url)
+
+    # --- CDP 擷取：事件佇列 + 背景寫入 ---
+    def _pump_events(self, client, page, seconds: float) -> bool:
+        """
+        等待 seconds 秒，期間讓 Playwright 派送 CDP 事件 (sync API 只在呼叫中派送) 並處理擷取佇列
+        回傳是否已取消
+        """
+        deadline = time.monotonic() + seconds
+        while True:
+            self._drain_cdp(client)
+            if self.is_cancelled: return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0: return False
+            try:
+                page.wait_for_timeout(min(remaining, PUMP_INTERVAL) * 1000)
+            except Exception:
+                return self.cancel_token.wait(remaining)
+
+    def _drain_cdp(self, client):
+        while self._cdp_events:
+            kind, payload = self._cdp_events.popleft()
+            try:
+                if kind == "paused": self._capture_paused(client, payload)
+                elif kind == "playlist": self._load_playlist(client, *payload)
+                else: self._capture_network(client, *payload)
+            except Exception as e:
+                self.logger.debug(f"[CDP] 擷取失敗 ({kind}): {e}")
+
+    def _load_playlist(self, client, request_id: str, url: str):
+        if self.playlist: return
+        body_data = client.send("Network.getResponseBody", {"requestId": request_id})
+        body = body_data.get("body", "")
+        content = base64.b64decode(body).decode() if body_data.get("base64Encoded") else body
+        if "#EXTINF" in content:
+            self.playlist = m3u8.loads(content, uri=url)
+            self.playlist_url = url
+            self._segment_paths = {self._segment_lookup_key(seg.absolute_uri) for seg in self.playlist.segments}
+            # 初始化指紋庫
+            self.seen_fingerprints.clear()
+            self.logger.info(f"📜 [CDP] 鎖定 M3U8: {len(self.playlist.segments)} 切片")
+
+    def _is_captured(self, url: str) -> bool:
+        with self._capture_lock:
+            return url in self.segments_map
+
+    def _capture_paused(self, client, event: dict):
+        """Fetch.requestPaused (回應階段)：串流讀出 body 交給寫入執行緒，再以 fulfillRequest 交還給播放器"""
+        request_id = event["requestId"]
+        url = event.get("request", {}).get("url", "")
+        headers = event.get("responseHeaders", [])
+        # 1. 網址去重 (第一道防線)；不是片段 / 非 200 / 已擷取 (例如混合模式抓過) 的直接放行
+        if (event.get("responseStatusCode") != 200 or self.is_cancelled
+                or not self._is_playlist_segment(url) or self._is_captured(url)):
+            client.send("Fetch.continueRequest", {"requestId": request_id})
+            return
+
+        length = next((int(h["value"]) for h in headers
+                       if h.get("name", "").lower() == "content-length" and str(h.get("value", "")).isdigit()), None)
+        reserved = length or READ_CHUNK_BYTES
+        if not GLOBAL_MEMORY_BUDGET.acquire(reserved, self.cancel_token):
+            client.send("Fetch.continueRequest", {"requestId": request_id})
+            return
+        try:
+            data = self._read_stream(client, request_id)
+        except Exception:
+            GLOBAL_MEMORY_BUDGET.release(reserved)
+            # 暫停中的請求一定要交還，否則播放器會一直等這個片段；頁面可能已關閉，送不出去就算了
+            try: client.send("Fetch.failRequest", {"requestId": request_id, "errorReason": "Failed"})
+            except Exception: pass
+            raise
+        reserved = self._settle_budget(reserved, len(data))
+        self._capture_queue.put((url, data, reserved))
+
+        # body 已被取走，必須整包交還；解碼後的內容不能再帶原本的 Content-Encoding / Content-Length
+        headers = [h for h in headers if h.get("name", "").lower() not in ("content-encoding", "content-length")]
+        client.send("Fetch.fulfillRequest", {"requestId": request_id, "responseCode": 200,
+                                             "responseHeaders": headers,
+                                             "body": base64.b64encode(data).decode("ascii")})
+
+    @staticmethod
+    def _read_stream(client, request_id: str) -> bytes:
+        handle = client.send("Fetch.takeResponseBodyAsStream", {"requestId": request_id})["stream"]
+        parts = []
+        try:
+            while True:
+                chunk = client.send("IO.read", {"handle": handle, "size": IO_READ_BYTES})
+                data = chunk.get("data", "")
+                parts.append(base64.b64decode(data) if chunk.get("base64Encoded") else data.encode("utf-8"))
+                if chunk.get("eof"): break
+        finally:
+            try: client.send("IO.close", {"handle": handle})
+            except Exception: pass
+        return b"".join(parts)
+
+    def _capture_network(self, client, request_id: str, url: str):
+        """Fetch 不可用或只靠 MIME 認出的片段：Network.getResponseBody (整包 base64)"""
+        if self._is_captured(url): return
+        body_data = client.send("Network.getResponseBody", {"requestId": request_id})
+        body = body_data.pop("body", "")
+        is_base64 = body_data.get("base64Encoded", False)
+        # [Memory] 解碼前先取得全域記憶體預算；解碼後立即丟掉 base64 字串，只保留一份 bytes
+        reserved = len(body) * 3 // 4 if is_base64 else len(body)
+        if not GLOBAL_MEMORY_BUDGET.acquire(reserved, self.cancel_token): return
+        try:
+            data = base64.b64decode(body) if is_base64 else body.encode('latin1')
+        except Exception:
+            GLOBAL_MEMORY_BUDGET.release(reserved)
+            raise
+        del body, body_data
+        self._capture_queue.put((url, data, self._settle_budget(reserved, len(data))))
+
+    @staticmethod
+    def _settle_budget(reserved: int, size: int) -> int:
+        """預估額度與實際大小對帳，回傳實際登記的位元組數"""
+        if size > reserved: GLOBAL_MEMORY_BUDGET.charge(size - reserved)
+        elif size < reserved: GLOBAL_MEMORY_BUDGET.release(reserved - size)
+        return size
+
+    def _start_capture_writer(self):
+        self._capture_queue = queue.Queue()
+        self._capture_thread = threading.Thread(target=self._capture_writer_loop, name="CaptureWriter", daemon=True)
+        self._capture_thread.start()
+
+    def _stop_capture_writer(self):
+        """送出結束標記並等寫入執行緒把佇列寫完 (後處理之前呼叫)"""
+        if self._capture_thread is None: return
+        self._capture_queue.put(None)
+        self._capture_thread.join()
+        self._capture_thread = None
+
+    def _capture_writer_loop(self):
+        """背景寫入：MD5 指紋去重 + 寫檔，完成後歸還記憶體預算"""
+        while True:
+            item = self._capture_queue.get()
+            if item is None: return
+            url, data, reserved = item
+            try:
+                if self.is_cancelled: pass
+                elif url is None: self._assemble_pending()
+                else: self._store_capture(url, data)
+            except Exception as e:
+                self.logger.error(f"❌ [CDP] 切片寫入失敗: {e}")
+            finally:
+                del data, item
+                GLOBAL_MEMORY_BUDGET.release(reserved)
+
+    def _store_capture(self, url: str, data: bytes) -> bool:
+        """把擷取到的片段 (CDP 或直連) 去重後存成 raw_XXXXX.tmp；回傳是否為新片段"""
+        if len(data) <= 1024: return False
+        # [Phase 42] 2. 內容指紋去重 (核心防線)
+        # 計算檔案的 MD5 雜湊值
+        file_hash = hashlib.md5(data).hexdigest()
+        with self._capture_lock:
+            if url in self.segments_map: return False
+            if file_hash in self.seen_fingerprints:
+                # 如果這個內容已經下載過，那就是重複的片段 (例如重播的片頭)
+                # 直接丟棄，不要寫入硬碟
+                return False
+            # 加入指紋庫
+            self.seen_fingerprints.add(file_hash)
+
+            # 存檔
+            self.segment_counter += 1
+            fname = f"raw_{self.segment_counter:05d}.tmp"
+            with open(os.path.join(self.output_dir, fname), "wb") as f:
+                f.write(data)
+            self.segments_map[url] = {'filename': fname}
+
+            if self.segment_counter % 5 == 0:
+                print(f"📥 [CDP] 已抓取 {self.segment_counter} 個切片", end='\r')
+        with self._assemble_lock:
+            self._unassembled[fname] = url
+        self._assemble_pending(fresh=(fname, data))
+        return True
+
+    # --- 邊擷取邊解密 ---
+    def _decode_segment(self, data: bytes, seg_key: Optional[bytes], iv: Optional[bytes]) -> bytes:
+        """清洗 -> AES-128 解密 (長度需為 16 的倍數) -> 再清洗；批次合併與即時寫入共用"""
+        cleaned = sanitize(data)
+        data = cleaned.data
+        stripped = cleaned.stripped_packets
+        if seg_key and iv is not None and len(data) % 16 == 0:
+            try: data = AES.new(seg_key, AES.MODE_CBC, iv).decrypt(data)
+            except: pass
+        cleaned = sanitize(data)
+        self.stripped_packets += stripped + cleaned.stripped_packets
+        return cleaned.data
+
+    def _request_assembly(self):
+        """請寫入執行緒重新檢查待寫入的片段 (金鑰剛到手時)"""
+        if self._capture_thread is not None:
+            self._capture_queue.put((None, None, 0))
+
+    def _assemble_pending(self, fresh: Optional[tuple] = None, force: bool = False):
+        """
+        播放清單與片段金鑰都到齊的片段立即解密並交給 OrderedSegmentWriter (依清單順序寫入 ts_output)
+        還缺金鑰的留在 _unassembled，金鑰到手或結束時 (force=True，缺金鑰者不解密) 再寫
+        fresh=(filename, data)：剛擷取的片段，免得再從磁碟讀回
+        """
+        if not self.playlist or not self.ts_output: return
+        with self._assemble_lock:
+            if self._assembly_writer is None:
+                if self._assembly_closed: return
+                segments = self.playlist.segments
+                self._assembly_index = {self._segment_lookup_key(seg.absolute_uri): i for i, seg in enumerate(segments)}
+                self._assembly_plan = segment_key_plan(self.playlist)
+                self._assembly_writer = OrderedSegmentWriter(self.ts_output, len(segments), spill_dir=self.output_dir)
+            writer = self._assembly_writer
+            for fname, url in list(self._unassembled.items()):
+                idx = self._assembly_index.get(self._segment_lookup_key(url))
+                if idx is None: continue
+                key_uri, iv = self._assembly_plan[idx]
+                seg_key = GLOBAL_KEY_STORE.peek(key_uri) if key_uri else None
+                if key_uri and seg_key is None and not force: continue
+                del self._unassembled[fname]
+                if writer.is_done(idx): continue
+                if fresh and fresh[0] == fname:
+                    data = fresh[1]
+                else:
+                    with open(os.path.join(self.output_dir, fname), 'rb') as f: data = f.read()
+                writer.put(idx, self._decode_segment(data, seg_key, iv))
+
+    def _finish_assembly(self) -> bool:
+        """關閉即時寫入；所有擷取檔都已寫入 .ts 時回傳 True，否則放棄 (由呼叫端批次合併)"""
+        self._assemble_pending(force=True)
+        with self._assemble_lock:
+            writer, self._assembly_writer = self._assembly_writer, None
+            self._assembly_closed = True
+            if writer is None: return False
+            if self._unassembled:
+                self.logger.warning(f"⚠️ {len(self._unassembled)} 個切片對不回播放清單，改為整批合併")
+                writer.abort()
+                self.stripped_packets = 0
+                return False
+        writer.finish(allow_gaps=True)
+        self.logger.info(f"⚡ 擷取期間已解密寫入 {writer.done_count}/{writer.total} 個切片")
+        return True
+
+    def _abort_assembly(self):
+        with self._assemble_lock:
+            writer, self._assembly_writer = self._assembly_writer, None
+            self._assembly_closed = True
+        if writer is None: return
+        writer.abort()
+        try: os.remove(self.ts_output)
+        except OSError: pass
+
+    def _merge_captures(self, ts_output: str, final_key: Optional[bytes]):
+        """整批合併 (退路)：重讀所有 raw_XXXXX.tmp，依清單 (對不回時依擷取順序) 解密寫入"""
+        files = sorted([f for f in os.listdir(self.output_dir) if f.startswith("raw_") and f.endswith(".tmp")])
+        # 依擷取網址對回播放清單片段，取得正確的金鑰與 IV (Media Sequence)，而非擷取順序
+        key_lookup = self._build_key_lookup()
+        file_to_url = {info['filename']: url for url, info in self.segments_map.items()}
+        files = self._playlist_order(files, file_to_url)
+
+        with open(ts_output, 'wb') as outfile:
+            for fname in files:
+                with open(os.path.join(self.output_dir, fname), 'rb') as infile:
+                    data = infile.read()
+                seg_key, iv = final_key, None
+                match = key_lookup.get(self._segment_lookup_key(file_to_url.get(fname, "")))
+                if match:
+                    key_uri, iv = match
+                    seg_key = GLOBAL_KEY_STORE.peek(key_uri) if key_uri else None
+                if iv is None:
+                    # 對不回清單時沿用舊行為：以擷取序號當 IV
+                    iv = int(fname.split('_')[1].split('.')[0]).to_bytes(16, byteorder='big')
+                outfile.write(self._decode_segment(data, seg_key, iv))
+
+    def _http_headers(self, page) -> dict:
+        """直連用的標頭：沿用瀏覽器抓片段時的標頭；還沒看到片段請求時以頁面的 UA / Referer 組成"""
+        headers = {k: v for k, v in self.segment_headers.items()
+                   if not k.startswith(':') and k.lower() not in ("range", "cookie")}
+        if not headers:
+            try: headers["User-Agent"] = page.evaluate("navigator.userAgent")
+            except: pass
+            headers["Referer"] = page.url
+        return headers
+
+    def _hybrid_fetch(self, context, page, progress_callback: Optional[Callable] = None):
+        """
+        混合模式：把頁面的 Cookie 與片段請求標頭複製到 HTTP Session，平行抓取還沒擷取到的片段
+        (存原始內容，解密與清洗照舊留給後處理)。抓取期間暫停播放；
+        有片段失敗時把播放位置移到第一個失敗片段，由播放擷取補齊
+        """
+        segments = self.playlist.segments
+        total = len(segments)
+        with self._capture_lock:
+            captured = {self._segment_lookup_key(u) for u in self.segments_map}
+        pending = [i for i, seg in enumerate(segments) if self._segment_lookup_key(seg.absolute_uri) not in captured]
+        if not pending: return
+
+        self._set_playback(page, paused=True)
+        session = PooledSession(GLOBAL_SESSION_POOL, self._http_headers(page))
+        # Cookie 依片段主機各取一次，只帶該主機適用的 Cookie
+        cookies = {}
+        for i in pending:
+            url = segments[i].absolute_uri
+            host = urlsplit(url).netloc
+            if host not in cookies:
+                try: cookies[host] = {c["name"]: c["value"] for c in context.cookies([url])}
+                except Exception: cookies[host] = {}
+
+        self.logger.info(f"⚡ [Hybrid] 金鑰已確認，改以 HTTP 直連抓取剩餘 {len(pending)} 個切片 ({self.hybrid_workers} 連線)...")
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.hybrid_workers, thread_name_prefix="Hybrid") as executor:
+            futures = {}
+            for i in pending:
+                url = segments[i].absolute_uri
+                futures[executor.submit(self._fetch_direct, session, url, cookies[urlsplit(url).netloc])] = i
+            for future in as_completed(futures):
+                reason = future.result()
+                if reason:
+                    failed.append(futures[future])
+                    self.logger.debug(f"[Hybrid] 切片 {futures[future]} 失敗: {reason}")
+                if progress_callback:
+                    progress_callback(self.segment_counter / total * 90, f"⚡直連下載 | 切片:{self.segment_counter}/{total}")
+        if self.is_cancelled: return
+
+        if not failed:
+            self.logger.info(f"✅ [Hybrid] 直連抓取完成 ({len(pending)} 個切片)")
+            return
+        first = min(failed)
+        resume_at = sum(seg.duration or 0 for seg in segments[:first])
+        self.logger.warning(f"⚠️ [Hybrid] {len(failed)} 個切片直連失敗，改由播放擷取補齊 (從 {resume_at:.0f} 秒處繼續)")
+        self._set_playback(page, paused=False, seek=resume_at)
+
+    def _fetch_direct(self, session, url: str, cookies: dict) -> Optional[str]:
+        """
+        以 HTTP 直連抓一個片段並存入擷取區；成功回傳 None，失敗回傳原因
+        與其他引擎一樣受同主機併發上限與全域 / 任務頻寬上限約束
+        """
+        if self.is_cancelled: return "已取消"
+        host = host_of(url)
+        if not GLOBAL_HOST_LIMITER.acquire(host, lambda: self.is_cancelled): return "已取消"
+        try:
+            r = session.get(url, cookies=cookies, timeout=(15, STALL_READ_TIMEOUT), stream=True)
+            if r.status_code != 200:
+                r.close()
+                return f"HTTP {r.status_code}"
+            # [Memory] 先取得全域記憶體預算才讀入 body；取消時直接中斷連線
+            with self.cancel_token.hook(lambda: abort_response(r)):
+                # [限速] 每個區塊讀入後扣額度，佔著同主機名額等待
+                body, reserved = read_body(r, GLOBAL_MEMORY_BUDGET, lambda: self.is_cancelled, throttle=lambda n: GLOBAL_BANDWIDTH.throttle(
+                    n, self.task_id, self.cancel_token.wait, lambda: self.is_cancelled))
+        except Exception as e:
+            return f"連線錯誤: {e}"
+        finally:
+            GLOBAL_HOST_LIMITER.release(host)
+        if body is None: return "已取消"
+        try:
+            reason = check_response(r.status_code, r.headers, body)
+            if reason: return reason
+            # _store_capture() 會丟棄過短的內容：直連拿到這種回應算失敗，交給播放擷取補齊
+            if len(body) <= 1024: return f"內容過短 ({len(body)} bytes)"
+            # 回傳 False 的其餘情況 (播放擷取已抓過同網址 / 內容指紋重複) 與播放擷取的去重規則一致，視為成功
+            self._store_capture(url, body)
+            return None
+        finally:
+            GLOBAL_MEMORY_BUDGET.release(reserved)
+
+    def _set_playback(self, page, paused: bool, seek: Optional[float] = None):
+        """暫停 / 繼續頁面上所有 video (含 iframe)；指定 seek 時先跳到該秒數 (並停用自動倒帶)"""
+        try:
+            page.evaluate("""
+                ([paused, seek]) => {
+                    const videos = [
+                        document.querySelector('video'),
+                        ...Array.from(document.querySelectorAll('iframe'))
+                            .map(f => f.contentDocument?.querySelector('video'))
+                            .filter(Boolean)
+                    ];
+                    if (seek !== null) window._rewound = true;
+                    videos.forEach(v => {
+                        if (!v) return;
+                        if (seek !== null) v.currentTime = seek;
+                        if (paused) v.pause(); else v.play();
+                    });
+                }
+            """, [paused, seek])
+        except: pass
+
+    def _playlist_order(self, files: list, file_to_url: dict) -> list:
+        """直連片段的完成順序不固定：每個檔案都對得回播放清單時依清單順序合併，否則維持擷取順序"""
+        if not self.playlist: return files
+        index = {self._segment_lookup_key(seg.absolute_uri): i for i, seg in enumerate(self.playlist.segments)}
+        positions = [index.get(self._segment_lookup_key(file_to_url.get(f, ""))) for f in files]
+        if any(p is None for p in positions): return files
+        return [f for _, f in sorted(zip(positions, files))]
+
+    def _fetch_key_via_js(self, page, key_uri: str) -> Optional[str]:
+        """在頁面內以 fetch 取得 key (帶著頁面的 Cookie / Referer)，回傳 base64 或錯誤字串"""
+        return page.evaluate(f"""
+            async () => {{
+                try {{
+                    const resp = await fetch('{key_uri}');
+                    if (resp.status !== 200) return null;
+                    const buf = await resp.arrayBuffer();
+                    if (buf.byteLength !== 16) return 'BAD_LEN:' + buf.byteLength;
+                    let binary = '';
+                    const bytes = new Uint8Array(buf);
+                    for (let i = 0; i < bytes.byteLength; i++) {{
+                        binary += String.fromCharCode(bytes[i]);
+                    }}
+                    return btoa(binary);
+                }} catch (e) {{ return 'ERR:' + e.toString(); }}
+            }}
+        """)
+
+    @staticmethod
+    def _segment_lookup_key(url: str) -> str:
+        """片段比對鍵：只取 path，忽略 query token"""
+        return urlsplit(url).path if url else ""
+
+    def _build_key_lookup(self) -> dict:
+        """播放清單片段 path -> (key_uri, iv)"""
+        if not self.playlist: return {}
+        plan = segment_key_plan(self.playlist)
+        return {self._segment_lookup_key(seg.absolute_uri): plan[i] for i, seg in enumerate(self.playlist.segments)}
+
     def _cleanup_profile(self):
         if self.is_persistent:
             self.logger.info("🔒 保留 Pressplay 設定檔 (維持登入狀態)")
@@ -451,41 +909,24 @@ class PlaywrightDownloader:
             os.rename(input_ts, output_mp4)
             return
         
-        full_mp4 = output_mp4.replace(".mp4", "_full_untouched.mp4")
-        
-        self.logger.info("🔄 步驟 1/2: 封裝為完整 MP4 (修復時間軸)...")
-        cmd_1 = [
-            ffmpeg_path, "-y", "-i", input_ts,
-            "-c", "copy",
-            "-bsf:a", "aac_adtstoasc",
-            full_mp4
-        ]
+        # 封裝 (修復時間軸) 與修剪合併為一次 ffmpeg：-t 放在輸出端，串流複製不重新編碼
+        cmd = [ffmpeg_path, "-y", "-i", input_ts]
+        if self.video_duration:
+            trim_duration = self.video_duration + 0.1
+            self.logger.info(f"🔄 封裝並修剪 MP4 (保留前 {trim_duration:.2f} 秒)...")
+            cmd += ["-t", str(trim_duration)]
+        else:
+            self.logger.warning("⚠️ 未取得時長，略過修剪步驟")
+            self.logger.info("🔄 封裝為 MP4 (修復時間軸)...")
+        cmd += ["-c", "copy", "-bsf:a", "aac_adtstoasc", output_mp4]
         
         try:
-            subprocess.run(cmd_1, creationflags=0x08000000, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            subprocess.run(cmd, creationflags=0x08000000, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
             if os.path.exists(input_ts): os.remove(input_ts)
-            
-            if self.video_duration:
-                trim_duration = self.video_duration + 0.1
-                self.logger.info(f"✂️ 步驟 2/2: 精準修剪 MP4 (保留前 {trim_duration:.2f} 秒)...")
-                
-                cmd_2 = [
-                    ffmpeg_path, "-y", "-i", full_mp4,
-                    "-t", str(trim_duration),
-                    "-c", "copy",
-                    output_mp4
-                ]
-                subprocess.run(cmd_2, creationflags=0x08000000, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                
-                if os.path.exists(full_mp4): os.remove(full_mp4)
-                self.logger.info("✅ 影片處理完成 (已修剪)！")
-            else:
-                self.logger.warning("⚠️ 未取得時長，略過修剪步驟")
-                if os.path.exists(output_mp4): os.remove(output_mp4)
-                os.rename(full_mp4, output_mp4)
-                self.logger.info("✅ 影片處理完成 (未修剪)！")
-            
+            self.logger.info(f"✅ 影片處理完成 ({'已修剪' if self.video_duration else '未修剪'})！")
         except Exception as e:
+            # 保留 .ts，使用者仍可自行轉檔
             self.logger.error(f"FFmpeg 轉檔/修剪失敗: {e}")
-            if os.path.exists(full_mp4) and not os.path.exists(output_mp4):
-                os.rename(full_mp4, output_mp4)
\ No newline at end of file
+            if os.path.exists(output_mp4):
+                try: os.remove(output_mp4)
+                except OSError: pass
\ No newline at end of file
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# src/logic/profile_lock.py
+# [VibeCoding] Profile Lock: 跨程序互斥鎖 (OS 位元組範圍鎖) + 程序內 FIFO 排隊，取代「O_EXCL 檔案輪詢 + tasklist 查 PID」
+
+import os
+import threading
+from collections import deque
+from typing import Callable, Dict, Optional
+
+try:
+    import msvcrt
+    HAS_MSVCRT = True
+except ImportError:
+    HAS_MSVCRT = False
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+
+class ProfileLock:
+    """
+    同一時間只允許一個任務使用某個瀏覽器設定檔 (例如 Pressplay 的登入設定檔)
+    - 跨程序：對鎖定檔第 0 個位元組加 OS 鎖 (Windows msvcrt.locking / POSIX fcntl.lockf)；
+      持有者當掉時由作業系統自動釋放，不必再判斷殭屍 PID。鎖定檔本身不刪除
+    - 程序內：排隊的執行緒依到達順序 (FIFO) 取得；等待掛在 Condition 上，釋放 / 中斷時立即喚醒
+    - 隊首遇到其他程序持有時才以 poll_interval 做非阻塞嘗試 (一次系統呼叫，不啟動子程序)
+    - on_position(ahead): 排隊位置改變時回報前面還有幾個任務 (其他程序持有也算一個)；在鎖內呼叫，須快速返回
+    """
+    def __init__(self, path: str, poll_interval: float = 0.2):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._cond = threading.Condition()
+        self._queue = deque()       # 排隊中的號碼牌 (依到達順序)
+        self._owner = None          # 目前持有者的號碼牌
+        self._fd: Optional[int] = None
+
+    @property
+    def locked(self) -> bool:
+        with self._cond:
+            return self._owner is not None
+
+    @property
+    def waiting(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+    def acquire(self, should_stop: Optional[Callable[[], bool]] = None,
+                on_position: Optional[Callable[[int], None]] = None) -> bool:
+        """阻塞直到取得鎖；should_stop() 為真時放棄排隊並回傳 False (搭配 interrupt() 立即喚醒)"""
+        ticket = object()
+        last_reported = None
+        with self._cond:
+            self._queue.append(ticket)
+            try:
+                while True:
+                    if should_stop and should_stop(): return False
+                    ahead = self._queue.index(ticket) + (1 if self._owner is not None else 0)
+                    if ahead == 0:
+                        if self._try_os_lock():
+                            self._queue.popleft()
+                            self._owner = ticket
+                            return True
+                        ahead = 1   # 其他程序持有中
+                    if on_position and ahead != last_reported:
+                        last_reported = ahead
+                        on_position(ahead)
+                    if ahead == 1 and self._owner is None:
+                        self._cond.wait(self.poll_interval)
+                    else:
+                        self._cond.wait()
+            finally:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    self._cond.notify_all()
+
+    def try_acquire(self) -> bool:
+        """不排隊：沒有人持有 (含其他程序) 也沒有人排隊時立即取得，否則回傳 False"""
+        with self._cond:
+            if self._owner is not None or self._queue or not self._try_os_lock(): return False
+            self._owner = object()
+            return True
+
+    def release(self):
+        with self._cond:
+            if self._owner is None: return
+            self._owner = None
+            self._unlock_os()
+            self._cond.notify_all()
+
+    def interrupt(self):
+        """喚醒所有排隊者重新檢查 should_stop (取消時呼叫)"""
+        with self._cond:
+            self._cond.notify_all()
+
+    # --- 內部 (呼叫端需持有 _cond) ---
+    def _try_os_lock(self) -> bool:
+        if not (HAS_MSVCRT or HAS_FCNTL): return True
+        try:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            if HAS_MSVCRT:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, 0)
+            return True
+        except OSError:
+            return False
+
+    def _unlock_os(self):
+        if self._fd is None: return
+        try:
+            if HAS_MSVCRT:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+            elif HAS_FCNTL:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, 0)
+        except OSError:
+            pass
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+_LOCKS: Dict[str, ProfileLock] = {}
+_LOCKS_GUARD = threading.Lock()
+
+
+def get_profile_lock(path: str) -> ProfileLock:
+    """同一路徑在程序內共用同一個 ProfileLock (FIFO 排隊才有意義)"""
+    path = os.path.abspath(path)
+    with _LOCKS_GUARD:
+        lock = _LOCKS.get(path)
+        if lock is None:
+            lock = _LOCKS[path] = ProfileLock(path)
+        return lock
@@ -3,6 +3,10 @@ from collections import deque
 from typing import Dict, Any, Optional
 from PySide6.QtCore import QObject, Signal
 from src.logic.downloader import DownloadWorker
+from src.logic.bandwidth_limiter import GLOBAL_BANDWIDTH
+from src.logic.host_limiter import GLOBAL_HOST_LIMITER, host_of
+from src.logic.memory_budget import GLOBAL_MEMORY_BUDGET
+from src.logic.browser_pool import GLOBAL_BROWSER_POOL
 
 class QueueManager(QObject):
     """
@@ -22,15 +26,28 @@ class QueueManager(QObject):
     queue_started = Signal()
     queue_finished = Signal()
 
-    def __init__(self, max_concurrent: int = 2):
+    def __init__(self, max_concurrent: int = 2, per_host_limit: int = 16, memory_budget_mb: float = 512,
+                 browser_pool: bool = True, browser_pool_max_uses: int = 20, browser_pool_memory_mb: float = 1500):
         super().__init__()
         self.max_concurrent = max_concurrent
         
+        # 同主機同時請求上限 (跨所有任務與引擎共用)
+        GLOBAL_HOST_LIMITER.set_default_limit(per_host_limit)
+        # 在途媒體資料的記憶體上限 (跨所有任務與引擎共用)
+        GLOBAL_MEMORY_BUDGET.set_limit(int(memory_budget_mb * 1024 * 1024))
+        # 常駐瀏覽器池 (嗅探 / 瀏覽器擷取共用)：借出 N 次或超過記憶體上限就回收，佇列閒置時關閉
+        GLOBAL_BROWSER_POOL.configure(enabled=browser_pool, max_uses=browser_pool_max_uses,
+                                      memory_limit_mb=browser_pool_memory_mb)
+        
         # 等待佇列: 存放 {'id': str, 'url': str, 'config': dict}
         self.waiting_queue = deque()
         
         # 活躍工作者: {'task_id': DownloadWorker_Instance}
         self.active_workers: Dict[str, DownloadWorker] = {}
+        # 活躍任務的主機: {'task_id': hostname}
+        self.active_hosts: Dict[str, str] = {}
+        # 已取消但執行緒尚未結束的 Worker (保留參考直到 QThread.finished，避免執行中被回收)
+        self.stopping_workers: Dict[str, DownloadWorker] = {}
         
         # 系統狀態標記
         self.is_processing = False
@@ -66,18 +83,42 @@ class QueueManager(QObject):
         """
         self.is_processing = False
 
+    def set_global_rate_limit(self, bytes_per_sec: float):
+        """
+        調整全域頻寬上限 (0 = 不限速)，進行中的任務 (含 yt-dlp) 立即套用
+        """
+        GLOBAL_BANDWIDTH.set_global_rate(bytes_per_sec)
+
+    def set_task_rate_limit(self, task_id: str, bytes_per_sec: float):
+        """
+        調整單一執行中任務的頻寬上限 (0 = 不限速)
+        """
+        GLOBAL_BANDWIDTH.set_task_rate(task_id, bytes_per_sec)
+
+    def memory_stats(self) -> Dict[str, int]:
+        """
+        全域記憶體預算的目前用量 / 峰值 / 上限 (bytes) 與等待中的抓取數
+        """
+        return GLOBAL_MEMORY_BUDGET.stats()
+
     def cancel_task(self, task_id: str):
         """
         取消特定任務 (無論是在佇列中還是在執行中)
         """
         # 1. 檢查是否在活躍列表
         if task_id in self.active_workers:
-            worker = self.active_workers[task_id]
+            worker = self.active_workers.pop(task_id)
+            # 不在 GUI 執行緒等待：發出取消訊號後立即釋放名額，執行緒收尾完成 (finished) 再回收
+            # 切斷訊號，避免收尾時送出的錯誤 / 完成蓋過「已取消」
+            for signal in (worker.signals.progress, worker.signals.status,
+                           worker.signals.error, worker.signals.finished):
+                try: signal.disconnect()
+                except (RuntimeError, TypeError): pass
+            self.stopping_workers[task_id] = worker
+            worker.finished.connect(lambda tid=task_id: self._on_worker_stopped(tid))
             worker.stop()
-            worker.wait() # 等待執行緒安全結束
-            # 移除邏輯由 _on_worker_finished 處理，或者手動觸發
-            # 這裡簡單處理：
-            del self.active_workers[task_id]
+            if worker.isFinished(): self._on_worker_stopped(task_id)
+            self.active_hosts.pop(task_id, None)
             self.task_status_changed.emit(task_id, "已取消")
             self._schedule_next() # 補位
             return
@@ -90,6 +131,16 @@ class QueueManager(QObject):
         if len(self.waiting_queue) < original_len:
             self.task_status_changed.emit(task_id, "已移除")
 
+    def _on_worker_stopped(self, task_id: str):
+        """
+        已取消的 Worker 執行緒真正結束時的回調
+        """
+        worker = self.stopping_workers.pop(task_id, None)
+        if worker is not None:
+            worker.deleteLater()
+        if not self.active_workers and not self.waiting_queue:
+            GLOBAL_BROWSER_POOL.shutdown_idle_async()
+
     def _schedule_next(self):
         """
         核心調度邏輯：檢查是否有空位並啟動下一個任務
@@ -99,14 +150,29 @@ class QueueManager(QObject):
 
         # 檢查併發限制
         while len(self.active_workers) < self.max_concurrent and self.waiting_queue:
-            task = self.waiting_queue.popleft()
+            task = self._pick_next_task()
             self._start_worker(task)
 
         # 如果沒有活躍任務且佇列為空，發送完成訊號
         if not self.active_workers and not self.waiting_queue:
             self.is_processing = False
+            GLOBAL_BROWSER_POOL.shutdown_idle_async()  # 佇列閒置：背景關掉常駐瀏覽器釋放記憶體 (不卡 GUI)
             self.queue_finished.emit()
 
+    def _pick_next_task(self) -> Dict[str, Any]:
+        """
+        主機感知的取件順序：優先啟動「目前活躍任務最少的主機」的任務 (同數量時維持排隊順序)
+        同主機的任務仍會被啟動，只是排在其他主機之後，並與同主機任務共用請求上限
+        """
+        busy: Dict[str, int] = {}
+        for host in self.active_hosts.values():
+            busy[host] = busy.get(host, 0) + 1
+        best = min(range(len(self.waiting_queue)),
+                   key=lambda i: busy.get(host_of(self.waiting_queue[i]['url']), 0))
+        task = self.waiting_queue[best]
+        del self.waiting_queue[best]
+        return task
+
     def _start_worker(self, task: Dict[str, Any]):
         """
         實例化並啟動 Worker
@@ -122,6 +188,7 @@ class QueueManager(QObject):
         
         # 啟動並存入活躍列表
         self.active_workers[task_id] = worker
+        self.active_hosts[task_id] = host_of(task['url'])
         worker.start()
 
     def _on_worker_finished(self, task_id: str):
@@ -132,6 +199,7 @@ class QueueManager(QObject):
             # 資源清理
             worker = self.active_workers.pop(task_id)
             worker.deleteLater() # 確保 Qt 清理記憶體
+        self.active_hosts.pop(task_id, None)
             
         self.task_completed.emit(task_id)
         self._schedule_next() # 觸發補位
@@ -143,6 +211,7 @@ class QueueManager(QObject):
         if task_id in self.active_workers:
             worker = self.active_workers.pop(task_id)
             worker.deleteLater()
+        self.active_hosts.pop(task_id, None)
             
         self.task_error_occurred.emit(task_id, error_msg)
         self._schedule_next() # 即使錯誤也要繼續下一個
\ No newline at end of file
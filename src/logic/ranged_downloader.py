@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+# src/logic/ranged_downloader.py
+# [VibeCoding] Ranged Parallel: 單一大型媒體檔 (mp4) 多連線分段下載 + 逐塊續傳
+
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+from src.logic.resume_journal import atomic_write
+from src.logic.session_pool import GLOBAL_SESSION_POOL, PooledSession
+from src.logic.bandwidth_limiter import GLOBAL_BANDWIDTH
+from src.logic.host_limiter import GLOBAL_HOST_LIMITER, host_of
+from src.logic.cancel_token import CancelToken, abort_response
+
+# 副檔名 / Content-Type 對照：嗅探到的直連檔不一定是 mp4 (webm、flv、m4a...)
+MEDIA_EXTENSIONS = ("mp4", "m4v", "m4a", "mov", "webm", "mkv", "flv", "mp3", "aac", "ogg")
+CONTENT_TYPE_EXTENSIONS = {
+    "video/mp4": "mp4", "video/x-m4v": "m4v", "audio/mp4": "m4a", "audio/x-m4a": "m4a",
+    "video/quicktime": "mov", "video/webm": "webm", "audio/webm": "webm",
+    "video/x-matroska": "mkv", "video/x-flv": "flv", "audio/mpeg": "mp3",
+    "audio/aac": "aac", "audio/ogg": "ogg", "video/ogg": "ogg",
+}
+
+
+class RangedDownloader:
+    """
+    多連線 Range 下載器
+    1. 探測: Range: bytes=0-0 取得 206 + Content-Range 總長 (退而求其次看 HEAD 的 Accept-Ranges)
+    2. 切塊: 依 chunk_size 切成多段，預配置 .part 檔，每段寫到自己的偏移
+    3. 續傳: .ranges.json 記錄已完成的區塊，重跑時只抓缺的
+    不支援 Range 或無法得知長度時回傳 False，由呼叫端退回 yt-dlp
+    """
+    def __init__(self, logger=None, connections: int = 8, chunk_size: int = 8 * 1024 * 1024,
+                 task_id: Optional[str] = None, cancel_token: Optional[CancelToken] = None):
+        self.logger = logger
+        self.task_id = task_id
+        self.connections = connections
+        self.chunk_size = chunk_size
+        self.cancel_token = cancel_token or CancelToken()  # 與 DownloadWorker 共用
+        self.session = None
+        self._state_lock = threading.Lock()
+        self._bytes_done = 0
+        self._probed: Dict[str, Tuple[Optional[int], bool, str]] = {}  # url -> (總長度, 支援 Range, Content-Type)
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self.cancel_token.cancelled
+
+    def stop(self):
+        self.cancel_token.cancel()
+
+    def _get_session(self, headers: Dict):
+        # 全域連線池：每條連線 (執行緒) 各自一個 Session，Headers 只屬於這個任務
+        if self.session is None:
+            self.session = PooledSession(GLOBAL_SESSION_POOL, headers)
+        return self.session
+
+    def probe(self, url: str, headers: Dict) -> Tuple[Optional[int], bool]:
+        """回傳 (總長度, 是否支援 Range)；結果依 URL 快取，media_extension 與 download 共用同一次探測"""
+        if url not in self._probed:
+            self._probed[url] = self._probe(url, headers)
+        total, accepts, _ = self._probed[url]
+        return total, accepts
+
+    def _probe(self, url: str, headers: Dict) -> Tuple[Optional[int], bool, str]:
+        session = self._get_session(headers)
+        try:
+            r = session.get(url, headers={"Range": "bytes=0-0"}, timeout=15, stream=True)
+            content_range = r.headers.get("Content-Range", "")
+            content_type = r.headers.get("Content-Type", "")
+            r.close()
+            if r.status_code == 206 and "/" in content_range:
+                total = content_range.rsplit("/", 1)[1]
+                if total.isdigit(): return int(total), True, content_type
+            h = session.head(url, timeout=15, allow_redirects=True)
+            length = h.headers.get("Content-Length")
+            accepts = h.headers.get("Accept-Ranges", "").lower() == "bytes"
+            content_type = h.headers.get("Content-Type", content_type)
+            return (int(length) if length and length.isdigit() else None), accepts, content_type
+        except Exception as e:
+            self.logger.warning(f"[Ranged] 探測失敗: {e}")
+            return None, False, ""
+
+    def media_extension(self, url: str, headers: Dict = None) -> Optional[str]:
+        """
+        判斷輸出副檔名：先看 URL 路徑，再看探測到的 Content-Type
+        都認不出來時回傳 None，由呼叫端交給 yt-dlp (它會自己決定容器與副檔名)
+        """
+        ext = os.path.splitext(urlsplit(url).path)[1].lstrip(".").lower()
+        if ext in MEDIA_EXTENSIONS: return ext
+        self.probe(url, dict(headers or {}))
+        content_type = self._probed[url][2].split(";", 1)[0].strip().lower()
+        return CONTENT_TYPE_EXTENSIONS.get(content_type)
+
+    def download(self, url: str, output_path: str, headers: Dict = None, progress_callback: Callable = None) -> bool:
+        headers = dict(headers or {})
+        total, accepts = self.probe(url, headers)
+        if not total or not accepts:
+            self.logger.info("[Ranged] 伺服器不支援 Range 或長度未知，改用單線下載")
+            return False
+
+        part_path = output_path + ".part"
+        state_path = output_path + ".ranges.json"
+        chunks = [(start, min(start + self.chunk_size, total) - 1) for start in range(0, total, self.chunk_size)]
+        done = self._load_state(state_path, url, total, part_path)
+
+        if not (os.path.exists(part_path) and os.path.getsize(part_path) == total):
+            with open(part_path, 'wb') as f: f.truncate(total)  # 預配置
+            done = set()
+
+        self._bytes_done = sum(chunks[i][1] - chunks[i][0] + 1 for i in done if i < len(chunks))
+        pending = [i for i in range(len(chunks)) if i not in done]
+        self.logger.info(f"[Ranged] 🧩 {total / 1024 / 1024:.1f} MB，切成 {len(chunks)} 塊 × {self.connections} 連線"
+                         + (f" (續傳，已有 {len(done)} 塊)" if done else ""))
+
+        start_time = time.time()
+        start_bytes = self._bytes_done
+        with ThreadPoolExecutor(max_workers=self.connections) as executor:
+            futures = {executor.submit(self._fetch_chunk, url, headers, part_path, chunks[i]): i for i in pending}
+            for future in as_completed(futures):
+                if self.is_cancelled: break
+                idx = futures[future]
+                if future.result():
+                    with self._state_lock:
+                        done.add(idx)
+                        self._save_state(state_path, url, total, done)
+                if progress_callback:
+                    elapsed = max(time.time() - start_time, 0.001)
+                    speed = (self._bytes_done - start_bytes) / elapsed / 1024 / 1024
+                    progress_callback(self._bytes_done / total * 99, f"🧩 {len(done)}/{len(chunks)} | {speed:.1f} MB/s")
+            if self.is_cancelled:
+                for f in futures: f.cancel()
+
+        if self.is_cancelled or len(done) < len(chunks):
+            if not self.is_cancelled:
+                self.logger.error(f"[Ranged] 仍有 {len(chunks) - len(done)} 塊失敗，保留進度供續傳")
+            return False
+
+        if os.path.exists(output_path): os.remove(output_path)
+        os.replace(part_path, output_path)
+        try: os.remove(state_path)
+        except OSError: pass
+        return True
+
+    def _fetch_chunk(self, url, headers, part_path, chunk, retries: int = 3) -> bool:
+        start, end = chunk
+        host = host_of(url)
+        for attempt in range(retries):
+            if self.is_cancelled: return False
+            session = self._get_session(headers)
+            written = 0
+            try:
+                # 跨任務的同主機上限：同一個 CDN 的多個任務共用連線預算
+                if not GLOBAL_HOST_LIMITER.acquire(host, lambda: self.is_cancelled): return False
+                try:
+                    r = session.get(url, headers={"Range": f"bytes={start}-{end}"}, timeout=30, stream=True)
+                    if r.status_code != 206:
+                        r.close()
+                        raise IOError(f"HTTP {r.status_code}")
+                    with open(part_path, 'r+b') as f, self.cancel_token.hook(lambda: abort_response(r)):
+                        f.seek(start)
+                        for block in r.iter_content(chunk_size=256 * 1024):
+                            if self.is_cancelled: return False
+                            f.write(block)
+                            written += len(block)
+                            with self._state_lock: self._bytes_done += len(block)
+                            GLOBAL_BANDWIDTH.throttle(len(block), self.task_id, should_stop=lambda: self.is_cancelled)
+                    if written == end - start + 1:
+                        return True
+                    raise IOError(f"長度不符 {written}/{end - start + 1}")
+                finally:
+                    GLOBAL_HOST_LIMITER.release(host)
+            except Exception as e:
+                with self._state_lock: self._bytes_done -= written
+                self.logger.debug(f"[Ranged] 區塊 {start}-{end} 失敗 ({attempt + 1}/{retries}): {e}")
+                if self.cancel_token.wait(1 + attempt): return False
+        return False
+
+    def _state_key(self, url: str) -> str:
+        # 簽名參數可能會變：只用 host + path 判斷是不是同一個檔案
+        parts = urlsplit(url)
+        return f"{parts.netloc}{parts.path}"
+
+    def _load_state(self, state_path, url, total, part_path) -> set:
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get("url") == self._state_key(url) and state.get("total") == total \
+                    and state.get("chunk_size") == self.chunk_size and os.path.exists(part_path):
+                return set(state.get("done", []))
+        except (OSError, ValueError):
+            pass
+        return set()
+
+    def _save_state(self, state_path, url, total, done):
+        state = {"url": self._state_key(url), "total": total, "chunk_size": self.chunk_size, "done": sorted(done)}
+        atomic_write(state_path, json.dumps(state).encode('utf-8'))
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# src/logic/resume_journal.py
+# [VibeCoding] Crash-Safe Resume: 以「正規化播放清單」為鍵的續傳日誌
+
+import os
+import json
+import zlib
+import hashlib
+import threading
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+
+def canonical_playlist_id(playlist_url: str, segment_uris: Iterable[str] = ()) -> str:
+    """
+    產生播放清單的穩定 ID
+    只取 scheme + host + path (去掉 query string)，簽名 token 更換後仍對應到同一個任務
+    """
+    h = hashlib.sha1()
+    parts = urlsplit(playlist_url)
+    h.update(f"{parts.scheme}://{parts.netloc}{parts.path}".encode('utf-8'))
+    for uri in segment_uris:
+        h.update(b"\n")
+        h.update(urlsplit(uri).path.encode('utf-8'))
+    return h.hexdigest()
+
+
+def checksum(data: bytes) -> int:
+    return zlib.crc32(data) & 0xFFFFFFFF
+
+
+def atomic_write(path: str, data: bytes):
+    """先寫 .part 再 rename，確保檔案不會只寫了一半"""
+    part = path + ".part"
+    with open(part, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(part, path)
+
+
+class ResumeJournal:
+    """
+    續傳日誌 (journal.jsonl，一行一筆，只追加)
+    第一行為標頭 {"v", "playlist", "total"}，之後每筆記錄:
+      kind  : "m" = 已依序寫入合併檔, "s" = 已溢寫成獨立檔
+      i     : 片段 index
+      len   : 位元組數
+      crc   : CRC32
+      key   : 金鑰 ID (無加密為空字串)
+    """
+    FILE_NAME = "journal.jsonl"
+    VERSION = 1
+
+    def __init__(self, task_dir: str, playlist_id: str, total: int):
+        self.task_dir = task_dir
+        self.path = os.path.join(task_dir, self.FILE_NAME)
+        self.playlist_id = playlist_id
+        self.total = total
+        self.entries: Dict[int, dict] = {}
+        self.resumed = False
+        self._lock = threading.Lock()
+
+        if not os.path.exists(task_dir): os.makedirs(task_dir)
+        self._load()
+        self._fh = open(self.path, 'a', encoding='utf-8')
+        if not self.resumed:
+            self._append({"v": self.VERSION, "playlist": playlist_id, "total": total})
+
+    def _load(self):
+        if not os.path.exists(self.path): return
+        try:
+            with open(self.path, 'rb') as f:
+                raw = f.read()
+            # 每筆記錄以換行結尾；最後一段沒有換行代表當機時只寫了一半
+            lines = raw.split(b"\n")
+            header = json.loads(lines[0]) if len(lines) > 1 else {}
+            if header.get("v") != self.VERSION or header.get("playlist") != self.playlist_id or header.get("total") != self.total:
+                raise ValueError("journal header mismatch")
+            valid_end = len(lines[0]) + 1
+            for line in lines[1:-1]:
+                try: rec = json.loads(line)
+                except ValueError: break
+                self.entries[rec["i"]] = rec
+                valid_end += len(line) + 1
+            if valid_end < len(raw):
+                # 截掉殘缺的尾巴：之後以 'a' 追加的記錄才不會黏在半行後面，下次續傳整段讀不到
+                with open(self.path, 'r+b') as f:
+                    f.truncate(valid_end)
+            self.resumed = True
+        except Exception:
+            # 日誌不可用：視為全新任務
+            self.entries.clear()
+            try: os.remove(self.path)
+            except: pass
+
+    def _append(self, rec: dict):
+        self._fh.write(json.dumps(rec, separators=(',', ':')) + "\n")
+        self._fh.flush()
+
+    def record(self, kind: str, index: int, length: int, crc: int, key_id: str = ""):
+        rec = {"kind": kind, "i": index, "len": length, "crc": crc, "key": key_id}
+        with self._lock:
+            self.entries[index] = rec
+            self._append(rec)
+
+    def get(self, index: int) -> Optional[dict]:
+        return self.entries.get(index)
+
+    def close(self):
+        with self._lock:
+            try: self._fh.close()
+            except: pass
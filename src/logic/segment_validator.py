@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# src/logic/segment_validator.py
+# [VibeCoding] Segment Integrity: 回應長度 / 錯誤頁偵測 + 解密後 TS 對齊與 Continuity Counter 檢查
+
+from typing import Optional
+from urllib.parse import urlsplit
+from src.logic.ts_sanitizer import TS_PACKET_SIZE, TS_SYNC_BYTE, count_synced_packets, HAS_NUMPY
+
+if HAS_NUMPY:
+    import numpy as np
+
+CONTAINER_TS = "ts"
+CONTAINER_FMP4 = "fmp4"
+CONTAINER_AUDIO = "audio"   # Packed Audio (ADTS AAC / AC-3 / MP3，開頭可能帶 ID3 時間戳)
+CONTAINER_AUTO = "auto"     # 副檔名看不出來：依第一個通過解密的片段內容判定
+
+# 片段副檔名 -> 容器
+SEGMENT_EXTENSIONS = {
+    ".ts": CONTAINER_TS, ".m2ts": CONTAINER_TS, ".mts": CONTAINER_TS,
+    ".m4s": CONTAINER_FMP4, ".mp4": CONTAINER_FMP4, ".m4v": CONTAINER_FMP4, ".m4a": CONTAINER_FMP4,
+    ".cmfv": CONTAINER_FMP4, ".cmfa": CONTAINER_FMP4,
+    ".aac": CONTAINER_AUDIO, ".adts": CONTAINER_AUDIO, ".ac3": CONTAINER_AUDIO, ".ec3": CONTAINER_AUDIO,
+    ".mp3": CONTAINER_AUDIO,
+}
+
+# 狀態碼 200 但內容其實是錯誤頁 (CDN 驗證失敗、登入頁、JSON 錯誤訊息)
+ERROR_PAGE_PREFIXES = (b"<!doctype", b"<html", b"<?xml", b"<head", b"{\"", b"{'")
+
+# fMP4 片段 / init segment 開頭可能出現的 box
+FMP4_BOXES = (b"ftyp", b"styp", b"moof", b"sidx", b"emsg", b"prft", b"moov", b"free", b"mdat")
+
+MIN_SYNC_RATIO = 0.98       # 至少 98% 的封包開頭是 0x47
+MAX_CC_ERROR_RATIO = 0.01   # Continuity Counter 跳號超過 1% 的封包視為損毀
+
+
+class SegmentInvalid(Exception):
+    """片段內容未通過完整性檢查 (訊息為失敗原因)"""
+
+
+def check_response(status: int, headers, body) -> Optional[str]:
+    """網路層檢查 (body 可為 bytes 或磁碟暫存的 SpooledBody)：回傳失敗原因，通過則回傳 None"""
+    if not body:
+        return "空白回應"
+    # 有 Content-Encoding 時 body 已被解壓，長度不會等於 Content-Length
+    length = headers.get("Content-Length") if headers else None
+    if length and str(length).isdigit() and not headers.get("Content-Encoding") and int(length) != len(body):
+        return f"長度不符 ({len(body)}/{length})"
+    content_type = (headers.get("Content-Type", "") if headers else "").lower()
+    head = (body[:64] if isinstance(body, (bytes, bytearray)) else body.head(64)).lstrip().lower()
+    if "text/html" in content_type or head.startswith(ERROR_PAGE_PREFIXES):
+        return "錯誤頁 (HTML/JSON)"
+    return None
+
+
+def container_from_uri(uri: str) -> Optional[str]:
+    path = urlsplit(uri or "").path.lower()
+    dot = path.rfind(".")
+    return SEGMENT_EXTENSIONS.get(path[dot:]) if dot != -1 else None
+
+
+def sniff_container(data: bytes) -> Optional[str]:
+    """依內容開頭判定容器：TS 同步位元組 / ADTS、AC-3、MP3 同步字 (或 ID3) / fMP4 box；無法辨識回傳 None"""
+    if len(data) < 8: return None
+    if data[0] == TS_SYNC_BYTE and (len(data) <= TS_PACKET_SIZE or data[TS_PACKET_SIZE] == TS_SYNC_BYTE):
+        return CONTAINER_TS
+    if data[4:8] in FMP4_BOXES:
+        return CONTAINER_FMP4
+    if data.startswith(b"ID3") or data.startswith(b"\x0b\x77") or (data[0] == 0xFF and data[1] & 0xE0 == 0xE0):
+        return CONTAINER_AUDIO
+    return None
+
+
+def playlist_container(playlist) -> str:
+    """每個播放清單判定一次：EXT-X-MAP -> fMP4，否則看第一個片段的副檔名，都看不出來則 CONTAINER_AUTO"""
+    segments = playlist.segments
+    if any(getattr(seg, "init_section", None) is not None for seg in segments):
+        return CONTAINER_FMP4
+    return (container_from_uri(segments[0].uri) if segments else None) or CONTAINER_AUTO
+
+
+def resolve_container(container: Optional[str], data: bytes) -> Optional[str]:
+    """CONTAINER_AUTO 時以內容判定 (判定不出來維持 AUTO)；呼叫端可把結果記下來供後續片段沿用"""
+    if container != CONTAINER_AUTO: return container
+    return sniff_container(data) or CONTAINER_AUTO
+
+
+def strip_pkcs7(data: bytes) -> bytes:
+    """AES-128 (CBC) 解密後移除 PKCS#7 填充；填充不合法時原樣回傳"""
+    if not data: return data
+    pad = data[-1]
+    if 1 <= pad <= 16 and len(data) >= pad and data[-pad:] == bytes([pad]) * pad:
+        return data[:-pad]
+    return data
+
+
+def continuity_errors(data: bytes) -> int:
+    """統計同一 PID 的 Continuity Counter 跳號次數 (略過 null packet、無 payload 與 discontinuity 標記的封包)"""
+    packets = len(data) // TS_PACKET_SIZE
+    if packets < 2: return 0
+    if HAS_NUMPY and packets > 64:
+        view = np.frombuffer(data, dtype=np.uint8, count=packets * TS_PACKET_SIZE).reshape(packets, TS_PACKET_SIZE)
+        pid = ((view[:, 1].astype(np.uint16) & 0x1F) << 8) | view[:, 2]
+        afc = (view[:, 3] >> 4) & 0x3
+        cc = view[:, 3] & 0xF
+        disc = ((afc & 0x2) != 0) & (view[:, 4] > 0) & ((view[:, 5] & 0x80) != 0)
+        keep = (pid != 0x1FFF) & ((afc & 0x1) != 0)
+        pid, cc, disc = pid[keep], cc[keep], disc[keep]
+        if pid.size < 2: return 0
+        order = np.argsort(pid, kind="stable")
+        pid, cc, disc = pid[order], cc[order], disc[order]
+        same = pid[1:] == pid[:-1]
+        expected = (cc[:-1] + 1) & 0xF
+        bad = same & ~disc[1:] & (cc[1:] != expected) & (cc[1:] != cc[:-1])
+        return int(np.count_nonzero(bad))
+
+    errors = 0
+    last = {}
+    for i in range(packets):
+        off = i * TS_PACKET_SIZE
+        b1, b2, b3 = data[off + 1], data[off + 2], data[off + 3]
+        pid = ((b1 & 0x1F) << 8) | b2
+        afc = (b3 >> 4) & 0x3
+        if pid == 0x1FFF or not afc & 0x1: continue
+        cc = b3 & 0xF
+        if afc & 0x2 and data[off + 4] > 0 and data[off + 5] & 0x80:
+            last[pid] = cc
+            continue
+        prev = last.get(pid)
+        if prev is not None and cc != (prev + 1) & 0xF and cc != prev:
+            errors += 1
+        last[pid] = cc
+    return errors
+
+
+def check_payload(data: bytes, container: Optional[str]) -> Optional[str]:
+    """解密 / 清洗後的內容檢查：回傳失敗原因，通過則回傳 None"""
+    if not data:
+        return "解密後為空"
+    if container == CONTAINER_AUTO:
+        container = sniff_container(data)
+    if container == CONTAINER_AUDIO:
+        # 只檢查開頭的同步字；TS 的對齊 / Continuity Counter 不適用
+        if sniff_container(data) != CONTAINER_AUDIO:
+            return "音訊片段同步字錯誤 (可能解密失敗)"
+        return None
+    if container == CONTAINER_FMP4:
+        if len(data) < 8 or data[4:8] not in FMP4_BOXES:
+            return "不是有效的 fMP4 box"
+        return None
+    if container != CONTAINER_TS:
+        return None
+
+    packets = len(data) // TS_PACKET_SIZE
+    if packets == 0 or data[0] != TS_SYNC_BYTE:
+        return "TS 同步位元組錯誤 (可能解密失敗)"
+    if len(data) % TS_PACKET_SIZE:
+        return f"TS 未對齊 ({len(data) % TS_PACKET_SIZE} 位元組殘餘)"
+    if count_synced_packets(data) < packets * MIN_SYNC_RATIO:
+        return "TS 同步位元組比例過低"
+    cc_errors = continuity_errors(data)
+    if cc_errors > max(1, packets * MAX_CC_ERROR_RATIO):
+        return f"Continuity Counter 跳號 {cc_errors} 次"
+    return None
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+# src/logic/segment_writer.py
+# [VibeCoding] Streaming Merge: 片段完成即依播放清單順序寫入單一輸出檔 (取代 seg_XXXXX.ts + 二次合併)
+
+import os
+import threading
+from typing import Dict, List, Optional
+from src.logic.resume_journal import ResumeJournal, atomic_write, checksum
+from src.logic.memory_budget import GLOBAL_MEMORY_BUDGET
+
+
+class OrderedSegmentWriter:
+    """
+    有界重排寫入器 (Bounded Reorder Buffer)
+    1. 片段可亂序 put()，只有輪到的 index 才寫入輸出檔，
+       其餘暫存在記憶體 (上限 max_buffer_bytes，且需取得全域記憶體預算)，否則溢寫到 spill_dir。
+    2. 若提供 journal，每次落盤都記錄下來；重新建立時會依日誌還原進度 (只缺的片段需要重抓)。
+       key_ids 為目前清單每個片段的金鑰 ID：日誌記錄的金鑰不同 (金鑰輪換 / 清單重新簽發) 的片段不沿用。
+    total=None 代表片段數未知 (直播錄製)。
+    可另外掛上 sink (例如 FFmpegPipe)：每段依序寫出時同步轉送一份，用於邊下載邊轉檔。
+    """
+    def __init__(self, output_path: str, total: Optional[int], spill_dir: str,
+                 max_buffer_bytes: int = 64 * 1024 * 1024, journal: Optional[ResumeJournal] = None,
+                 key_ids: Optional[List[str]] = None):
+        self.output_path = output_path
+        self.total = total
+        self.spill_dir = spill_dir
+        self.max_buffer_bytes = max_buffer_bytes
+        self.journal = journal
+        self.key_ids = key_ids
+
+        self._lock = threading.Lock()
+        self._done = set()            # 已寫入 (或已排入緩衝/溢寫) 的 index
+        self._skipped = set()         # 放棄的 index (強行合併時跳過)
+        self._buffer: Dict[int, bytes] = {}
+        self._buffer_bytes = 0
+        self._spilled: Dict[int, str] = {}
+        self._next_idx = 0
+        self.bytes_written = 0
+        self.resumed_count = 0
+        self.sink = None              # 需具備 write(bytes)；只收到掛上之後才寫出的資料
+
+        resuming = journal is not None and journal.resumed and os.path.exists(output_path)
+
+        if resuming:
+            self._file = open(output_path, 'r+b')
+            self._restore_ordered()
+        else:
+            self._file = open(output_path, 'wb')
+        GLOBAL_MEMORY_BUDGET.add_reclaimer(self.spill_buffer)
+
+    # --- 續傳還原 ---
+    def _restore_ordered(self):
+        """合併檔只信任日誌中連續的前綴，多寫出的尾巴截掉；溢寫檔需通過長度 + CRC 檢查"""
+        j = self.journal
+        valid_len = 0
+        while True:
+            rec = j.get(self._next_idx)
+            # 金鑰不符：之後的內容是用舊金鑰解出來的，前綴到此為止
+            if not rec or rec["kind"] != "m" or not self._key_matches(self._next_idx, rec): break
+            valid_len += rec["len"]
+            self._done.add(self._next_idx)
+            self._next_idx += 1
+
+        if os.path.getsize(self.output_path) < valid_len:
+            # 合併檔比日誌短 (不該發生)：整個重來
+            self._file.truncate(0)
+            self._done.clear()
+            self._next_idx = 0
+            valid_len = 0
+        self._file.truncate(valid_len)
+        self._file.seek(valid_len)
+        self.bytes_written = valid_len
+
+        for idx, rec in j.entries.items():
+            if rec["kind"] != "s" or idx < self._next_idx or not self._key_matches(idx, rec): continue
+            path = self._spill_path(idx)
+            try:
+                with open(path, 'rb') as f: data = f.read()
+                if len(data) == rec["len"] and checksum(data) == rec["crc"]:
+                    self._spilled[idx] = path
+                    self._done.add(idx)
+            except OSError:
+                pass
+        self.resumed_count = len(self._done)
+
+    def _key_matches(self, idx: int, rec: dict) -> bool:
+        if self.key_ids is None or idx >= len(self.key_ids): return True
+        return rec.get("key", "") == self.key_ids[idx]
+
+    def _spill_path(self, idx: int) -> str:
+        return os.path.join(self.spill_dir, f"spill_{idx:05d}.ts")
+
+    # --- 查詢 ---
+    def is_done(self, idx: int) -> bool:
+        return idx in self._done
+
+    @property
+    def done_count(self) -> int:
+        return len(self._done)
+
+    # --- 寫入 ---
+    def put(self, idx: int, data: bytes, key_id: str = ""):
+        with self._lock:
+            if idx in self._done: return
+            self._done.add(idx)
+            if idx == self._next_idx:
+                self._write(idx, data, key_id)
+                self._next_idx += 1
+                self._drain()
+            elif self._buffer_bytes + len(data) <= self.max_buffer_bytes and GLOBAL_MEMORY_BUDGET.try_acquire(len(data)):
+                self._buffer[idx] = (data, key_id)
+                self._buffer_bytes += len(data)
+            else:
+                # 緩衝區已滿 / 全域預算用完：溢寫到磁碟
+                self._spill(idx, data, key_id)
+
+    def _spill(self, idx: int, data: bytes, key_id: str):
+        """溢寫到磁碟 (.part -> rename)，輪到時再讀回 (呼叫端需持有鎖)"""
+        spill_path = self._spill_path(idx)
+        atomic_write(spill_path, data)
+        self._spilled[idx] = spill_path
+        if self.journal: self.journal.record("s", idx, len(data), checksum(data), key_id)
+
+    def spill_buffer(self):
+        """全域預算吃緊時由 MemoryBudget 呼叫：把重排緩衝整批溢寫到磁碟並歸還預算"""
+        with self._lock:
+            if not self._buffer or self._file.closed: return
+            for idx, (data, key_id) in self._buffer.items():
+                self._spill(idx, data, key_id)
+            self._release_buffer()
+
+    def skip(self, idx: int):
+        """標記某片段永久缺失，讓後續片段可以繼續寫出"""
+        with self._lock:
+            if idx in self._done: return
+            self._skipped.add(idx)
+            self._drain()
+
+    def _write(self, idx: int, data: bytes, key_id: str = ""):
+        self._file.write(data)
+        self.bytes_written += len(data)
+        if self.sink is not None:
+            self.sink.write(data)
+        if self.journal:
+            # 先落盤再記日誌：當機時合併檔只會比日誌長，續傳時截掉即可
+            self._file.flush()
+            self.journal.record("m", idx, len(data), checksum(data), key_id)
+
+    def _drain(self):
+        """連續寫出已到齊的片段 (呼叫端需持有鎖)"""
+        while self.total is None or self._next_idx < self.total:
+            idx = self._next_idx
+            if idx in self._buffer:
+                data, key_id = self._buffer.pop(idx)
+                self._buffer_bytes -= len(data)
+                self._write(idx, data, key_id)
+                GLOBAL_MEMORY_BUDGET.release(len(data))
+            elif idx in self._spilled:
+                path = self._spilled.pop(idx)
+                with open(path, 'rb') as f: data = f.read()
+                rec = self.journal.get(idx) if self.journal else None
+                self._write(idx, data, rec["key"] if rec else "")
+                try: os.remove(path)
+                except: pass
+            elif idx in self._skipped:
+                pass
+            else:
+                break
+            self._next_idx += 1
+
+    def finish(self, allow_gaps: bool = False) -> bool:
+        """
+        結束寫入並關閉檔案
+        allow_gaps=True 時，所有未完成的片段視為缺失直接跳過 (強行合併)
+        """
+        with self._lock:
+            if allow_gaps:
+                upper = self.total
+                if upper is None:
+                    upper = max(self._done | self._skipped, default=-1) + 1
+                for i in range(upper):
+                    if i not in self._done: self._skipped.add(i)
+            self._drain()
+            self._release_buffer()
+            complete = self.total is None or self._next_idx >= self.total
+            self._file.close()
+            if self.journal: self.journal.close()
+            GLOBAL_MEMORY_BUDGET.remove_reclaimer(self.spill_buffer)
+            return complete or allow_gaps
+
+    def abort(self):
+        """中止寫入；有日誌時保留已落盤的進度供下次續傳，否則清掉溢寫檔"""
+        with self._lock:
+            try: self._file.close()
+            except: pass
+            if self.journal:
+                self.journal.close()
+            else:
+                for path in self._spilled.values():
+                    try: os.remove(path)
+                    except: pass
+            self._spilled.clear()
+            self._release_buffer()
+        GLOBAL_MEMORY_BUDGET.remove_reclaimer(self.spill_buffer)
+
+    def _release_buffer(self):
+        """丟棄仍在重排緩衝中的片段並歸還記憶體預算 (呼叫端需持有鎖)"""
+        GLOBAL_MEMORY_BUDGET.release(self._buffer_bytes)
+        self._buffer.clear()
+        self._buffer_bytes = 0
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# src/logic/session_pool.py
+# [VibeCoding] Session Pool: 執行緒安全的連線池 (每條執行緒各自的 Session，跨任務重用 keep-alive / TLS 連線)
+
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from curl_cffi import requests as cffi_requests
+    HAS_CURL_CFFI = True
+except ImportError:
+    HAS_CURL_CFFI = False
+
+try:
+    from curl_cffi.const import CurlHttpVersion
+    HTTP2 = CurlHttpVersion.V2TLS
+except Exception:
+    HTTP2 = None
+
+
+class _Lease:
+    """綁在 thread-local 上：執行緒結束時被回收，順便把 Session 還回池子給下一條執行緒用"""
+    def __init__(self, pool, session):
+        self.pool = pool
+        self.session = session
+
+    def __del__(self):
+        try: self.pool._checkin(self.session)
+        except Exception: pass
+
+
+class SessionPool:
+    """
+    全域 Session 池
+    - 每條執行緒拿到自己的 Session (requests / curl_cffi 的 Session 都不保證執行緒安全)
+    - 執行緒結束後 Session 回到閒置佇列，下一個任務直接沿用已建立的 keep-alive / TLS 連線
+    - requests 後端：所有 Session 掛同一個 HTTPAdapter，urllib3 的連線池依主機共用
+    - curl_cffi 後端：以 chrome 指紋建立 (支援時協商 HTTP/2)；連線快取屬於各自的 Session，
+      同步請求一次一個，不會跨執行緒在同一條連線上多工，重用的是同一執行緒前後請求的連線
+    - Session 本身不帶任何任務的 Headers / Cookie：Headers 一律由 PooledSession 逐請求帶入，
+      伺服器設下的 Cookie 在請求結束時就搬進該任務的 PooledSession.cookies 並清空共用的 cookie jar，
+      歸還池子時再清一次，下一個任務不會帶著上一個任務的登入狀態
+    """
+    def __init__(self, max_idle: int = 64, pool_maxsize: int = 64):
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._idle = deque()
+        self._local = threading.local()
+        self._adapter = HTTPAdapter(pool_connections=32, pool_maxsize=pool_maxsize)
+        self.sessions_created = 0
+        self.leases = 0
+        self.requests = 0
+
+    def _new_session(self):
+        if HAS_CURL_CFFI:
+            try:
+                session = cffi_requests.Session(impersonate="chrome120", http_version=HTTP2) if HTTP2 \
+                    else cffi_requests.Session(impersonate="chrome120")
+            except TypeError:
+                session = cffi_requests.Session(impersonate="chrome120")
+        else:
+            session = requests.Session()
+            session.mount("https://", self._adapter)
+            session.mount("http://", self._adapter)
+        self.sessions_created += 1
+        return session
+
+    def thread_session(self):
+        """取得目前執行緒專用的 Session (第一次呼叫時從閒置佇列借用或新建)"""
+        lease = getattr(self._local, "lease", None)
+        if lease is None:
+            with self._lock:
+                session = self._idle.pop() if self._idle else None
+                if session is None: session = self._new_session()
+                self.leases += 1
+            lease = _Lease(self, session)
+            self._local.lease = lease
+        return lease.session
+
+    @staticmethod
+    def _drain_cookies(session) -> Dict[str, str]:
+        """取出 Session cookie jar 內的 Cookie 並清空 (requests / curl_cffi 兩種 jar 都支援)"""
+        jar = getattr(session.cookies, "jar", session.cookies)
+        try:
+            cookies = {c.name: c.value for c in jar}
+            jar.clear()
+        except Exception:
+            return {}
+        return cookies
+
+    def _checkin(self, session):
+        self._drain_cookies(session)
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(session)
+                return
+        try: session.close()
+        except Exception: pass
+
+    def _handshakes(self) -> Optional[int]:
+        """實際建立的連線數 (從 urllib3 連線池讀出)；curl_cffi 的連線在 libcurl 內部，無法統計時回傳 None"""
+        if HAS_CURL_CFFI: return None
+        pools = self._adapter.poolmanager.pools
+        return sum(getattr(pools.get(key), "num_connections", 0) for key in list(pools.keys()))
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            requests_made = self.requests
+            leases = self.leases
+            created = self.sessions_created
+        handshakes = self._handshakes()
+        return {
+            "sessions": created,
+            "leases": leases,
+            "requests": requests_made,
+            "handshakes": handshakes,
+            # 每個請求平均重用了多少既有連線 (1 - 新建連線 / 請求數)；無法統計連線數時為 None
+            "reuse_ratio": (1 - handshakes / requests_made) if requests_made and handshakes is not None else None,
+        }
+
+
+class PooledSession:
+    """
+    給單一下載任務用的 Session 門面 (介面與 requests.Session 的 get / head / headers 相容)
+    - headers 只屬於這個任務，修改它不會影響其他任務或共用的 Session
+    - 每次請求都向池子取目前執行緒的 Session，多執行緒呼叫也安全
+    - cookies 同樣只屬於這個任務：伺服器回傳的 Set-Cookie 收進 self.cookies，不留在共用的 Session
+    """
+    def __init__(self, pool: SessionPool, headers: Optional[Dict] = None):
+        self.pool = pool
+        self.headers: Dict[str, str] = dict(headers or {})
+        self.cookies: Dict[str, str] = {}
+
+    def _merge(self, headers):
+        merged = dict(self.headers)
+        if headers: merged.update(headers)
+        return merged
+
+    def request(self, method: str, url: str, headers: Optional[Dict] = None, **kwargs):
+        session = self.pool.thread_session()
+        if self.cookies: kwargs.setdefault("cookies", self.cookies)
+        with self.pool._lock:
+            self.pool.requests += 1
+        try:
+            return session.request(method, url, headers=self._merge(headers), **kwargs)
+        finally:
+            self.cookies.update(self.pool._drain_cookies(session))
+
+    def get(self, url: str, headers: Optional[Dict] = None, **kwargs):
+        return self.request("GET", url, headers=headers, **kwargs)
+
+    def head(self, url: str, headers: Optional[Dict] = None, **kwargs):
+        return self.request("HEAD", url, headers=headers, **kwargs)
+
+    def close(self):
+        """Session 屬於池子，不需要關閉"""
+        pass
+
+
+# 全域共用實例 (所有任務共用)
+GLOBAL_SESSION_POOL = SessionPool()
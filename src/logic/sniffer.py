@@ -1,6 +1,5 @@
 # src/logic/sniffer.py
 import json
-import time
 import os
 import logging
 from typing import Optional, Tuple, Dict
@@ -11,6 +10,8 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.common.by import By
+from src.logic.cancel_token import CancelToken
+from src.logic.browser_pool import GLOBAL_BROWSER_POOL
 
 class BrowserSniffer:
     """
@@ -19,10 +20,13 @@ class BrowserSniffer:
     1. 增加啟動緩衝時間，防止抖音秒退。
     2. 強化 WebDriver 選項，減少崩潰機率。
     3. 針對 NoSuchWindowException 進行防護。
+    4. 任務取消時立即關閉瀏覽器 (cancel_token 與 DownloadWorker 共用)。
+    5. 優先附掛到常駐瀏覽器池的 Chrome (只開新分頁)，不必每次冷啟動。
     """
-    def __init__(self):
+    def __init__(self, cancel_token: Optional[CancelToken] = None):
         logging.getLogger('WDM').setLevel(logging.NOTSET)
         self.logger = logging.getLogger("Sniffer")
+        self.cancel_token = cancel_token or CancelToken()
 
     def extract_stream_url(self, target_url: str) -> Tuple[Optional[str], Dict]:
         self.logger.info(f"開始嗅探任務: {target_url}")
@@ -70,12 +74,24 @@ class BrowserSniffer:
         found_url = None
         found_headers = {}
 
+        # [Browser Pool] 附掛到常駐 Chrome (debuggerAddress)；池子不可用時照舊自己啟動
+        pool_args = [a for a in options.arguments if not a.startswith("--user-data-dir")]
+        lease = GLOBAL_BROWSER_POOL.lease(profile_dir, pool_args, should_stop=self.cancel_token)
+
+        def close_driver():
+            try:
+                if lease: driver.close()   # 附掛模式只關自己開的分頁，瀏覽器留給下一個任務
+                driver.quit()
+            except: pass
+
         # 啟動瀏覽器
         max_retries = 3
         for attempt in range(max_retries):
+            if self.cancel_token.cancelled: break
             try:
                 service = Service(ChromeDriverManager().install())
-                driver = webdriver.Chrome(service=service, options=options)
+                driver = webdriver.Chrome(service=service, options=lease.selenium_options() if lease else options)
+                if lease: driver.switch_to.new_window('tab')
                 try:
                     driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
                         "source": "Object.defineProperty(navigator, 'webdriver', { get: () => undefined });"
@@ -87,17 +103,21 @@ class BrowserSniffer:
             except Exception as e:
                 self.logger.warning(f"瀏覽器啟動失敗 ({attempt+1}): {e}")
                 if driver: 
-                    try: driver.quit()
-                    except: pass
-                time.sleep(2)
+                    close_driver()
+                    driver = None
+                if self.cancel_token.wait(2): break
 
-        if not driver: return None, {}
+        if not driver:
+            if lease: lease.release()
+            return None, {}
 
+        # 取消時從其他執行緒直接關閉分頁 / 瀏覽器：阻塞中的 driver 呼叫會丟出例外，由下方流程收尾
+        self.cancel_token.on_cancel(close_driver)
         try:
             driver.get(target_url)
             self.logger.info("網頁請求發送，等待渲染 (3秒緩衝)...")
             # [Fix] 關鍵緩衝：讓網頁有時間載入，不要急著操作
-            time.sleep(3)
+            if self.cancel_token.wait(3): return None, {}
             
             req_map = {}
             extra_map = {} 
@@ -179,14 +199,15 @@ class BrowserSniffer:
                     try: driver.execute_script("window.scrollTo(0, 300);")
                     except: pass
                 
-                time.sleep(1)
+                if self.cancel_token.wait(1): break
 
         except Exception as e:
+            if self.cancel_token.cancelled: return None, {}
             self.logger.error(f"嗅探流程異常: {e}", exc_info=True)
         finally:
-            if driver:
-                try: driver.quit()
-                except: pass
+            self.cancel_token.remove(close_driver)
+            close_driver()
+            if lease: lease.release()
 
         return found_url, found_headers
 
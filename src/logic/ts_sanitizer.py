@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# src/logic/ts_sanitizer.py
+# [VibeCoding] Shared TS Sanitizer: 偽裝頭偵測 + 同步位元組定位 (三個引擎共用)
+
+from collections import namedtuple
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+_SYNC = b'\x47'
+
+# 已知的偽裝前綴 (CDN 把 TS 包成圖片以躲避流量過濾)
+DISGUISE_PREFIXES = (
+    (b'\x89PNG', "PNG"),
+    (b'\xFF\xD8\xFF', "JPEG"),
+    (b'GIF87a', "GIF"),
+    (b'GIF89a', "GIF"),
+    (b'BM', "BMP"),
+    (b'RIFF', "WEBP"),
+)
+
+SanitizeResult = namedtuple("SanitizeResult", ["data", "offset", "stripped_packets", "disguise"])
+
+
+def detect_disguise(data: bytes):
+    """回傳偽裝格式名稱 (PNG/JPEG/...)，真正的 TS 或無法辨識則回傳 None"""
+    if len(data) < TS_PACKET_SIZE or data[0] == TS_SYNC_BYTE and is_synced(data, 0, 2):
+        return None
+    for prefix, name in DISGUISE_PREFIXES:
+        if data.startswith(prefix):
+            return name
+    return None
+
+
+def is_synced(data: bytes, offset: int, packets: int) -> bool:
+    """offset 起連續 packets 個封包的第一個位元組是否都是 0x47 (以 stride slice 一次比對)"""
+    end = offset + TS_PACKET_SIZE * (packets - 1) + 1
+    if end > len(data): return False
+    return data[offset:end:TS_PACKET_SIZE] == _SYNC * packets
+
+
+def count_synced_packets(data: bytes, offset: int = 0) -> int:
+    """從 offset 起，統計有幾個封包開頭是同步位元組 (大型片段用 NumPy 向量化)"""
+    usable = (len(data) - offset) // TS_PACKET_SIZE
+    if usable <= 0: return 0
+    if HAS_NUMPY and usable > 64:
+        view = np.frombuffer(data, dtype=np.uint8, count=usable * TS_PACKET_SIZE, offset=offset)
+        return int(np.count_nonzero(view[::TS_PACKET_SIZE] == TS_SYNC_BYTE))
+    return data[offset:offset + usable * TS_PACKET_SIZE:TS_PACKET_SIZE].count(_SYNC)
+
+
+def find_sync_offset(data: bytes, search_limit: int = 4096, probe_packets: int = 8) -> int:
+    """
+    找出真正的 TS 起點：以 bytes.find 跳到下一個 0x47，再用 stride slice 驗證後續封包
+    (取代逐位元組的 Python 迴圈)；找不到回傳 -1
+    """
+    limit = min(len(data), search_limit)
+    pos = data.find(_SYNC, 0, limit)
+    while pos != -1:
+        fit = (len(data) - pos - 1) // TS_PACKET_SIZE + 1
+        k = min(probe_packets, fit)
+        if k >= 2 and is_synced(data, pos, k):
+            return pos
+        pos = data.find(_SYNC, pos + 1, limit)
+    return -1
+
+
+def sanitize(data: bytes) -> SanitizeResult:
+    """
+    移除已知偽裝頭；只有辨識出偽裝前綴時才裁切，避免誤傷尚未解密的密文
+    stripped_packets = 被裁掉的位元組折合的 TS 封包數 (無條件進位)
+    """
+    disguise = detect_disguise(data)
+    if not disguise:
+        return SanitizeResult(data, 0, 0, None)
+    offset = find_sync_offset(data)
+    if offset <= 0:
+        return SanitizeResult(data, 0, 0, disguise)
+    stripped = -(-offset // TS_PACKET_SIZE)
+    return SanitizeResult(data[offset:], offset, stripped, disguise)
@@ -9,9 +9,9 @@ from PySide6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
     QLineEdit, QPushButton, QLabel, QComboBox, 
     QProgressBar, QFileDialog, QMessageBox, QApplication,
-    QTableWidget, QTableWidgetItem, QHeaderView, QMenu, QAbstractItemView, QFrame
+    QTableWidget, QTableWidgetItem, QHeaderView, QMenu, QAbstractItemView, QFrame, QDoubleSpinBox
 )
-from PySide6.QtCore import Qt, Slot, QSize
+from PySide6.QtCore import Qt, Slot, QSize, QTimer
 from PySide6.QtGui import QAction, QFont, QIcon, QFontMetrics
 
 # 載入配置與新版核心
@@ -36,7 +36,15 @@ class MainWindow(QMainWindow):
         self.resize(*UI_CONFIG.get("window_size", (780, 650)))
         
         # [CORE] 初始化 QueueManager
-        self.queue_manager = QueueManager(max_concurrent=UI_CONFIG.get("max_concurrent", 3))
+        self.queue_manager = QueueManager(
+            max_concurrent=UI_CONFIG.get("max_concurrent", 3),
+            per_host_limit=UI_CONFIG.get("per_host_limit", 16),
+            memory_budget_mb=UI_CONFIG.get("memory_budget_mb", 512),
+            browser_pool=UI_CONFIG.get("browser_pool", True),
+            browser_pool_max_uses=UI_CONFIG.get("browser_pool_max_uses", 20),
+            browser_pool_memory_mb=UI_CONFIG.get("browser_pool_memory_mb", 1500),
+        )
+        self.queue_manager.set_global_rate_limit(UI_CONFIG.get("global_rate_limit_mbps", 0) * 1024 * 1024)
         self._connect_backend_signals()
         
         self.setup_ui()
@@ -45,6 +53,15 @@ class MainWindow(QMainWindow):
         self.status_label = QLabel("系統就緒 - FFmpeg 支援已啟用")
         self.status_label.setStyleSheet("font-size: 12px; color: gray;")
         self.statusBar().addWidget(self.status_label)
+
+        # 記憶體預算用量 (目前 / 峰值 / 上限)，每秒更新
+        self.mem_label = QLabel()
+        self.mem_label.setStyleSheet("font-size: 12px; color: gray;")
+        self.statusBar().addPermanentWidget(self.mem_label)
+        self.mem_timer = QTimer(self)
+        self.mem_timer.timeout.connect(self.update_memory_usage)
+        self.mem_timer.start(1000)
+        self.update_memory_usage()
         
         self.task_counter = 0
 
@@ -158,6 +175,18 @@ class MainWindow(QMainWindow):
         
         self.path_btn = QPushButton("瀏覽...")
         self.path_btn.clicked.connect(self.handle_path_selection)
+
+        # [限速] 全域頻寬上限，變更後立即套用到所有進行中的任務
+        lbl_rate = QLabel("限速:")
+        self.rate_spin = QDoubleSpinBox()
+        self.rate_spin.setRange(0, 1000)
+        self.rate_spin.setSingleStep(0.5)
+        self.rate_spin.setDecimals(1)
+        self.rate_spin.setSuffix(" MB/s")
+        self.rate_spin.setSpecialValueText("不限速")
+        self.rate_spin.setFixedWidth(130)
+        self.rate_spin.setValue(UI_CONFIG.get("global_rate_limit_mbps", 0))
+        self.rate_spin.valueChanged.connect(self.handle_rate_limit_changed)
         
         row3.addWidget(lbl_fmt)
         row3.addWidget(self.format_combo)
@@ -165,6 +194,9 @@ class MainWindow(QMainWindow):
         row3.addWidget(lbl_path)
         row3.addWidget(self.path_input)
         row3.addWidget(self.path_btn)
+        row3.addSpacing(15)
+        row3.addWidget(lbl_rate)
+        row3.addWidget(self.rate_spin)
         top_layout.addLayout(row3)
         
         main_layout.addWidget(top_container)
@@ -248,6 +280,19 @@ class MainWindow(QMainWindow):
         if folder:
             self.path_input.setText(folder)
 
+    def handle_rate_limit_changed(self, mbps: float):
+        self.queue_manager.set_global_rate_limit(mbps * 1024 * 1024)
+        self.status_label.setText(f"全域限速: {mbps:.1f} MB/s" if mbps > 0 else "全域限速: 不限速")
+
+    def update_memory_usage(self):
+        stats = self.queue_manager.memory_stats()
+        mb = 1024 * 1024
+        limit = f"{stats['limit'] / mb:.0f} MB" if stats['limit'] > 0 else "不限"
+        text = f"記憶體: {stats['used'] / mb:.1f} MB (峰值 {stats['peak'] / mb:.1f} MB / 上限 {limit})"
+        if stats['waiting']:
+            text += f" | {stats['waiting']} 個請求等待中"
+        self.mem_label.setText(text)
+
     # [UI FIX] 改良版文字動態調整
     def set_progress_text(self, p_bar: QProgressBar, text: str):
         """
@@ -361,7 +406,17 @@ class MainWindow(QMainWindow):
         config = {
             "download_path": save_path,
             "format": self.format_combo.currentText(),
-            "custom_name": name
+            "custom_name": name,
+            "variant_policy": UI_CONFIG.get("variant_policy", "max_bandwidth"),
+            "max_height": UI_CONFIG.get("max_height"),
+            "range_connections": UI_CONFIG.get("range_connections", 8),
+            "pipe_remux": UI_CONFIG.get("pipe_remux", True),
+            "hls_engine": UI_CONFIG.get("hls_engine", "auto"),
+            "hedge_requests": UI_CONFIG.get("hedge_requests", True),
+            "stall_min_kbps": UI_CONFIG.get("stall_min_kbps", 32),
+            "cdn_mirrors": UI_CONFIG.get("cdn_mirrors", {}),
+            "browser_hybrid": UI_CONFIG.get("browser_hybrid", True),
+            "rate_limit": UI_CONFIG.get("task_rate_limit_mbps", 0) * 1024 * 1024,
         }
         self.queue_manager.add_task(task_id, url, config)
         
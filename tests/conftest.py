@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+# tests/conftest.py
+# 讓測試可以直接 import src.logic.* (不需安裝套件)
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
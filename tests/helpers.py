@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+# tests/helpers.py
+# 測試用的 TS 片段產生器
+
+TS_PACKET_SIZE = 188
+
+
+def ts_packet(pid: int = 0x100, cc: int = 0, fill: int = 0) -> bytes:
+    """一個只有 payload 的 TS 封包 (adaptation_field_control = 01)"""
+    header = bytes([0x47, (pid >> 8) & 0x1F, pid & 0xFF, 0x10 | (cc & 0xF)])
+    return header + bytes([fill & 0xFF]) * (TS_PACKET_SIZE - 4)
+
+
+def ts_segment(packets: int = 8, pid: int = 0x100, start_cc: int = 0, fill: int = 0) -> bytes:
+    """Continuity Counter 連續遞增的 TS 片段"""
+    return b"".join(ts_packet(pid, start_cc + i, fill) for i in range(packets))
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# tests/test_key_store.py
+
+import threading
+
+import m3u8
+
+from src.logic.key_store import KeyStore, parse_iv, segment_key_plan, sequence_iv
+
+KEY_A = "https://cdn.test/keys/a.key"
+KEY_B = "https://cdn.test/keys/b.key"
+
+
+def load(body: str):
+    return m3u8.loads("#EXTM3U\n#EXT-X-TARGETDURATION:4\n" + body + "#EXT-X-ENDLIST\n",
+                      uri="https://cdn.test/v/index.m3u8")
+
+
+def test_parse_and_sequence_iv():
+    assert parse_iv("0x1") == bytes(15) + b"\x01"
+    assert parse_iv("0X000102030405060708090A0B0C0D0E0F") == bytes(range(16))
+    assert parse_iv(None) is None
+    assert sequence_iv(258) == bytes(14) + b"\x01\x02"
+
+
+def test_iv_falls_back_to_media_sequence():
+    plan = segment_key_plan(load(
+        "#EXT-X-MEDIA-SEQUENCE:100\n"
+        '#EXT-X-KEY:METHOD=AES-128,URI="../keys/a.key"\n'
+        "#EXTINF:4,\ns0.ts\n#EXTINF:4,\ns1.ts\n"
+    ))
+    assert plan == [(KEY_A, sequence_iv(100)), (KEY_A, sequence_iv(101))]
+
+
+def test_explicit_iv_and_key_rotation():
+    plan = segment_key_plan(load(
+        '#EXT-X-KEY:METHOD=AES-128,URI="../keys/a.key",IV=0x0000000000000000000000000000000A\n'
+        "#EXTINF:4,\ns0.ts\n"
+        '#EXT-X-KEY:METHOD=AES-128,URI="../keys/b.key"\n'
+        "#EXTINF:4,\ns1.ts\n"
+        "#EXT-X-KEY:METHOD=NONE\n"
+        "#EXTINF:4,\ns2.ts\n"
+    ))
+    assert plan[0] == (KEY_A, bytes(15) + b"\x0a")
+    assert plan[1] == (KEY_B, sequence_iv(1))
+    assert plan[2] == (None, None)
+
+
+def test_unencrypted_playlist():
+    assert segment_key_plan(load("#EXTINF:4,\ns0.ts\n")) == [(None, None)]
+
+
+def test_key_store_fetches_once_and_rejects_bad_keys():
+    store = KeyStore()
+    calls = []
+
+    def fetcher(uri):
+        calls.append(uri)
+        return b"k" * 16 if uri == KEY_A else b"<html>forbidden</html>"
+
+    assert store.get(KEY_A, fetcher) == b"k" * 16
+    assert store.get(KEY_A, fetcher) == b"k" * 16
+    assert store.get(KEY_B, fetcher) is None      # 長度不對：不回傳也不快取
+    assert store.peek(KEY_B) is None
+    assert calls == [KEY_A, KEY_B]
+    assert store.stats() == {"hits": 1, "misses": 2, "keys": 1}
+
+
+def test_key_store_single_flight():
+    store = KeyStore()
+    release = threading.Event()
+    calls = []
+
+    def fetcher(uri):
+        calls.append(uri)
+        release.wait(5)
+        return b"k" * 16
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.get(KEY_A, fetcher))) for _ in range(4)]
+    for t in threads: t.start()
+    release.set()
+    for t in threads: t.join(5)
+    assert calls == [KEY_A]
+    assert results == [b"k" * 16] * 4
+
+
+def test_key_store_lru_eviction():
+    store = KeyStore(max_keys=2)
+    store.put("a", b"1" * 16)
+    store.put("b", b"2" * 16)
+    store.peek("a")
+    store.get("a", lambda u: None)   # 命中會移到最新
+    store.put("c", b"3" * 16)
+    assert store.peek("b") is None
+    assert store.peek("a") and store.peek("c")
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# tests/test_resume_journal.py
+
+from src.logic.resume_journal import ResumeJournal, atomic_write, canonical_playlist_id, checksum
+
+
+def test_playlist_id_ignores_query_tokens():
+    a = canonical_playlist_id("https://cdn.test/v/index.m3u8?token=1", ["https://cdn.test/v/s0.ts?sig=x"])
+    b = canonical_playlist_id("https://cdn.test/v/index.m3u8?token=2", ["https://cdn.test/v/s0.ts?sig=y"])
+    c = canonical_playlist_id("https://cdn.test/v/index.m3u8", ["https://cdn.test/v/s1.ts"])
+    assert a == b
+    assert a != c
+
+
+def test_records_survive_reopen(tmp_path):
+    journal = ResumeJournal(str(tmp_path), "pid", total=3)
+    assert not journal.resumed
+    journal.record("m", 0, 10, checksum(b"0" * 10), "k1")
+    journal.record("s", 2, 5, checksum(b"2" * 5))
+    journal.close()
+
+    reopened = ResumeJournal(str(tmp_path), "pid", total=3)
+    assert reopened.resumed
+    assert reopened.get(0) == {"kind": "m", "i": 0, "len": 10, "crc": checksum(b"0" * 10), "key": "k1"}
+    assert reopened.get(2)["kind"] == "s"
+    assert reopened.get(1) is None
+    reopened.close()
+
+
+def test_header_mismatch_starts_fresh(tmp_path):
+    journal = ResumeJournal(str(tmp_path), "pid", total=3)
+    journal.record("m", 0, 10, 0)
+    journal.close()
+
+    other = ResumeJournal(str(tmp_path), "pid", total=4)
+    assert not other.resumed
+    assert other.entries == {}
+    other.close()
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    journal = ResumeJournal(str(tmp_path), "pid", total=3)
+    journal.record("m", 0, 10, 0)
+    journal.close()
+    with open(journal.path, "a", encoding="utf-8") as f:
+        f.write('{"kind":"m","i":1,"le')   # 當機時只寫了一半
+
+    reopened = ResumeJournal(str(tmp_path), "pid", total=3)
+    assert reopened.resumed
+    assert sorted(reopened.entries) == [0]
+    reopened.close()
+
+
+def test_atomic_write_replaces_file(tmp_path):
+    path = tmp_path / "out.bin"
+    atomic_write(str(path), b"first")
+    atomic_write(str(path), b"second")
+    assert path.read_bytes() == b"second"
+    assert not (tmp_path / "out.bin.part").exists()
+
+
+def test_appends_after_torn_tail_survive_reload(tmp_path):
+    journal = ResumeJournal(str(tmp_path), "pid", total=4)
+    journal.record("m", 0, 10, 0)
+    journal.close()
+    with open(journal.path, "a", encoding="utf-8") as f:
+        f.write('{"kind":"m","i":1,"le')
+
+    resumed = ResumeJournal(str(tmp_path), "pid", total=4)
+    resumed.record("m", 1, 10, 0)
+    resumed.record("m", 2, 10, 0)
+    resumed.close()
+
+    reloaded = ResumeJournal(str(tmp_path), "pid", total=4)
+    assert sorted(reloaded.entries) == [0, 1, 2]
+    reloaded.close()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# tests/test_segment_writer.py
+
+import os
+
+from src.logic.memory_budget import GLOBAL_MEMORY_BUDGET
+from src.logic.resume_journal import ResumeJournal
+from src.logic.segment_writer import OrderedSegmentWriter
+
+SEGMENTS = [bytes([i]) * (100 + i) for i in range(6)]
+
+
+def make_writer(tmp_path, total=len(SEGMENTS), **kwargs):
+    journal = ResumeJournal(str(tmp_path / "task"), "pid", total)
+    output = str(tmp_path / "merged.ts")
+    return OrderedSegmentWriter(output, total, spill_dir=str(tmp_path / "task"), journal=journal, **kwargs), output
+
+
+def test_out_of_order_puts_are_written_in_order(tmp_path):
+    writer, output = make_writer(tmp_path)
+    for idx in (3, 1, 5, 0, 4, 2):
+        writer.put(idx, SEGMENTS[idx])
+    assert writer.finish()
+    with open(output, "rb") as f:
+        assert f.read() == b"".join(SEGMENTS)
+    assert GLOBAL_MEMORY_BUDGET.stats()["used"] == 0
+
+
+def test_full_buffer_spills_to_disk(tmp_path):
+    writer, output = make_writer(tmp_path, max_buffer_bytes=150)
+    for idx in (5, 4, 3, 2, 1, 0):
+        writer.put(idx, SEGMENTS[idx])
+    assert writer.finish()
+    with open(output, "rb") as f:
+        assert f.read() == b"".join(SEGMENTS)
+    assert not [n for n in os.listdir(tmp_path / "task") if n.startswith("spill_")]
+
+
+def test_resume_keeps_written_prefix_and_valid_spills(tmp_path):
+    writer, output = make_writer(tmp_path, max_buffer_bytes=0)
+    writer.put(0, SEGMENTS[0])
+    writer.put(1, SEGMENTS[1])
+    writer.put(4, SEGMENTS[4])   # 溢寫 (緩衝上限 0)
+    writer.put(5, SEGMENTS[5])
+    writer.abort()
+    with open(output, "ab") as f:
+        f.write(b"garbage after crash")   # 合併檔比日誌長：續傳時截掉
+    with open(os.path.join(tmp_path, "task", "spill_00005.ts"), "wb") as f:
+        f.write(b"corrupt")               # CRC 不符：需要重抓
+
+    resumed, _ = make_writer(tmp_path)
+    assert resumed.resumed_count == 3
+    assert [i for i in range(6) if resumed.is_done(i)] == [0, 1, 4]
+    assert resumed.bytes_written == len(SEGMENTS[0]) + len(SEGMENTS[1])
+    for idx in (2, 3, 5):
+        resumed.put(idx, SEGMENTS[idx])
+    assert resumed.finish()
+    with open(output, "rb") as f:
+        assert f.read() == b"".join(SEGMENTS)
+
+
+def test_finish_with_gaps(tmp_path):
+    writer, output = make_writer(tmp_path)
+    for idx in (0, 2, 3):
+        writer.put(idx, SEGMENTS[idx])
+    writer.skip(1)
+    assert not writer.finish()
+    with open(output, "rb") as f:
+        assert f.read() == SEGMENTS[0] + SEGMENTS[2] + SEGMENTS[3]
+
+    forced, forced_output = make_writer(tmp_path / "forced")
+    forced.put(0, SEGMENTS[0])
+    forced.put(5, SEGMENTS[5])
+    assert forced.finish(allow_gaps=True)
+    with open(forced_output, "rb") as f:
+        assert f.read() == SEGMENTS[0] + SEGMENTS[5]
+
+
+def test_sink_receives_ordered_stream(tmp_path):
+    class Sink:
+        def __init__(self): self.chunks = []
+        def write(self, data): self.chunks.append(data)
+
+    writer, _ = make_writer(tmp_path)
+    writer.sink = Sink()
+    for idx in (2, 0, 1, 5, 3, 4):
+        writer.put(idx, SEGMENTS[idx])
+    writer.finish()
+    assert writer.sink.chunks == SEGMENTS
+
+
+def test_resume_drops_segments_written_with_another_key(tmp_path):
+    keys = ["k1"] * len(SEGMENTS)
+    writer, output = make_writer(tmp_path, max_buffer_bytes=0, key_ids=keys)
+    for idx in (0, 1, 2, 4):
+        writer.put(idx, SEGMENTS[idx], keys[idx])
+    writer.abort()
+
+    rotated = ["k1", "k2", "k2", "k2", "k2", "k2"]   # 重新簽發後第 1 段起換了金鑰
+    resumed, _ = make_writer(tmp_path, key_ids=rotated)
+    assert [i for i in range(6) if resumed.is_done(i)] == [0]
+    assert resumed.bytes_written == len(SEGMENTS[0])
+    for idx in range(1, 6):
+        resumed.put(idx, SEGMENTS[idx], rotated[idx])
+    assert resumed.finish()
+    with open(output, "rb") as f:
+        assert f.read() == b"".join(SEGMENTS)
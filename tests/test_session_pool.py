@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# tests/test_session_pool.py
+
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from src.logic import session_pool
+from src.logic.session_pool import PooledSession, SessionPool
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = (self.headers.get("Cookie") or "").encode()
+        self.send_response(200)
+        if self.path == "/login":
+            self.send_header("Set-Cookie", "sid=secret; Path=/")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = HTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(session_pool, "HAS_CURL_CFFI", False)
+    return SessionPool()
+
+
+def test_cookies_stay_with_the_task_that_received_them(pool, server):
+    first = PooledSession(pool)
+    first.get(f"{server}/login")
+    assert first.cookies == {"sid": "secret"}
+    assert first.get(f"{server}/echo").text == "sid=secret"
+
+    # 同一條執行緒、同一個共用 Session，下一個任務不會帶著上一個任務的 Cookie
+    second = PooledSession(pool)
+    assert second.get(f"{server}/echo").text == ""
+    assert not pool.thread_session().cookies
+
+
+def test_checkin_clears_the_cookie_jar(pool):
+    session = pool.thread_session()
+    session.cookies.set("sid", "secret")
+    pool._checkin(session)
+    assert pool._idle[-1] is session
+    assert not session.cookies
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# tests/test_ts_sanitizer.py
+
+from helpers import ts_segment
+from src.logic.ts_sanitizer import (
+    count_synced_packets, detect_disguise, find_sync_offset, is_synced, sanitize,
+)
+
+PNG_HEADER = b"\x89PNG\r\n\x1a\n" + b"\x00" * 92
+
+
+def test_plain_ts_is_untouched():
+    data = ts_segment(8)
+    result = sanitize(data)
+    assert result.data is data
+    assert (result.offset, result.stripped_packets, result.disguise) == (0, 0, None)
+
+
+def test_png_disguise_is_stripped():
+    payload = ts_segment(8)
+    result = sanitize(PNG_HEADER + payload)
+    assert result.disguise == "PNG"
+    assert result.data == payload
+    assert result.offset == len(PNG_HEADER)
+    assert result.stripped_packets == 1   # 100 bytes 無條件進位成 1 個封包
+
+
+def test_ciphertext_without_known_prefix_is_not_cut():
+    # 尚未解密的密文：沒有已知偽裝前綴，不可以自作主張去找 0x47
+    data = b"\x13\x37" * 50 + ts_segment(4)
+    result = sanitize(data)
+    assert result.data is data
+    assert result.disguise is None
+
+
+def test_disguise_without_sync_keeps_data():
+    data = PNG_HEADER + b"\x00" * 1000
+    result = sanitize(data)
+    assert result.disguise == "PNG"
+    assert result.data is data and result.stripped_packets == 0
+
+
+def test_detect_disguise_ignores_short_and_synced_data():
+    assert detect_disguise(b"\x89PNG") is None
+    assert detect_disguise(ts_segment(2)) is None
+    assert detect_disguise(b"\xFF\xD8\xFF" + b"\x00" * 300) == "JPEG"
+
+
+def test_sync_helpers():
+    data = b"\x00" * 37 + ts_segment(10)
+    assert find_sync_offset(data) == 37
+    assert is_synced(data, 37, 10)
+    assert not is_synced(data, 37, 11)
+    assert count_synced_packets(data, 37) == 10
+    assert find_sync_offset(b"\x00" * 500) == -1
+
+
+def test_count_synced_packets_large_segment():
+    # 超過 64 個封包時走 NumPy 路徑 (有安裝時)，結果要與純 Python 一致
+    data = bytearray(ts_segment(200))
+    data[188 * 5] = 0x00
+    data[188 * 150] = 0x00
+    assert count_synced_packets(bytes(data)) == 198